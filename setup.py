@@ -17,7 +17,8 @@ setup(
         "pillow>=8.0.0",
         "opencv-python>=4.5.0",
         "matplotlib>=3.4.0",
-        "imageio"
+        "imageio",
+        "imageio-ffmpeg",
     ],
     extras_require={
         "dev": [
@@ -32,6 +33,7 @@ setup(
     entry_points={
         "console_scripts": [
             "threedai-gui=threedai.gui.interface:main",
+            "threedai-batch=threedai.batch:main",
         ],
     },
 )
\ No newline at end of file
@@ -1,7 +1,12 @@
-from .gui.interface import main as start_gui
-
 __version__ = '0.1.0'
 
+def __getattr__(name):
+    # The GUI pulls in gradio, so it is only imported when asked for
+    if name == "start_gui":
+        from .gui.interface import main as start_gui
+        return start_gui
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def run(share_gui=False):
     """
     Run the GUI application
@@ -9,5 +14,7 @@ def run(share_gui=False):
     Args:
         share_gui: Whether to create a shareable link for the GUI
     """
+    from .gui.interface import main as start_gui
+
     # Start the GUI directly
     start_gui(share=share_gui)
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+MANIFEST_NAME = "results.jsonl"
+
+
+class _Artifacts:
+    """Fixed output directory with the same interface as a job store Job"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.artifacts = {}
+
+    def artifact_path(self, name, filename):
+        self.artifacts[name] = filename
+        return str(self.path / filename)
+
+
+def _output_names(paths, root):
+    # Outputs are named by the path relative to root without its extension;
+    # inputs that would share a name (a.jpg and a.png) keep their extension
+    relative = [Path(p).relative_to(root) for p in paths]
+    stems = [str(r.with_suffix("")) for r in relative]
+    counts = {}
+    for stem in stems:
+        counts[stem] = counts.get(stem, 0) + 1
+    return [(str(p), stem if counts[stem] == 1 else str(r))
+            for p, r, stem in zip(paths, relative, stems)]
+
+
+def check_output_names(inputs):
+    """
+    Make sure no two inputs of a batch write to the same output directory
+
+    Raises:
+        ValueError: Listing the inputs that share an output name
+    """
+    by_name = {}
+    for path, name in inputs:
+        by_name.setdefault(os.path.normcase(os.path.normpath(name)), []).append(path)
+    clashes = {name: paths for name, paths in by_name.items() if len(paths) > 1}
+    if clashes:
+        details = "; ".join(f"{name}: {', '.join(paths)}" for name, paths in clashes.items())
+        raise ValueError(f"Inputs would share an output directory: {details}")
+
+
+def collect_inputs(source):
+    """
+    List the input images of a batch
+
+    Args:
+        source: Directory (searched recursively) or manifest file. Manifests
+            are either plain text with one path per line or JSON lines with
+            an "image" field. Relative paths are resolved against the
+            manifest's directory.
+
+    Returns:
+        list: (image path, output name) tuples. The output name is the path
+            relative to the source without its extension, or with it when
+            two images differ only by extension.
+    """
+    source = Path(source)
+    if source.is_dir():
+        images = sorted(p for p in source.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return _output_names(images, source)
+
+    paths = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = Path(json.loads(line)["image"] if line.startswith("{") else line)
+            if not path.is_absolute():
+                path = source.parent / path
+            paths.append(path.resolve())
+    if not paths:
+        return []
+    # Manifest entries can come from different directories; name outputs by
+    # the path relative to their common parent
+    common = os.path.commonpath([str(p.parent) for p in paths])
+    return _output_names(paths, common)
+
+
+def load_completed(manifest_path):
+    """Inputs already processed successfully by a previous run"""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Truncated last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["input"])
+    return completed
+
+
+def _load_image(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.convert("RGB")
+
+
+def _convert(glb_path, stl_path, target_faces=None):
+    from threedai.utils.format_converter import glb_to_stl
+
+    return glb_to_stl(glb_path, stl_path, target_faces=target_faces)
+
+
+def run_batch(inputs, output_dir, model_choice, params=None, preprocess_workers=4,
+              postprocess_workers=2, convert_processes=0, prefetch=4, max_pending=4,
+              registry=None, log=print):
+    """
+    Generate 3D models for a list of images
+
+    Args:
+        inputs: (image path, output name) tuples from collect_inputs()
+        output_dir: Directory receiving one subdirectory per image and the
+            results manifest
+        model_choice: Backend name
+        params: Generation parameters (defaults to GENERATION_PARAMS)
+        preprocess_workers: Threads decoding images
+        postprocess_workers: Threads converting meshes
+        convert_processes: Use a process pool of this size for GLB->STL
+            conversion instead of the postprocessing threads (0 disables).
+            Only used for backends that don't hand over an in-memory mesh.
+        prefetch: Images decoded ahead of inference
+        max_pending: Images waiting for postprocessing before inference pauses
+        registry: Model registry (defaults to the process-wide one)
+        log: Function receiving progress lines
+
+    Returns:
+        dict: Summary with counts, elapsed time and throughput
+
+    Raises:
+        ValueError: If two inputs have the same output name
+    """
+    from threedai.ml.pipeline import GENERATION_PARAMS, run_backend, encode_video, export_formats
+    from threedai.ml.registry import get_registry
+
+    check_output_names(inputs)
+    params = params or GENERATION_PARAMS[model_choice]
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+
+    completed = load_completed(manifest_path)
+    todo = [(path, name) for path, name in inputs if path not in completed]
+    if len(todo) < len(inputs):
+        log(f"Resuming: {len(inputs) - len(todo)} of {len(inputs)} images already done")
+    if not todo:
+        return {"total": len(inputs), "processed": 0, "ok": 0, "failed": 0,
+                "seconds": 0.0, "images_per_minute": 0.0}
+
+    manifest_lock = threading.Lock()
+    stage_times = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+    counts = {"ok": 0, "failed": 0}
+    start = time.time()
+
+    manifest = open(manifest_path, "a")
+
+    def record(path, status, started, **fields):
+        entry = {"input": path, "status": status, "seconds": round(time.time() - started, 3)}
+        entry.update(fields)
+        with manifest_lock:
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+            counts[status if status == "ok" else "failed"] += 1
+            done = counts["ok"] + counts["failed"]
+            rate = done / (time.time() - start) * 60
+            log(f"[{done}/{len(todo)}] {path}: {status} ({entry['seconds']:.1f}s, {rate:.1f} images/min)")
+
+    def timed_load(path):
+        t0 = time.time()
+        image = _load_image(path)
+        with manifest_lock:
+            stage_times["preprocess"] += time.time() - t0
+        return image
+
+    def postprocess(path, started, video_path, glb_path, mesh, artifacts):
+        t0 = time.time()
+        try:
+            target_faces = params.get("target_faces")
+            if mesh is not None:
+                # Every format is written from the in-memory mesh
+                exported = export_formats(mesh, artifacts, target_faces)
+            else:
+                stl_path = artifacts.artifact_path("stl", "output.stl")
+                if convert_pool is not None:
+                    converted = convert_pool.submit(_convert, glb_path, stl_path, target_faces).result()
+                else:
+                    converted = _convert(glb_path, stl_path, target_faces)
+                if not converted:
+                    raise RuntimeError("GLB to STL conversion failed")
+                exported = {"stl": stl_path}
+            record(path, "ok", started, video=video_path, glb=glb_path, **exported)
+        except Exception as e:
+            record(path, "error", started, error=str(e))
+        finally:
+            with manifest_lock:
+                stage_times["postprocess"] += time.time() - t0
+
+    pre_pool = ThreadPoolExecutor(preprocess_workers, thread_name_prefix="threedai-preprocess")
+    post_pool = ThreadPoolExecutor(postprocess_workers, thread_name_prefix="threedai-postprocess")
+    convert_pool = ProcessPoolExecutor(convert_processes) if convert_processes else None
+    registry = registry or get_registry()
+    # Kept resident (not evicted for another backend) until the batch is done
+    model = registry.acquire(model_choice)
+    try:
+        pending_loads = deque()
+        pending_posts = deque()
+        queue = iter(todo)
+
+        def fill():
+            # Keep `prefetch` images decoding ahead of the model
+            while len(pending_loads) < prefetch:
+                item = next(queue, None)
+                if item is None:
+                    return
+                pending_loads.append((item, pre_pool.submit(timed_load, item[0])))
+
+        fill()
+        while pending_loads:
+            (path, name), future = pending_loads.popleft()
+            fill()
+            started = time.time()
+            try:
+                image = future.result()
+            except Exception as e:
+                record(path, "error", started, error=f"Could not read image: {e}")
+                continue
+
+            # Don't run ahead of the conversion pool
+            while len(pending_posts) >= max_pending:
+                pending_posts.popleft().result()
+
+            artifacts = _Artifacts(output_dir / name)
+            t0 = time.time()
+            try:
+                frames, glb_path, mesh = run_backend(model, model_choice, params, image, None, artifacts)
+                # Frames render on this thread (next to the model) while the
+                # video writer encodes them in the background
+                video_path = None
+                if frames is not None:
+                    video_path = encode_video(frames, artifacts.artifact_path("video", "output_video.mp4"))
+            except Exception as e:
+                record(path, "error", started, error=str(e))
+                continue
+            finally:
+                stage_times["inference"] += time.time() - t0
+            pending_posts.append(post_pool.submit(postprocess, path, started, video_path, glb_path, mesh,
+                                                  artifacts))
+
+        for future in pending_posts:
+            future.result()
+    finally:
+        pre_pool.shutdown(wait=True, cancel_futures=True)
+        post_pool.shutdown(wait=True)
+        if convert_pool is not None:
+            convert_pool.shutdown(wait=True)
+        manifest.close()
+        del model
+        registry.release(model_choice)
+
+    elapsed = time.time() - start
+    processed = counts["ok"] + counts["failed"]
+    summary = {
+        "total": len(inputs),
+        "processed": processed,
+        "ok": counts["ok"],
+        "failed": counts["failed"],
+        "seconds": round(elapsed, 2),
+        "images_per_minute": round(processed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "stage_seconds": {stage: round(t, 2) for stage, t in stage_times.items()},
+    }
+    return summary
+
+
+def main(argv=None):
+    from threedai.config import get_installed_model
+    from threedai.ml.pipeline import GENERATION_PARAMS
+    from threedai.ml.presets import preset_params
+
+    parser = argparse.ArgumentParser(
+        prog="threedai-batch",
+        description="Generate 3D models for a directory or manifest of images",
+    )
+    parser.add_argument("inputs", help="Directory of images or manifest file (one path per line or JSON lines)")
+    parser.add_argument("-o", "--output-dir", default="batch_outputs", help="Output directory")
+    parser.add_argument("-m", "--model", default=None, choices=["hunyuan", "trellis"],
+                        help="Backend to use (defaults to the installed model)")
+    parser.add_argument("--preprocess-workers", type=int, default=4, help="Threads decoding images")
+    parser.add_argument("--postprocess-workers", type=int, default=2,
+                        help="Threads converting meshes")
+    parser.add_argument("--convert-processes", type=int, default=0,
+                        help="Processes for GLB to STL conversion (0 converts on the postprocessing threads)")
+    parser.add_argument("--target-faces", type=int, default=None,
+                        help="Decimate STL outputs to at most this many triangles")
+    parser.add_argument("--preset", choices=["draft", "standard", "final"], default="standard",
+                        help="Quality preset (see threedai.ml.presets)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Images decoded ahead of inference")
+    parser.add_argument("--max-pending", type=int, default=4,
+                        help="Images waiting for postprocessing before inference pauses")
+    parser.add_argument("--trace", help="Write a Chrome trace of the pipeline stages to this file")
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print(f"No images found in {args.inputs}")
+        return 1
+    try:
+        check_output_names(inputs)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    model_choice = args.model or get_installed_model()
+    params = preset_params(model_choice, args.preset, GENERATION_PARAMS[model_choice])
+    if args.target_faces:
+        params["target_faces"] = args.target_faces
+    tracer = None
+    if args.trace:
+        from threedai.utils.tracing import get_tracer
+
+        tracer = get_tracer()
+        tracer.enabled = True
+    print(f"Processing {len(inputs)} images with {model_choice}")
+    summary = run_batch(
+        inputs,
+        args.output_dir,
+        model_choice,
+        params=params,
+        preprocess_workers=args.preprocess_workers,
+        postprocess_workers=args.postprocess_workers,
+        convert_processes=args.convert_processes,
+        prefetch=args.prefetch,
+        max_pending=args.max_pending,
+    )
+    print(f"Done: {summary['ok']} ok, {summary['failed']} failed in {summary['seconds']}s "
+          f"({summary['images_per_minute']} images/min)")
+    if summary.get("stage_seconds"):
+        print("Stage time: " + ", ".join(f"{k} {v}s" for k, v in summary["stage_seconds"].items()))
+    with open(Path(args.output_dir) / "summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    if tracer is not None:
+        tracer.export_chrome_trace(args.trace)
+        print(f"Trace written to {args.trace}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
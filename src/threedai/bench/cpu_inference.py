@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+
+def main(argv=None):
+    from threedai.ml.cpu_optim import CPU_MODES, configure_threads, evaluate_modes, image_inputs
+    from threedai.ml.model import Neural3DModel
+    from threedai.ml.weights import load_model
+
+    parser = argparse.ArgumentParser(
+        prog="python -m threedai.bench.cpu_inference",
+        description="Compare the accuracy and latency of the CPU inference modes of Neural3DModel",
+    )
+    parser.add_argument("--modes", nargs="+", choices=list(CPU_MODES), help="Modes to compare (default all)")
+    parser.add_argument("--model-path", help="Weights to load (random weights if omitted)")
+    parser.add_argument("--calibration-dir", help="Images to calibrate the int8 modes on (random noise if omitted)")
+    parser.add_argument("--validation-dir",
+                        help="Other images to measure the accuracy on (random noise if omitted)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Batch size for the latency measurement")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed runs per mode")
+    parser.add_argument("--threads", type=int, help="Intra-op threads")
+    parser.add_argument("--interop-threads", type=int, help="Inter-op threads")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Largest acceptable error relative to the fp32 output range")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    import torch
+
+    configure_threads(args.threads, args.interop_threads)
+    model = load_model(Neural3DModel, args.model_path) if args.model_path else Neural3DModel()
+
+    # Preprocessed like NeuralModel's inputs
+    calibration = image_inputs(args.calibration_dir) if args.calibration_dir else None
+    validation = image_inputs(args.validation_dir) if args.validation_dir else None
+    report = evaluate_modes(model, modes=args.modes, batch_size=args.batch_size,
+                            iterations=args.iterations, tolerance=args.tolerance,
+                            calibration=calibration, validation=validation)
+    print(f"{torch.get_num_threads()} threads, batch size {args.batch_size}")
+    print(f"{'mode':18s} {'mean ms':>9s} {'p90 ms':>9s} {'img/s':>8s} {'speedup':>8s} {'rel err':>9s}")
+    for name, result in report.items():
+        if "error" in result:
+            print(f"{name:18s} unavailable: {result['error']}")
+            continue
+        flag = "" if result["accurate"] else "  (above tolerance)"
+        print(f"{name:18s} {result['mean_ms']:9.2f} {result['p90_ms']:9.2f} {result['images_per_second']:8.1f} "
+              f"{result['speedup']:7.2f}x {result['relative_error']:9.2e}{flag}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from threedai.utils.synthetic import synthetic_mesh
+
+# Sizes of the synthetic inputs, per case. "quick" keeps a run under a minute.
+SIZES = {
+    "full": {
+        "mesh_faces": (10_000, 100_000, 1_000_000),
+        "image_sides": (256, 1024, 4096),
+        "video_sizes": ((320, 240), (640, 480), (1280, 720)),
+        "splat_counts": (100_000, 1_000_000),
+    },
+    "quick": {
+        "mesh_faces": (10_000, 100_000),
+        "image_sides": (256, 1024),
+        "video_sizes": ((320, 240),),
+        "splat_counts": (100_000,),
+    },
+}
+
+# Relative slowdown of a case's best time that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+def synthetic_image(side, seed=0):
+    """Noisy RGB gradient image of side x side pixels"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 255, side, dtype=np.float32)
+    pixels = np.stack([ramp[None, :].repeat(side, 0), ramp[:, None].repeat(side, 1),
+                       rng.uniform(0, 255, (side, side)).astype(np.float32)], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def synthetic_video(path, size, frames=90, fps=30):
+    """Encode a short moving-gradient video"""
+    from threedai.utils.video import encode_frames
+
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+
+    def generate():
+        for i in range(frames):
+            shift = i * 255 / frames
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            frame[..., 0] = (x + shift) % 256
+            frame[..., 1] = (y + shift) % 256
+            frame[..., 2] = shift
+            yield frame
+
+    encode_frames(generate(), path, fps=fps)
+    return path
+
+
+def synthetic_gaussian_ply(path, count, seed=0):
+    """Write random Gaussians on a sphere as a Trellis-style splatting PLY"""
+    rng = np.random.default_rng(seed)
+    names = (["x", "y", "z", "nx", "ny", "nz", "f_dc_0", "f_dc_1", "f_dc_2", "opacity"]
+             + [f"scale_{i}" for i in range(3)] + [f"rot_{i}" for i in range(4)])
+    data = np.zeros(count, dtype=[(name, '<f4') for name in names])
+    positions = rng.normal(size=(count, 3))
+    positions /= np.linalg.norm(positions, axis=1, keepdims=True)
+    for i, name in enumerate("xyz"):
+        data[name] = positions[:, i]
+    for name in names[6:10]:
+        data[name] = rng.normal(size=count)
+    for name in names[10:13]:
+        data[name] = rng.uniform(-7, -3, count)
+    for name in names[13:]:
+        data[name] = rng.normal(size=count)
+    header = "\n".join(["ply", "format binary_little_endian 1.0", f"element vertex {count}"]
+                       + [f"property float {name}" for name in names] + ["end_header"]) + "\n"
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        data.tofile(f)
+    return path
+
+
+def measure(fn, repeat=3):
+    """
+    Time a function and record its peak traced memory
+
+    The timed runs are made with tracemalloc off, since tracing slows
+    allocation-heavy code down; the peak comes from one extra traced run.
+    tracemalloc sees Python and NumPy allocations but not memory allocated
+    by native libraries (ffmpeg, OpenCV, torch).
+
+    Returns:
+        dict: best and mean wall time in seconds and peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"best_seconds": min(times), "mean_seconds": sum(times) / len(times), "peak_bytes": peak}
+
+
+def _cases(sizes, workdir):
+    # (name, setup, run, work units, unit name); setup returns run's argument
+    from threedai.utils.format_converter import glb_to_stl, mesh_to_glb, mesh_to_stl
+
+    for count in sizes["mesh_faces"]:
+        def mesh(count=count):
+            return synthetic_mesh(count)
+
+        yield (f"mesh_to_stl[{count}]", mesh,
+               lambda m: mesh_to_stl(m[0], m[1], os.path.join(workdir, "out.stl")), count, "faces")
+
+        def glb(count=count):
+            path = os.path.join(workdir, f"mesh_{count}.glb")
+            mesh_to_glb(*synthetic_mesh(count), path)
+            return path
+
+        yield (f"glb_to_stl[{count}]", glb,
+               lambda path: glb_to_stl(path, os.path.join(workdir, "out.stl")), count, "faces")
+
+    for size in sizes["video_sizes"]:
+        from threedai.utils.visualization import create_thumbnail
+
+        def video(size=size):
+            return synthetic_video(os.path.join(workdir, f"video_{size[0]}x{size[1]}.mp4"), size)
+
+        yield (f"create_thumbnail[{size[0]}x{size[1]}]", video,
+               lambda path: create_thumbnail(path, os.path.join(workdir, "thumb.png")),
+               size[0] * size[1], "pixels")
+
+    from threedai.utils.splat import SplatFile, read_gaussian_ply, write_splat
+
+    # Loading a job's Gaussians for preview: from the PLY, or from the
+    # quantized container all at once or chunk by chunk
+    for count in sizes["splat_counts"]:
+        def ply(count=count):
+            return synthetic_gaussian_ply(os.path.join(workdir, f"gaussians_{count}.ply"), count)
+
+        def splat(count=count):
+            path = os.path.join(workdir, f"gaussians_{count}.splat")
+            write_splat(path, read_gaussian_ply(ply(count)))
+            return path
+
+        def read_chunks(path):
+            with SplatFile(path) as splats:
+                for _ in splats.iter_chunks():
+                    pass
+
+        def read_all(path):
+            with SplatFile(path) as splats:
+                splats.read()
+
+        yield f"read_gaussian_ply[{count}]", ply, read_gaussian_ply, count, "splats"
+        yield f"splat_read[{count}]", splat, read_all, count, "splats"
+        yield f"splat_iter_chunks[{count}]", splat, read_chunks, count, "splats"
+
+    from threedai.ml.model import NeuralModel
+
+    model = NeuralModel(results_dir=os.path.join(workdir, "results"))
+    try:
+        for side in sizes["image_sides"]:
+            yield (f"preprocess_image[{side}]", lambda side=side: synthetic_image(side),
+                   model._preprocess_image, side * side, "pixels")
+
+        yield ("generate_video[640x480x150]", lambda: os.path.join(workdir, "generated.mp4"),
+               lambda path: model._generate_video(None, path), 150, "frames")
+    finally:
+        model.close()
+
+
+def run(mode="full", repeat=3, only=None, log=print):
+    """
+    Run the benchmark suite on synthetic inputs
+
+    Args:
+        mode: "full" or "quick" (see SIZES)
+        repeat: Timed runs per case; the best time is used for comparisons
+        only: Substring filter on case names
+        log: Function receiving one line per case
+
+    Returns:
+        dict: Machine metadata and results keyed by case name
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="threedai-bench-") as workdir:
+        cases = _cases(SIZES[mode], workdir)
+        while True:
+            try:
+                name, setup, fn, units, unit = next(cases)
+            except StopIteration:
+                break
+            except ImportError as e:
+                # The remaining cases need a dependency that isn't installed
+                log(f"skipped remaining cases: {e}")
+                break
+            if only and only not in name:
+                continue
+            try:
+                argument = setup()
+                result = measure(lambda: fn(argument), repeat)
+            except ImportError as e:
+                log(f"{name:36s} skipped: {e}")
+                continue
+            result["throughput"] = units / result["best_seconds"]
+            result["unit"] = f"{unit}/s"
+            results[name] = result
+            log(f"{name:36s} {result['best_seconds'] * 1000:10.1f} ms  "
+                f"{result['throughput']:14,.0f} {result['unit']:9s} {result['peak_bytes'] / 2 ** 20:8.1f} MB")
+            del argument
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": mode,
+        "repeat": repeat,
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark runs
+
+    Args:
+        baseline, current: Outputs of run() (or the JSON files they were
+            saved to)
+        threshold: Relative slowdown of the best time treated as a regression
+
+    Returns:
+        tuple: (rows of (case, baseline seconds, current seconds, change),
+            list of regressed case names)
+    """
+    rows = []
+    regressions = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        change = new["best_seconds"] / old["best_seconds"] - 1
+        rows.append((name, old["best_seconds"], new["best_seconds"], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m threedai.bench.hotpaths",
+        description="Benchmark the mesh conversion, visualization and model hot paths on synthetic data",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the suite")
+    run_parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--quick", action="store_true", help="Smaller inputs")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    run_parser.add_argument("-k", "--only", help="Only run cases whose name contains this")
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Relative slowdown treated as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run("quick" if args.quick else "full", repeat=args.repeat, only=args.only)
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2))
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    rows, regressions = compare(baseline, current, args.threshold)
+    for name, old, new, change in rows:
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:36s} {old * 1000:10.1f} ms -> {new * 1000:10.1f} ms  {change:+7.1%}{flag}")
+    if baseline.get("machine") != current.get("machine"):
+        print("Note: the runs were made on different machines")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Optional dependencies that must only load when the feature using them runs
+HEAVY_MODULES = (
+    "gradio",
+    "torch",
+    "trimesh",
+    "cv2",
+    "matplotlib",
+    "imageio",
+    "hy3dgen",
+    "trellis",
+    "OCC",
+)
+
+# Modules that library users import without wanting the GUI or a backend
+LIGHT_MODULES = (
+    "threedai",
+    "threedai.config",
+    "threedai.batch",
+    "threedai.ml.registry",
+    "threedai.ml.pipeline",
+    "threedai.ml.hunyuan",
+    "threedai.ml.trellis",
+    "threedai.utils.format_converter",
+    "threedai.utils.glb",
+    "threedai.utils.visualization",
+)
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_import(module, repeat=5):
+    """
+    Time importing a module in fresh interpreters
+
+    Args:
+        module: Dotted module name
+        repeat: Number of interpreters to start; the fastest run is kept
+
+    Returns:
+        dict: seconds, max_rss_kb and the heavy modules that got imported
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or sample["seconds"] < best["seconds"]:
+            best = sample
+    return best
+
+
+def run(modules=LIGHT_MODULES, repeat=5, max_seconds=0.5):
+    """
+    Measure the import cost of each module and check it against the limits
+
+    Returns:
+        tuple: (results dict keyed by module, list of failure messages)
+    """
+    results = {}
+    failures = []
+    for module in modules:
+        sample = measure_import(module, repeat)
+        results[module] = sample
+        if sample["heavy"]:
+            failures.append(f"{module} imports {', '.join(sample['heavy'])}")
+        if sample["seconds"] > max_seconds:
+            failures.append(f"{module} took {sample['seconds']:.3f}s to import (limit {max_seconds}s)")
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m threedai.bench.startup",
+        description="Check that importing threedai stays fast and avoids optional dependencies",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="Import time limit per module")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    results, failures = run(repeat=args.repeat, max_seconds=args.max_seconds)
+    for module, sample in results.items():
+        print(f"{module:40s} {sample['seconds'] * 1000:8.1f} ms  {sample['max_rss_kb'] / 1024:7.1f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
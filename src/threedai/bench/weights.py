@@ -0,0 +1,187 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+
+# Ways of loading a checkpoint that are compared
+#   copy: the previous NeuralModel path, a randomly initialized module plus
+#         torch.load() and load_state_dict() into it
+#   mmap-pt: threedai.ml.weights.load_model on the torch.save checkpoint
+#   mmap-safetensors: the same on the safetensors copy
+METHODS = ("copy", "mmap-pt", "mmap-safetensors")
+
+# Layers of the synthetic model; their width is set by the checkpoint size
+LAYERS = 8
+
+# Runs in each measured process: loads the model, reads every weight once,
+# reports, then waits for the parent so all processes hold the weights at
+# the same time while their proportional set size is measured
+_PROBE = """
+import json, sys, time
+import torch
+from torch import nn
+from threedai.ml.weights import load_model
+
+def memory():
+    values = {{}}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return values
+
+factory = lambda: nn.Sequential(*[nn.Linear({width}, {width}) for _ in range({layers})])
+before = memory()
+start = time.perf_counter()
+if {method!r} == "copy":
+    model = factory()
+    model.load_state_dict(torch.load({path!r}, map_location="cpu", weights_only=True))
+else:
+    model = load_model(factory, {path!r})
+loaded = time.perf_counter()
+with torch.no_grad():
+    checksum = sum(float(p.sum()) for p in model.parameters())
+used = time.perf_counter()
+after = memory()
+print(json.dumps({{
+    "load_seconds": loaded - start,
+    "first_use_seconds": used - loaded,
+    "rss_mb": after["Rss"] - before["Rss"],
+    "anonymous_mb": after["Anonymous"] - before["Anonymous"],
+    "checksum": checksum,
+}}), flush=True)
+sys.stdin.readline()
+print(json.dumps({{"pss_mb": memory()["Pss"] - before["Pss"]}}), flush=True)
+"""
+
+
+def make_checkpoints(directory, megabytes, layers=LAYERS):
+    """
+    Write a synthetic checkpoint of roughly the given size in both formats
+
+    Returns:
+        tuple: (layer width, torch.save path, safetensors path)
+    """
+    import torch
+    from torch import nn
+
+    from threedai.ml.weights import write_safetensors
+
+    width = int(math.sqrt(megabytes * 2 ** 20 / (4 * layers)))
+    torch.manual_seed(0)
+    state_dict = nn.Sequential(*[nn.Linear(width, width) for _ in range(layers)]).state_dict()
+    pt_path = os.path.join(directory, f"weights_{megabytes}mb.pt")
+    safetensors_path = os.path.join(directory, f"weights_{megabytes}mb.safetensors")
+    torch.save(state_dict, pt_path)
+    write_safetensors(state_dict, safetensors_path)
+    return width, pt_path, safetensors_path
+
+
+def _evict(path):
+    # Drop the file from the page cache so the next load reads it from disk
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def measure(method, path, width, processes=2, layers=LAYERS, cold=False):
+    """
+    Load a checkpoint in several processes at once
+
+    Args:
+        method: Entry of METHODS
+        path: Checkpoint to load
+        width: Layer width of the checkpoint's model
+        processes: Processes holding the weights at the same time
+        layers: Layers of the checkpoint's model
+        cold: Evict the checkpoint from the page cache first
+
+    Returns:
+        dict: Mean load and first-use seconds and RSS/anonymous memory per
+            process, and the processes' total proportional set size
+    """
+    if cold:
+        _evict(path)
+    code = _PROBE.format(method=method, path=path, width=width, layers=layers)
+    workers = [subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                text=True) for _ in range(processes)]
+    try:
+        samples = []
+        for worker in workers:
+            line = worker.stdout.readline()
+            if not line:
+                raise RuntimeError(f"{method} probe failed with exit code {worker.wait()}")
+            samples.append(json.loads(line))
+        for worker in workers:
+            worker.stdin.write("\n")
+            worker.stdin.flush()
+        pss = sum(json.loads(worker.stdout.readline())["pss_mb"] for worker in workers)
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+    return {
+        "load_seconds": sum(s["load_seconds"] for s in samples) / len(samples),
+        "first_use_seconds": sum(s["first_use_seconds"] for s in samples) / len(samples),
+        "rss_mb": sum(s["rss_mb"] for s in samples) / len(samples),
+        "anonymous_mb": sum(s["anonymous_mb"] for s in samples) / len(samples),
+        "total_pss_mb": pss,
+    }
+
+
+def run(sizes=(64, 256, 512), methods=METHODS, processes=2, cold=False, directory=None):
+    """
+    Compare the loading methods on synthetic checkpoints of several sizes
+
+    Returns:
+        dict: Checkpoint size in MB -> method -> measure() results
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="threedai-weights-", dir=directory) as root:
+        for megabytes in sizes:
+            width, pt_path, safetensors_path = make_checkpoints(root, megabytes)
+            results[megabytes] = {}
+            for method in methods:
+                path = safetensors_path if method == "mmap-safetensors" else pt_path
+                results[megabytes][method] = measure(method, path, width, processes, cold=cold)
+            os.remove(pt_path)
+            os.remove(safetensors_path)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m threedai.bench.weights",
+        description="Compare load time and memory of copied and memory-mapped checkpoints",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 512], help="Checkpoint sizes in MB")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS), help="Loading methods")
+    parser.add_argument("--processes", type=int, default=2, help="Processes loading the checkpoint at once")
+    parser.add_argument("--cold", action="store_true", help="Evict the checkpoint from the page cache first")
+    parser.add_argument("--dir", help="Directory for the checkpoints (default: system temp)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.methods, args.processes, args.cold, args.dir)
+    print(f"{args.processes} processes per run{', cold page cache' if args.cold else ''}")
+    print(f"{'size':>7s} {'method':18s} {'load s':>8s} {'use s':>8s} {'RSS MB':>8s} {'anon MB':>8s} {'PSS MB':>8s}")
+    for megabytes, methods in results.items():
+        for method, result in methods.items():
+            print(f"{megabytes:5d}MB {method:18s} {result['load_seconds']:8.3f} {result['first_use_seconds']:8.3f} "
+                  f"{result['rss_mb']:8.1f} {result['anonymous_mb']:8.1f} {result['total_pss_mb']:8.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import configparser
+
+CONFIG_PATH = os.path.expanduser("~/.threedai/config.ini")
+
+
+# Determine which model is installed
+def get_installed_model():
+    config_path = CONFIG_PATH
+    if os.path.exists(config_path):
+        config = configparser.ConfigParser()
+        try:
+            # For simple key=value format without section headers
+            with open(config_path, 'r') as f:
+                config_string = '[DEFAULT]\n' + f.read()
+            config.read_string(config_string)
+            return config['DEFAULT'].get('model', 'hunyuan')
+        except Exception as e:
+            print(f"Error reading config: {e}")
+    return "hunyuan"  # Default if config doesn't exist or can't be read
@@ -1,90 +1,284 @@
 import os
+import time
+from contextlib import closing
+
 import gradio as gr
-import configparser
-import imageio
+
+from ..config import get_installed_model
+from ..ml.pipeline import GENERATION_PARAMS, output_settings
 
 # Initialize the integration
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "outputs")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Determine which model is installed
-def get_installed_model():
-    config_path = os.path.expanduser("~/.threedai/config.ini")
-    if os.path.exists(config_path):
-        config = configparser.ConfigParser()
-        try:
-            # For simple key=value format without section headers
-            with open(config_path, 'r') as f:
-                config_string = '[DEFAULT]\n' + f.read()
-            config.read_string(config_string)
-            return config['DEFAULT'].get('model', 'hunyuan')
-        except Exception as e:
-            print(f"Error reading config: {e}")
-    return "hunyuan"  # Default if config doesn't exist or can't be read
-
 # Get the installed model
 INSTALLED_MODEL = get_installed_model()
-def process_inputs(image_path, prompt, model_choice=INSTALLED_MODEL):
-    """Process inputs and generate 3D model"""
-    glb_path = None
-    print(f"Using {INSTALLED_MODEL}")
-    # Generate 3D model based on selected model
-    if model_choice == "trellis":
-        from PIL import Image
-        from trellis.pipelines import TrellisImageTo3DPipeline
-        from trellis.utils import render_utils, postprocessing_utils
-        from threedai.utils.format_converter import glb_to_stl
-        os.environ['ATTN_BACKEND'] = 'xformers'
-
-        # Load a pipeline from a model folder or a Hugging Face model hub.
-        pipeline = TrellisImageTo3DPipeline.from_pretrained("JeffreyXiang/TRELLIS-image-large")
-        pipeline.cuda()
-
-        # Load an image
-        print("image_path is ", image_path)
-        if isinstance(image_path, Image.Image):
-            image = image_path
-        else:
-            image = Image.open(image_path)
-        # Run the pipeline
-        outputs = pipeline.run(
-            image,
-            seed=1,
-        )
 
-        # Generate video output
-        video = render_utils.render_video(outputs['gaussian'][0])['color']
-        video_path = os.path.join(OUTPUT_DIR, "output_video.mp4")
-        imageio.mimsave(video_path, video, fps=30)
-
-        # Generate GLB model
-        glb = postprocessing_utils.to_glb(
-            outputs['gaussian'][0],
-            outputs['mesh'][0],
-            simplify=0.95,
-            texture_size=1024,
-        )
-        glb_path = os.path.join(OUTPUT_DIR, "output.glb")
-        glb.export(glb_path)
+# Result cache location and size cap (0 disables the cache)
+CACHE_DIR = os.environ.get("THREEDAI_CACHE_DIR", os.path.join(OUTPUT_DIR, "cache"))
+CACHE_GB = float(os.environ.get("THREEDAI_CACHE_GB", "10"))
+_result_cache = None
+
+# Per-request output directories, swept when expired or over quota
+JOB_DIR = os.path.join(OUTPUT_DIR, "jobs")
+JOB_TTL_HOURS = float(os.environ.get("THREEDAI_JOB_TTL_HOURS", "24"))
+JOB_QUOTA_GB = float(os.environ.get("THREEDAI_JOB_QUOTA_GB", "20"))
+_job_store = None
+
+# Admission control: running jobs per backend and queued jobs before rejecting
+MAX_CONCURRENT = int(os.environ.get("THREEDAI_MAX_CONCURRENT", "1"))
+MAX_QUEUE = int(os.environ.get("THREEDAI_MAX_QUEUE", "8"))
+_scheduler = None
+
+# Worker processes per backend (THREEDAI_WORKERS, 0 runs jobs in this process)
+_worker_pool = None
+
+def get_job_store():
+    """Return the shared job store, starting its sweeper on first use"""
+    global _job_store
+    if _job_store is None:
+        from threedai.utils.job_store import JobStore
+        _job_store = JobStore(JOB_DIR, ttl=JOB_TTL_HOURS * 3600,
+                              max_bytes=int(JOB_QUOTA_GB * 1024 ** 3) if JOB_QUOTA_GB > 0 else None)
+        _job_store.start_sweeper()
+    return _job_store
+
+def get_result_cache():
+    """Return the shared result cache, or None if caching is disabled"""
+    global _result_cache
+    if _result_cache is None and CACHE_GB > 0:
+        from threedai.utils.result_cache import ResultCache
+        _result_cache = ResultCache(CACHE_DIR, max_bytes=int(CACHE_GB * 1024 ** 3))
+    return _result_cache
+
+def get_scheduler():
+    """Return the shared generation scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        from threedai.serving.scheduler import Scheduler
+        _scheduler = Scheduler(max_concurrency=MAX_CONCURRENT, max_queue=MAX_QUEUE)
+    return _scheduler
+
+def get_worker_pool():
+    """Return the shared worker pool, or None when jobs run in-process"""
+    global _worker_pool
+    from threedai.serving.workers import TASK_TIMEOUT, WORKER_PROCESSES, WorkerPool
+    if _worker_pool is None and WORKER_PROCESSES > 0:
+        _worker_pool = WorkerPool(processes=WORKER_PROCESSES, task_timeout=TASK_TIMEOUT or None)
+    return _worker_pool
+
+def _preset_params(model_choice, preset):
+    from threedai.ml.presets import preset_params
+
+    # "auto" starts from the standard preset; the job picks the final values
+    return preset_params(model_choice, "standard" if preset == "auto" else preset,
+                         GENERATION_PARAMS[model_choice])
+
+def process_inputs(image_path, prompt, model_choice=INSTALLED_MODEL, target_faces=0, preset="standard",
+                   budget=0, progress=gr.Progress()):
+    """
+    Process inputs and generate 3D model
 
-        # Convert GLB to STL
-        stl_path = os.path.join(OUTPUT_DIR, "output.stl")
-        glb_to_stl(glb_path, stl_path)
+    target_faces caps the triangle count of the STL download (0 keeps all).
+    preset is a quality preset from threedai.ml.presets, or "auto" to pick
+    the parameters predicted to finish within budget seconds of the request
+    (including the time spent queued).
+    The request is queued on the scheduler and (video, model, status,
+    coarse preview, textured mesh) updates are yielded while it waits and
+    runs: a preview image of the first-stage shape as soon as it exists,
+    then the textured GLB, then the video and downloads. Closing the
+    generator (e.g. with the Cancel button) cancels the job.
+    """
+    from threedai.ml.presets import FEATURES
+    from threedai.serving.scheduler import QueueFullError
+    from threedai.utils.result_cache import cache_key
 
+    params = _preset_params(model_choice, preset)
+    if target_faces:
+        params["target_faces"] = int(target_faces)
+    deadline = time.time() + float(budget) if preset == "auto" and budget and model_choice in FEATURES else None
+
+    # Identical requests reuse the stored outputs. The prompt is left out of
+    # the key because neither backend conditions on it. Automatic presets
+    # depend on the load, so their results are not cached.
+    cache = get_result_cache()
+    key = None
+    if cache is not None and image_path is not None and deadline is None:
+        key = cache_key(image_path, model_choice, {**params, "settings": output_settings()})
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"Cache hit for {model_choice} request")
+            yield cached.get("video", ""), cached.get("stl"), "Loaded from cache", None, cached.get("glb")
+            return
+
+    scheduler = get_scheduler()
+    try:
+        job = scheduler.submit(model_choice, _run_job, model_choice, params, image_path, prompt, key, deadline)
+    except QueueFullError as e:
+        yield "", None, str(e), None, None
+        return
+
+    shown = {}
+    with closing(_follow_job(job, scheduler, progress)) as updates:
+        for status in updates:
+            # Intermediate results are sent once, as soon as they are published
+            previews = [gr.update(value=job.previews[kind]) if kind in job.previews and kind not in shown
+                        else gr.update() for kind in ("coarse", "mesh")]
+            shown.update(job.previews)
+            yield gr.update(), gr.update(), status, *previews
+
+    if job.status == "cancelled":
+        yield "", None, "Generation cancelled", gr.update(), gr.update()
+    elif job.status == "failed":
+        yield "", None, f"Generation failed: {job.error}", gr.update(), gr.update()
+    else:
+        video_path, stl_path = job.result
         # Return paths and status
-        return video_path, stl_path, "Generation completed successfully!"    
+        yield (video_path or "", stl_path, "Generation completed successfully!",
+               job.previews.get("coarse"), job.previews.get("mesh"))
+
+def _follow_job(job, scheduler, progress):
+    """
+    Yield a job's status text whenever it changes, until it finishes
+
+    Closing the generator before the job is done cancels the job.
+    """
+    try:
+        version = 0
+        while not job.done:
+            if job.status == "queued":
+                status = f"Queued (position {scheduler.position(job)})"
+            else:
+                status = job.message
+            progress(job.progress, desc=status)
+            yield status
+            version = job.wait_for_update(version, timeout=1.0)
+    finally:
+        if not job.done:
+            job.cancel()
+
+def process_variants(image_path, prompt, model_choice=INSTALLED_MODEL, count=4, preset="standard",
+                     progress=gr.Progress()):
+    """
+    Generate several candidate models for one image
+
+    The image is encoded once and the backend samples ``count`` seeds in
+    batches. Yields (gallery, files, status) updates; candidates appear in
+    the gallery as they are exported. Closing the generator cancels the job.
+    """
+    from threedai.serving.scheduler import QueueFullError
+
+    params = _preset_params(model_choice, preset)
+    first = params.get("seed", 0)
+    seeds = list(range(first, first + max(int(count), 1)))
+
+    scheduler = get_scheduler()
+    try:
+        job = scheduler.submit(model_choice, _run_variants_job, model_choice, params, image_path, prompt, seeds)
+    except QueueFullError as e:
+        yield gr.update(), gr.update(), str(e)
+        return
+
+    def gallery():
+        candidates = [job.previews[f"variant_{seed}"] for seed in seeds if f"variant_{seed}" in job.previews]
+        return ([(c["preview"], f"Seed {c['seed']}") for c in candidates], [c["glb"] for c in candidates])
+
+    shown = 0
+    with closing(_follow_job(job, scheduler, progress)) as updates:
+        for status in updates:
+            items, files = gallery()
+            if len(items) != shown:
+                shown = len(items)
+                yield items, files, status
+            else:
+                yield gr.update(), gr.update(), status
+
+    if job.status == "cancelled":
+        yield gr.update(), gr.update(), "Generation cancelled"
+    elif job.status == "failed":
+        yield gr.update(), gr.update(), f"Generation failed: {job.error}"
     else:
-        from ..ml.hunyuan import Hunyuan
-        from threedai.utils.format_converter import glb_to_step
-        hunyuan = Hunyuan()  # Initialize Hunyuan model
-        output = hunyuan(image_path, prompt, generate_texture=True)
-        glb_path = hunyuan.export(output, "glb", os.path.join(OUTPUT_DIR, "output.glb"))
-        stl_path = os.path.join(OUTPUT_DIR, "output.stl")
-        glb_to_stl(glb_path, stl_path)
-        return "", stl_path, "Generation completed successfully!"
-  
-    # Return paths to the generated files
-    return ""
+        items, files = gallery()
+        yield items, files, f"Generated {len(items)} variants"
+
+def _run_variants_job(job, model_choice, params, image_path, prompt, seeds):
+    """Scheduled body of a variants request"""
+    from threedai.ml.pipeline import generate_variants
+    from threedai.ml.registry import get_registry
+
+    pool = get_worker_pool()
+    jobs = get_job_store()
+    artifacts = jobs.create_job()
+    try:
+        if pool is None:
+            job.report("load", message=f"Loading {model_choice}")
+            with get_registry().use(model_choice) as model:
+                return generate_variants(model, model_choice, params, image_path, prompt, seeds, artifacts,
+                                         job.report, job.publish)
+        job.report("load", message=f"Waiting for a {model_choice} worker")
+        result = pool.submit(model_choice, "variants", report=job.report, preview=job.publish,
+                             params=params, image=image_path, prompt=prompt, seeds=seeds,
+                             job_dir=str(artifacts.path)).result()
+        artifacts.artifacts.update(result["artifacts"])
+        return result["candidates"]
+    finally:
+        jobs.finish_job(artifacts.id)
+
+def _run_job(job, model_choice, params, image_path, prompt, key, deadline=None):
+    """Scheduled body of a generation request"""
+    from threedai.ml.pipeline import finish_outputs, generate
+    from threedai.ml.presets import get_cost_model
+    from threedai.ml.registry import get_registry
+
+    print(f"Using {model_choice}")
+    cost_model = get_cost_model()
+    if deadline is not None:
+        # Fit whatever time is left after queueing
+        params, predicted = cost_model.choose(model_choice, deadline - time.time(), params)
+        print(f"Auto preset: {params} (predicted {predicted:.0f}s)")
+    pool = get_worker_pool()
+
+    # Each request writes into its own directory
+    jobs = get_job_store()
+    artifacts = jobs.create_job()
+    try:
+        if pool is None:
+            # Backends stay resident in the registry between requests
+            job.report("load", message=f"Loading {model_choice}")
+            with get_registry().use(model_choice) as model:
+                timings = {}
+                video_path, glb_path, stl_path = generate(model, model_choice, params, image_path, prompt,
+                                                          artifacts, job.report, job.publish, timings)
+        else:
+            # The worker holds the backend and renders the preview frames; they
+            # and the mesh arrays arrive as views onto shared memory, and are
+            # encoded and exported here
+            job.report("load", message=f"Waiting for a {model_choice} worker")
+            result = pool.submit(model_choice, "run_backend", report=job.report, preview=job.publish,
+                                 params=params, image=image_path, prompt=prompt,
+                                 job_dir=str(artifacts.path)).result()
+            release = result.pop("release")
+            try:
+                artifacts.artifacts.update(result["artifacts"])
+                glb_path, timings = result["glb"], result["timings"]
+                start = time.perf_counter()
+                video_path, stl_path = finish_outputs(result["frames"], glb_path, artifacts, job.report,
+                                                      target_faces=params.get("target_faces"),
+                                                      mesh=result["mesh"])
+                # Rendering happened in the worker, on the way to the encoder
+                timings["finish"] = timings.pop("render") + time.perf_counter() - start
+            finally:
+                del result
+                release()
+    finally:
+        jobs.finish_job(artifacts.id)
+    # Calibrates the automatic preset to this machine
+    cost_model.record(model_choice, params, timings)
+
+    cache = get_result_cache()
+    if key is not None and cache is not None:
+        cache.put(key, {"video": video_path, "glb": glb_path, "stl": stl_path})
+    return video_path, stl_path
 
 def get_css_path():
     try:
@@ -111,99 +305,203 @@ def load_css():
         return ""
 
 
-# Load CSS from file
-custom_css = load_css()
+def build_app():
+    """Build the Gradio app"""
+    # Load CSS from file
+    custom_css = load_css()
 
-with gr.Blocks(title="3D Generation", css=custom_css) as app:
-    with gr.Column(elem_classes="container"):
-        # Header
-        with gr.Column(elem_classes="header"):
-            gr.Markdown("# 3D Generation from Images and Text")
-            gr.Markdown("Transform your 2D images into detailed 3D models with AI")
+    with gr.Blocks(title="3D Generation", css=custom_css) as app:
+        with gr.Column(elem_classes="container"):
+            # Header
+            with gr.Column(elem_classes="header"):
+                gr.Markdown("# 3D Generation from Images and Text")
+                gr.Markdown("Transform your 2D images into detailed 3D models with AI")
         
-        # Main content
-        with gr.Row(elem_classes="content-row"):
-            # Input column
-            with gr.Column(elem_classes="content-column"):
-                with gr.Group():
-                    gr.Markdown("### Input")
-                    input_image = gr.Image(
-                        label="Upload Image", 
-                        type="pil",
-                        elem_id="input-image",
-                        height=300
-                    )
-                    
-                    # Changed Radio to Dropdown
-                    model_choice = gr.Dropdown(
-                        choices=["hunyuan", "trellis"],
-                        value="hunyuan",
-                        label="Select 3D Generation Model",
-                        info="Choose the AI model for 3D generation"
-                    )
+            # Main content
+            with gr.Row(elem_classes="content-row"):
+                # Input column
+                with gr.Column(elem_classes="content-column"):
+                    with gr.Group():
+                        gr.Markdown("### Input")
+                        input_image = gr.Image(
+                            label="Upload Image", 
+                            type="pil",
+                            elem_id="input-image",
+                            height=300
+                        )
                     
-                    text_prompt = gr.Textbox(
-                        label="Text Prompt (Optional)",
-                        placeholder="Describe additional details for the 3D model...",
-                        lines=3
-                    )
+                        # Changed Radio to Dropdown
+                        model_choice = gr.Dropdown(
+                            choices=["hunyuan", "trellis"],
+                            value="hunyuan",
+                            label="Select 3D Generation Model",
+                            info="Choose the AI model for 3D generation"
+                        )
                     
-                    generate_btn = gr.Button(
-                        "Generate 3D Model", 
-                        variant="primary",
-                        elem_classes="generate-btn"
-                    )
-            
-            # Output column
-            with gr.Column(elem_classes="content-column"):
-                with gr.Group(elem_classes="output-container"):
-                    gr.Markdown("### Output")
-                    with gr.Tab("3D Preview"):
-                        # Force the video output to a certain height for consistency
-                        video_output = gr.Video(
-                            label="3D Model Preview", 
-                            height=300
+                        text_prompt = gr.Textbox(
+                            label="Text Prompt (Optional)",
+                            placeholder="Describe additional details for the 3D model...",
+                            lines=3
                         )
-                    with gr.Tab("Download"):
-                        # File display usually doesn’t need much space, 
-                        # but giving it a height helps keep the tabs consistent
-                        model_output = gr.File(
-                            label="Download 3D Model (PLY)",
-                            file_count="single"
+
+                        with gr.Row():
+                            preset = gr.Dropdown(
+                                choices=["auto", "draft", "standard", "final"],
+                                value="standard",
+                                label="Quality",
+                                info="Draft is fastest; auto fits the time budget"
+                            )
+                            budget = gr.Number(
+                                value=120,
+                                precision=0,
+                                minimum=0,
+                                label="Time Budget (s)",
+                                info="Used by the auto quality setting"
+                            )
+
+                        target_faces = gr.Number(
+                            value=0,
+                            precision=0,
+                            minimum=0,
+                            label="Max STL Triangles",
+                            info="Simplify the STL download to this many triangles (0 keeps the full mesh)"
                         )
                     
-                    status_output = gr.Textbox(
-                        label="Status",
-                        placeholder="Generation status will appear here...",
-                        interactive=False
-                    )
+                        with gr.Row():
+                            generate_btn = gr.Button(
+                                "Generate 3D Model", 
+                                variant="primary",
+                                elem_classes="generate-btn"
+                            )
+                            cancel_btn = gr.Button("Cancel", variant="secondary")
+
+                        with gr.Row():
+                            variant_count = gr.Slider(
+                                minimum=2,
+                                maximum=8,
+                                value=4,
+                                step=1,
+                                label="Variants",
+                                info="Candidates sampled from the same image with different seeds"
+                            )
+                            variants_btn = gr.Button("Generate Variants", variant="secondary")
+            
+                # Output column
+                with gr.Column(elem_classes="content-column"):
+                    with gr.Group(elem_classes="output-container"):
+                        gr.Markdown("### Output")
+                        with gr.Tab("3D Preview"):
+                            # Filled in stages: a quick untextured preview, the
+                            # textured mesh, then the turntable video
+                            coarse_output = gr.Image(
+                                label="Quick Preview",
+                                type="filepath",
+                                interactive=False,
+                                height=300
+                            )
+                            mesh_output = gr.Model3D(
+                                label="Textured Model",
+                                height=300
+                            )
+                            # Force the video output to a certain height for consistency
+                            video_output = gr.Video(
+                                label="3D Model Preview", 
+                                height=300
+                            )
+                        with gr.Tab("Variants"):
+                            variant_gallery = gr.Gallery(
+                                label="Candidates",
+                                columns=4,
+                                height=300
+                            )
+                            variant_files = gr.File(
+                                label="Download Candidates (GLB)",
+                                file_count="multiple"
+                            )
+                        with gr.Tab("Download"):
+                            # File display usually doesn’t need much space, 
+                            # but giving it a height helps keep the tabs consistent
+                            model_output = gr.File(
+                                label="Download 3D Model (PLY)",
+                                file_count="single"
+                            )
+                    
+                        status_output = gr.Textbox(
+                            label="Status",
+                            placeholder="Generation status will appear here...",
+                            interactive=False
+                        )
         
-        # Examples section
-        with gr.Column():
-            gr.Markdown("### Examples")
-            example_images = [
-                ["data/example1.jpg", "A red chair with wooden legs"],
-                ["data/example2.jpg", "A modern desk lamp"],
-                ["data/example3.jpg", "A ceramic vase with floral pattern"]
-            ]
-            gr.Examples(
-                examples=example_images,
-                inputs=[input_image, text_prompt],
-            )
+            # Examples section
+            with gr.Column():
+                gr.Markdown("### Examples")
+                example_images = [
+                    ["data/example1.jpg", "A red chair with wooden legs"],
+                    ["data/example2.jpg", "A modern desk lamp"],
+                    ["data/example3.jpg", "A ceramic vase with floral pattern"]
+                ]
+                gr.Examples(
+                    examples=example_images,
+                    inputs=[input_image, text_prompt],
+                )
         
-        # Footer
-        with gr.Column(elem_classes="footer"):
-            gr.Markdown("Powered by ThreeDAI | [GitHub](https://github.com/int-smart/threedai)")
+            # Footer
+            with gr.Column(elem_classes="footer"):
+                gr.Markdown("Powered by ThreeDAI | [GitHub](https://github.com/int-smart/threedai)")
     
-    # Event handlers
-    generate_btn.click(
-        fn=process_inputs,
-        inputs=[input_image, text_prompt, model_choice],
-        outputs=[video_output, model_output, status_output]
-    )
-
-def main(share=True):
-    app.launch(share=share)
+        # Event handlers
+        # Admission control is done by the scheduler, so Gradio doesn't serialize clicks
+        generate_event = generate_btn.click(
+            fn=process_inputs,
+            inputs=[input_image, text_prompt, model_choice, target_faces, preset, budget],
+            outputs=[video_output, model_output, status_output, coarse_output, mesh_output],
+            concurrency_limit=None
+        )
+        variants_event = variants_btn.click(
+            fn=process_variants,
+            inputs=[input_image, text_prompt, model_choice, variant_count, preset],
+            outputs=[variant_gallery, variant_files, status_output],
+            concurrency_limit=None
+        )
+        cancel_btn.click(fn=None, cancels=[generate_event, variants_event])
+    return app
+
+_app = None
+
+def get_app():
+    """Return the Gradio app, building it on first use"""
+    global _app
+    if _app is None:
+        _app = build_app()
+    return _app
+
+def __getattr__(name):
+    # Keep `interface.app` working without building the UI at import time
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def main(share=True, preload=None):
+    """
+    Launch the GUI
+
+    Args:
+        share: Whether to create a shareable link for the GUI
+        preload: Backend names to load before serving requests. Defaults to
+            the comma-separated THREEDAI_PRELOAD environment variable.
+    """
+    from threedai.ml.registry import get_registry
+    from threedai.utils.tracing import setup_from_env
+
+    setup_from_env()
+    if preload is None:
+        preload = [name for name in os.environ.get("THREEDAI_PRELOAD", "").split(",") if name]
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.preload(preload)
+    else:
+        get_registry().preload(preload)
+    get_app().launch(share=share)
 
 if __name__ == "__main__":
     main()
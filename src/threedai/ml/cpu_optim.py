@@ -0,0 +1,285 @@
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Named CPU configurations for optimize_for_cpu(). "int8" is usually the
+# fastest; compare them on a node type with python -m threedai.bench.cpu_inference.
+CPU_MODES = {
+    "fp32": {},
+    "channels_last": {"channels_last": True},
+    "torchscript": {"channels_last": True, "compile": "torchscript"},
+    "compile": {"channels_last": True, "compile": "inductor"},
+    "int8": {"quantize": "static"},
+    "int8-torchscript": {"quantize": "static", "compile": "torchscript"},
+}
+
+# Image files picked up by image_inputs()
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+class _ChannelsLast(nn.Module):
+    """Feeds NHWC-strided inputs to a channels-last model"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def configure_threads(threads=None, interop_threads=None):
+    """
+    Set PyTorch's intra-op and inter-op thread pools
+
+    Args:
+        threads: Threads used inside an operator (e.g. a convolution).
+            Defaults to THREEDAI_CPU_THREADS, unchanged if unset.
+        interop_threads: Threads running independent operators in parallel.
+            Defaults to THREEDAI_CPU_INTEROP_THREADS, unchanged if unset.
+            PyTorch only accepts this before its first parallel operation.
+    """
+    threads = threads or int(os.environ.get("THREEDAI_CPU_THREADS", "0"))
+    interop_threads = interop_threads or int(os.environ.get("THREEDAI_CPU_INTEROP_THREADS", "0"))
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Warning: could not set inter-op threads: {e}")
+
+
+def example_inputs(batch_size=1, count=8, size=224, seed=0):
+    """Random inputs in [0, 1], the fallback for calibration and validation"""
+    generator = torch.Generator().manual_seed(seed)
+    return [torch.rand((batch_size, 3, size, size), generator=generator) for _ in range(count)]
+
+
+def image_inputs(directory, preprocess=None, limit=None):
+    """
+    Model inputs from a directory of representative images
+
+    Args:
+        directory: Folder of images (png, jpg, webp, bmp), read in name order
+        preprocess: Callable turning a PIL image into a (1, C, H, W) input
+            (defaults to threedai.ml.model.preprocess_image)
+        limit: Maximum number of images
+
+    Returns:
+        list: One input batch per image
+
+    Raises:
+        ValueError: If the directory has no images
+    """
+    from PIL import Image
+
+    if preprocess is None:
+        from .model import preprocess_image as preprocess
+
+    paths = sorted(path for path in os.listdir(directory) if path.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        raise ValueError(f"No images in {directory}")
+    inputs = []
+    for path in paths[:limit]:
+        with Image.open(os.path.join(directory, path)) as image:
+            inputs.append(preprocess(image).cpu())
+    return inputs
+
+
+def _noise_inputs(purpose, **kwds):
+    # Random images give activation ranges and errors unlike real inputs'
+    print(f"Warning: no {purpose} images given, using random noise; int8 ranges and "
+          f"accuracy measured on noise may not hold for real images")
+    return example_inputs(**kwds)
+
+
+def quantize_static(model, calibration):
+    """
+    Post-training static int8 quantization with FX graph mode
+
+    Observers are inserted, the calibration batches are run through the model
+    to record activation ranges, and conv/ReLU/pool layers are replaced with
+    quantized kernels (fbgemm/x86). The result takes and returns float
+    tensors.
+
+    Args:
+        model: fp32 model in eval mode
+        calibration: List of representative input batches
+
+    Returns:
+        torch.fx.GraphModule: Quantized model
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (calibration[0],))
+    with torch.inference_mode():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def optimize_for_cpu(model, quantize=None, channels_last=False, compile=None, calibration=None,
+                     threads=None, interop_threads=None, copy=True):
+    """
+    Build a CPU-optimized copy of a model for inference
+
+    Quantization, channels_last and TorchScript freezing convert the
+    weights, so the result has weights of its own even with copy=False:
+    they are no longer the pages of a memory-mapped checkpoint (see
+    threedai.ml.weights) and are not shared between processes.
+
+    Args:
+        model: fp32 model
+        quantize: "static" for int8 conv/ReLU/pool kernels, "dynamic" for
+            dynamically quantized Linear/LSTM layers (convolutions are not
+            supported by dynamic quantization and stay fp32), or None
+        channels_last: Use the NHWC memory format, which the oneDNN
+            convolutions are fastest with. Ignored with static quantization,
+            whose kernels pick their own layout.
+        compile: "torchscript" to trace and freeze the model, "inductor" for
+            torch.compile, or None for eager execution
+        calibration: Input batches for static quantization and tracing
+            (see image_inputs). Defaults to random noise, with a warning
+            when it is used for quantization.
+        threads, interop_threads: See configure_threads
+        copy: Leave the model untouched. False optimizes it in place, so
+            weights that are used unchanged (e.g. the "fp32" mode) stay the
+            original tensors.
+
+    Returns:
+        nn.Module: Optimized model taking the same inputs as the original
+    """
+    import copy as copy_module
+
+    configure_threads(threads, interop_threads)
+    if not calibration:
+        calibration = _noise_inputs("calibration") if quantize == "static" else example_inputs()
+    if copy:
+        model = copy_module.deepcopy(model)
+    model = model.cpu().eval()
+
+    if quantize == "static":
+        model = quantize_static(model, calibration)
+    elif quantize == "dynamic":
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+    elif quantize is not None:
+        raise ValueError(f"Unknown quantization: {quantize}")
+
+    if channels_last and quantize != "static":
+        model = _ChannelsLast(model.to(memory_format=torch.channels_last)).eval()
+
+    if compile == "torchscript":
+        with torch.inference_mode():
+            model = torch.jit.freeze(torch.jit.trace(model, calibration[0]))
+    elif compile == "inductor":
+        model = torch.compile(model)
+    elif compile is not None:
+        raise ValueError(f"Unknown compile mode: {compile}")
+    return model
+
+
+def check_accuracy(reference, candidate, inputs):
+    """
+    Compare a model's outputs with the fp32 reference
+
+    Returns:
+        dict: Maximum and mean absolute error, error relative to the
+            reference's output range, and the cosine similarity of the
+            flattened outputs
+    """
+    errors, scales, dots, norms_ref, norms_cand = [], [], 0.0, 0.0, 0.0
+    with torch.inference_mode():
+        for batch in inputs:
+            expected = reference(batch).float()
+            actual = candidate(batch).float()
+            diff = (expected - actual).abs()
+            errors.append((diff.max().item(), diff.mean().item()))
+            scales.append(expected.abs().max().item())
+            dots += (expected * actual).sum().item()
+            norms_ref += (expected * expected).sum().item()
+            norms_cand += (actual * actual).sum().item()
+    max_abs = max(e[0] for e in errors)
+    return {
+        "max_abs_error": max_abs,
+        "mean_abs_error": float(np.mean([e[1] for e in errors])),
+        "relative_error": max_abs / (max(scales) or 1.0),
+        "cosine_similarity": dots / (np.sqrt(norms_ref * norms_cand) or 1.0),
+    }
+
+
+def measure_latency(model, batch, warmup=3, iterations=20):
+    """
+    Time a model on one input batch
+
+    Returns:
+        dict: Mean, median and 90th percentile latency in milliseconds and
+            throughput in images per second
+    """
+    with torch.inference_mode():
+        for _ in range(warmup):
+            model(batch)
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            model(batch)
+            times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p90_ms": float(np.percentile(times, 90)),
+        "images_per_second": float(len(batch) * 1000 / times.mean()),
+    }
+
+
+def evaluate_modes(model, modes=None, batch_size=1, iterations=20, tolerance=0.05,
+                   calibration=None, validation=None):
+    """
+    Accuracy and latency of CPU configurations against the fp32 model
+
+    Args:
+        model: fp32 model
+        modes: Names from CPU_MODES (defaults to all)
+        batch_size: Batch size for the latency measurement
+        iterations: Timed runs per configuration
+        tolerance: Largest acceptable relative error
+        calibration: Input batches the int8 modes are calibrated on
+        validation: Input batches the accuracy is measured on, different
+            from the calibration ones (see image_inputs). Both default to
+            random noise, with a warning.
+
+    Returns:
+        dict: Per mode, the accuracy metrics, latency, speedup over fp32 and
+            whether the accuracy is within tolerance (or the error if the
+            mode is not available on this machine)
+    """
+    model = model.cpu().eval()
+    calibration = calibration or _noise_inputs("calibration")
+    validation = validation or _noise_inputs("validation", count=4, seed=1)
+    batch = example_inputs(batch_size=batch_size, count=1, seed=2)[0]
+
+    report = {}
+    baseline = None
+    for name in modes or CPU_MODES:
+        try:
+            candidate = optimize_for_cpu(model, calibration=calibration, **CPU_MODES[name])
+            result = check_accuracy(model, candidate, validation)
+            result.update(measure_latency(candidate, batch, iterations=iterations))
+        except Exception as e:
+            report[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        result["accurate"] = result["relative_error"] <= tolerance
+        if name == "fp32":
+            baseline = result["mean_ms"]
+        report[name] = result
+
+    baseline = baseline or measure_latency(model, batch, iterations=iterations)["mean_ms"]
+    for result in report.values():
+        if "mean_ms" in result:
+            result["speedup"] = baseline / result["mean_ms"]
+    return report
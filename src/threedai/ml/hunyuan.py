@@ -1,23 +1,70 @@
-from hy3dgen.texgen import Hunyuan3DPaintPipeline
-from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+from ..utils.tracing import span
+
 
 class Hunyuan:
     def __init__(self):
+        # hy3dgen is heavy, so it is only imported when the backend is loaded
+        from hy3dgen.texgen import Hunyuan3DPaintPipeline
+        from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+
         # Load a pipeline from a model folder or a Hugging Face model hub.
         self.flow_pipeline = Hunyuan3DDiTFlowMatchingPipeline.from_pretrained('tencent/Hunyuan3D-2')
         self.paint_pipeline = Hunyuan3DPaintPipeline.from_pretrained('tencent/Hunyuan3D-2')
 
-    def __call__(self, image_path, prompt, generate_texture, **kwds):
+    def __call__(self, image_path, prompt, generate_texture, on_preview=None, **kwds):
         # Run the pipeline
-        output = self.flow_pipeline(
-            image=image_path
-        )[0]
+        with span("shape"):
+            output = self.flow_pipeline(
+                image=image_path,
+                **kwds  # e.g. num_inference_steps, octree_resolution
+            )[0]
+
+        # The untextured shape is ready well before the texture
+        if on_preview is not None:
+            on_preview(output.vertices, output.faces)
 
         if generate_texture:
-            output = self.paint_pipeline(output, image=image_path)
+            with span("paint", faces=len(output.faces)):
+                output = self.paint_pipeline(output, image=image_path)
         print("Done with the pipeline")
         return output
 
+    def variants(self, image_path, prompt=None, seeds=(0,), generate_texture=True, batch_size=4, **kwds):
+        """
+        Sample several candidate shapes from one image
+
+        Each batch is one flow pipeline call with one generator per seed, so
+        the flow sampler and mesh extraction run on the whole batch while
+        every candidate keeps its own noise. The pipeline only takes images,
+        not a precomputed conditioning, so the image is passed once per
+        candidate and is preprocessed and encoded again for each of them
+        (in one batched encoder pass). Textures are painted per candidate.
+
+        Returns:
+            list: One mesh per seed
+        """
+        import torch
+
+        device = getattr(self.flow_pipeline, "device", "cpu")
+        meshes = []
+        seeds = list(seeds)
+        for start in range(0, len(seeds), batch_size):
+            group = seeds[start:start + batch_size]
+            with span("shape", variants=len(group)):
+                meshes += self.flow_pipeline(
+                    image=[image_path] * len(group),
+                    generator=[torch.Generator(device=device).manual_seed(seed) for seed in group],
+                    **kwds
+                )
+
+        if generate_texture:
+            for i, mesh in enumerate(meshes):
+                with span("paint", faces=len(mesh.faces)):
+                    meshes[i] = self.paint_pipeline(mesh, image=image_path)
+        return meshes
+
     def export(self, mesh, type, output_path):
         if type == "glb":
-            mesh.export(output_path)
\ No newline at end of file
+            with span("glb.export", faces=len(mesh.faces)):
+                mesh.export(output_path)
+        return output_path
\ No newline at end of file
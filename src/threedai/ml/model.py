@@ -3,9 +3,16 @@ import torch.nn as nn
 import os
 import numpy as np
 from PIL import Image
+import io
 import tempfile
 from pathlib import Path
 
+from ..serving.batcher import DynamicBatcher
+from ..utils.job_store import JobStore
+
+# Input size of Neural3DModel
+INPUT_SIZE = 224
+
 # This is a placeholder for your actual neural network architecture
 class Neural3DModel(nn.Module):
     def __init__(self):
@@ -30,85 +37,184 @@ class Neural3DModel(nn.Module):
         # This is a simplified placeholder
         return features
 
+def preprocess_image(image):
+    """Resize and scale a PIL image to a (1, 3, INPUT_SIZE, INPUT_SIZE) float32 CPU tensor"""
+    image_tensor = torch.empty((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=torch.float32)
+    NeuralModel._preprocess_into(image, image_tensor[0])
+    return image_tensor
+
+
 class NeuralModel:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, results_dir=None, ttl=24 * 3600, max_bytes=None,
+                 max_batch_size=8, max_wait=0.01, cpu_mode=None, calibration_dir=None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = Neural3DModel().to(self.device)
-        
         if model_path and os.path.exists(model_path):
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+            # Memory-mapped, so worker processes share the weights' pages
+            # (see threedai.ml.weights)
+            from .weights import load_model
+
+            self.model = load_model(Neural3DModel, model_path, self.device)
+        else:
+            self.model = Neural3DModel().to(self.device)
         
         self.model.eval()
-        
-        # Create temp directories for results
-        self.results_dir = Path(tempfile.gettempdir()) / "threedai_results"
-        self.results_dir.mkdir(exist_ok=True)
+
+        # Opt-in CPU performance mode (see threedai.ml.cpu_optim.CPU_MODES),
+        # int8 modes calibrated on the images in calibration_dir
+        self.cpu_mode = cpu_mode or os.environ.get("THREEDAI_CPU_MODE")
+        calibration_dir = calibration_dir or os.environ.get("THREEDAI_CPU_CALIBRATION_DIR")
+        if self.cpu_mode and self.device.type == "cpu":
+            from .cpu_optim import CPU_MODES, image_inputs, optimize_for_cpu
+
+            calibration = image_inputs(calibration_dir, self._preprocess_image) if calibration_dir else None
+            # In place: a copy would give every process private weights
+            self.model = optimize_for_cpu(self.model, copy=False, calibration=calibration,
+                                          **CPU_MODES[self.cpu_mode])
+        
+        # Per-process result directories, cleaned up by a background sweeper
+        self.results_dir = Path(results_dir or Path(tempfile.gettempdir()) / "threedai_results")
+        self.jobs = JobStore(self.results_dir, ttl=ttl, max_bytes=max_bytes)
+        self.jobs.start_sweeper()
+
+        # Concurrent requests are grouped into batches for the model. The
+        # input batch is allocated once and only used by the batcher thread.
+        self.max_batch_size = max_batch_size
+        self._input_batch = torch.empty((max_batch_size, 3, INPUT_SIZE, INPUT_SIZE), dtype=torch.float32,
+                                        pin_memory=self.device.type == "cuda")
+        # CUDA event marking the end of the last copy out of the input batch
+        self._input_copied = None
+        self.batcher = DynamicBatcher(self._infer_batch, max_batch_size=max_batch_size, max_wait=max_wait)
         
     def process_image(self, image_file, process_id):
         # Create directories for this process
-        process_dir = self.results_dir / process_id
-        process_dir.mkdir(exist_ok=True)
+        job = self.jobs.create_job(process_id)
         
-        # Save and load the image
-        image_path = process_dir / "input.jpg"
-        image_file.save(image_path)
-        
-        # Load and preprocess the image
-        image = Image.open(image_path).convert("RGB")
-        image_tensor = self._preprocess_image(image)
+        try:
+            # Keep a copy of the upload, but preprocess the image in memory
+            image = self._load_image(image_file)
+            image.save(job.artifact_path("input", "input.jpg"))
         
-        # Inference
-        with torch.no_grad():
-            features = self.model(image_tensor)
+            # Inference, batched with any concurrent requests
+            features = self.batcher.submit(image).result()
         
-        # Generate video from features
-        video_path = process_dir / "output.mp4"
-        self._generate_video(features, video_path)
+            video_path, model3d_path = self._write_outputs(job, features)
+        finally:
+            # The job becomes eligible for cleanup even if generation failed
+            self.jobs.finish_job(job.id)
+
+        return video_path, model3d_path
+
+    def process_images(self, images, process_ids=None):
+        """
+        Run many images through the model in batches
         
-        # Generate 3D model from features
-        model3d_path = process_dir / "model.step"
-        self._generate_3d_model(features, model3d_path)
+        Images are preprocessed in memory and go through the dynamic batcher,
+        so they are inferred in batches of up to max_batch_size together with
+        any concurrent process_image() calls.
         
-        return str(video_path), str(model3d_path)
+        Args:
+            images: PIL images, image paths or encoded image bytes
+            process_ids: Job ids, one per image (random ids if None)
+            
+        Returns:
+            list: (video path, 3D model path) per image
+        """
+        images = list(images)
+        process_ids = list(process_ids) if process_ids is not None else [None] * len(images)
+        if len(process_ids) != len(images):
+            raise ValueError("process_ids must have one entry per image")
+
+        jobs = [self.jobs.create_job(process_id) for process_id in process_ids]
+        try:
+            futures = [self.batcher.submit(self._load_image(image)) for image in images]
+            return [self._write_outputs(job, future.result()) for job, future in zip(jobs, futures)]
+        finally:
+            for job in jobs:
+                self.jobs.finish_job(job.id)
+
+    def close(self):
+        """Stop the batcher and the job sweeper"""
+        self.batcher.close()
+        self.jobs.stop_sweeper()
         
     def get_video_path(self, process_id):
-        return str(self.results_dir / process_id / "output.mp4")
+        return self.jobs.get_path(process_id, "video")
         
     def get_model3d_path(self, process_id):
-        return str(self.results_dir / process_id / "model.step")
+        return self.jobs.get_path(process_id, "model3d")
+        
+    @staticmethod
+    def _load_image(image):
+        if isinstance(image, Image.Image):
+            return image.convert("RGB")
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        with Image.open(image) as opened:
+            return opened.convert("RGB")
+
+    @staticmethod
+    def _preprocess_into(image, out):
+        # Resize and scale an image straight into a CHW float32 slot of the
+        # batch, without float64 temporaries
+        pixels = np.asarray(image.convert("RGB").resize((INPUT_SIZE, INPUT_SIZE)))
+        np.multiply(pixels.transpose(2, 0, 1), np.float32(1 / 255), out=out.numpy())
         
     def _preprocess_image(self, image):
         # Preprocess the image for the model
         # This is a simplified example
-        image = image.resize((224, 224))
-        image_np = np.array(image) / 255.0
-        image_tensor = torch.tensor(image_np, dtype=torch.float32).permute(2, 0, 1).unsqueeze(0)
-        return image_tensor.to(self.device)
+        return preprocess_image(image).to(self.device)
+
+    def _infer_batch(self, images):
+        # Called by the batcher with at most max_batch_size images
+        if self._input_copied is not None:
+            # The previous batch's asynchronous copy may still be reading
+            # the pinned buffer
+            self._input_copied.synchronize()
+        batch = self._input_batch[:len(images)]
+        for image, slot in zip(images, batch):
+            self._preprocess_into(image, slot)
+        inputs = batch.to(self.device, non_blocking=True)
+        if self.device.type == "cuda":
+            self._input_copied = torch.cuda.Event()
+            self._input_copied.record()
+        with torch.inference_mode():
+            features = self.model(inputs)
+        # One (1, C, H, W) result per image, like a batch of size 1
+        return list(features.split(1))
+
+    def _write_outputs(self, job, features):
+        # Generate video from features
+        video_path = job.artifact_path("video", "output.mp4")
+        self._generate_video(features, video_path)
+        
+        # Generate 3D model from features
+        model3d_path = job.artifact_path("model3d", "model.step")
+        self._generate_3d_model(features, model3d_path)
+        return video_path, model3d_path
         
     def _generate_video(self, features, output_path):
         # Placeholder for video generation logic
         # In a real implementation, you would convert features to frames and save as video
-        import cv2
-        import numpy as np
-        
+        from ..utils.video import encode_frames
+
         # Create a dummy video for demonstration
         width, height = 640, 480
         fps = 30
         seconds = 5
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        video = cv2.VideoWriter(str(output_path), fourcc, float(fps), (width, height))
-        
-        for i in range(fps * seconds):
-            # Create a gradient frame that changes over time (just as an example)
-            frame = np.zeros((height, width, 3), dtype=np.uint8)
-            frame[:, :, 0] = i % 255
-            frame[:, :, 1] = (i * 2) % 255
-            frame[:, :, 2] = (i * 3) % 255
-            
-            video.write(frame)
-            
-        video.release()
+
+        encode_frames(self._dummy_frames(width, height, fps * seconds), output_path,
+                      fps=fps, codec="mpeg4")
+
+    @staticmethod
+    def _dummy_frames(width, height, count):
+        # A solid frame whose colour changes over time (just as an example).
+        # All colours are computed at once and each frame is a broadcast view,
+        # so no per-frame buffers are filled in Python.
+        i = np.arange(count)
+        # RGB order of the BGR gradient the OpenCV writer used to produce
+        colors = np.stack([(i * 3) % 255, (i * 2) % 255, i % 255], axis=1).astype(np.uint8)
+        for color in colors:
+            yield np.broadcast_to(color, (height, width, 3))
         
     def _generate_3d_model(self, features, output_path):
         # Placeholder for 3D model generation logic
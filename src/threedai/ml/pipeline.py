@@ -0,0 +1,434 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from threedai.utils.tracing import span
+
+# Parameters that affect the generated outputs, per backend. They are part of
+# the result cache key, so anything added here invalidates old entries;
+# process-wide settings that change the outputs go in output_settings().
+# target_faces caps the triangle count of the STL download (None keeps all).
+# The sampler settings are the backends' defaults (the "standard" preset in
+# threedai.ml.presets).
+GENERATION_PARAMS = {
+    "trellis": {"seed": 1, "ss_steps": 25, "slat_steps": 25, "simplify": 0.95, "texture_size": 1024,
+                "target_faces": None},
+    "hunyuan": {"steps": 50, "octree_resolution": 384, "generate_texture": True, "target_faces": None},
+}
+
+
+# Turntable preview settings: render resolution and frame count, and the
+# encoder's fps, codec and output size (None keeps the rendered size)
+VIDEO_OPTIONS = {
+    "resolution": int(os.environ.get("THREEDAI_VIDEO_RESOLUTION", "512")),
+    "num_frames": int(os.environ.get("THREEDAI_VIDEO_FRAMES", "300")),
+    "fps": int(os.environ.get("THREEDAI_VIDEO_FPS", "30")),
+    "codec": os.environ.get("THREEDAI_VIDEO_CODEC", "libx264"),
+    "size": None,
+}
+
+
+# Mesh formats written next to the GLB, natively and in parallel from the
+# in-memory mesh. STL is always written (it is the GUI download).
+EXPORT_FORMATS = tuple(fmt for fmt in os.environ.get("THREEDAI_EXPORT_FORMATS", "stl,ply,obj").split(",") if fmt)
+
+# The STL download is welded and checked for holes before it is written.
+# Disconnected fragments with less than STL_MIN_FRAGMENT of the faces are
+# dropped (0 keeps them all).
+STL_REPAIR = os.environ.get("THREEDAI_STL_REPAIR", "1") != "0"
+STL_MIN_FRAGMENT = float(os.environ.get("THREEDAI_STL_MIN_FRAGMENT", "0"))
+
+# Textures of the exported GLBs are re-encoded in this format (see
+# threedai.utils.glb_textures; "none" keeps the backend's images) and
+# downscaled to max_size pixels on their longer side (0 keeps the size)
+TEXTURE_OPTIONS = {
+    "format": os.environ.get("THREEDAI_TEXTURE_FORMAT", "none"),
+    "quality": int(os.environ.get("THREEDAI_TEXTURE_QUALITY", "90")),
+    "max_size": int(os.environ.get("THREEDAI_TEXTURE_SIZE", "0")),
+}
+
+# Quantize and reorder the geometry of the exported GLBs
+# (KHR_mesh_quantization, see threedai.utils.glb_geometry)
+GLB_QUANTIZE = os.environ.get("THREEDAI_GLB_QUANTIZE", "0") == "1"
+
+
+def output_settings():
+    """
+    Process-wide settings that change the published outputs
+
+    They are part of the result cache key next to the generation parameters,
+    so outputs made under other settings are not served from the cache.
+
+    Returns:
+        dict: JSON-serializable settings
+    """
+    return {
+        "video": VIDEO_OPTIONS,
+        "export_formats": sorted(set(EXPORT_FORMATS)),
+        "stl_repair": STL_REPAIR,
+        "stl_min_fragment": STL_MIN_FRAGMENT,
+        "texture": TEXTURE_OPTIONS,
+        "glb_quantize": GLB_QUANTIZE,
+    }
+
+
+def _noop_report(stage, fraction=0.0, message=None):
+    pass
+
+
+def mesh_arrays(mesh):
+    """
+    Vertex, face and optional normal/UV arrays of a trimesh-like object
+
+    Returns:
+        dict: vertices, faces, normals and uvs (None when missing)
+    """
+    uvs = getattr(getattr(mesh, "visual", None), "uv", None)
+    normals = None
+    try:
+        normals = mesh.vertex_normals
+    except Exception:
+        pass
+    return {
+        "vertices": np.asarray(mesh.vertices),
+        "faces": np.asarray(mesh.faces),
+        "normals": None if normals is None else np.asarray(normals),
+        "uvs": None if uvs is None or len(uvs) != len(mesh.vertices) else np.asarray(uvs),
+    }
+
+
+def _noop_preview(kind, value):
+    pass
+
+
+@contextmanager
+def _timed(name, timings, **attributes):
+    # A span whose duration is also added to timings[name]
+    start = time.perf_counter()
+    with span(name, **attributes) as stage_span:
+        yield stage_span
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _sampler_kwargs(model_choice, params):
+    # Backend keyword arguments for the sampler settings in params
+    if model_choice == "trellis":
+        return {"sparse_structure_sampler_params": {"steps": params["ss_steps"]},
+                "slat_sampler_params": {"steps": params["slat_steps"]}}
+    # Settings missing from params are left to the backend's defaults
+    names = {"generate_texture": "generate_texture", "steps": "num_inference_steps",
+             "octree_resolution": "octree_resolution"}
+    return {keyword: params[name] for name, keyword in names.items() if name in params}
+
+
+def _compress_textures(glb_path, artifacts=None):
+    # Re-encode the GLB's textures in place; artifacts receives the report
+    from threedai.utils.glb_textures import compress_textures
+
+    if TEXTURE_OPTIONS["format"] in ("", "none"):
+        return None
+    with span("compress_textures", format=TEXTURE_OPTIONS["format"]) as texture_span:
+        report = compress_textures(glb_path, image_format=TEXTURE_OPTIONS["format"],
+                                   quality=TEXTURE_OPTIONS["quality"], max_size=TEXTURE_OPTIONS["max_size"])
+        texture_span.set(bytes=report["output_bytes"], saved=report["input_bytes"] - report["output_bytes"])
+    if artifacts is not None:
+        with open(artifacts.artifact_path("texture_report", "texture_report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def _compress_geometry(glb_path, artifacts=None):
+    # Quantize the GLB's meshes in place; artifacts receives the report
+    from threedai.utils.glb_geometry import compress_geometry
+
+    if not GLB_QUANTIZE:
+        return None
+    with span("compress_geometry") as geometry_span:
+        report = compress_geometry(glb_path)
+        geometry_span.set(bytes=report["output_bytes"], saved=report["input_bytes"] - report["output_bytes"])
+    if artifacts is not None:
+        with open(artifacts.artifact_path("geometry_report", "geometry_report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def _coarse_preview(artifacts, preview):
+    # Backend callback turning the first-stage mesh into a preview image
+    from threedai.utils.visualization import save_mesh_preview
+
+    def on_preview(vertices, faces):
+        with span("coarse_preview", faces=len(faces)):
+            path = save_mesh_preview(np.asarray(vertices), np.asarray(faces),
+                                     artifacts.artifact_path("preview", "preview.png"))
+        preview("coarse", path)
+
+    return on_preview
+
+
+def run_backend(model, model_choice, params, image, prompt, artifacts, report=None, preview=None, timings=None):
+    """
+    Run the GPU-bound part of a generation: sampling, preview rendering
+    and GLB export (with its textures re-encoded, see TEXTURE_OPTIONS, and
+    its geometry quantized with GLB_QUANTIZE)
+
+    Args:
+        model: Loaded backend (see threedai.ml.registry)
+        model_choice: Backend name
+        params: Generation parameters (see GENERATION_PARAMS)
+        image: PIL Image or path to the input image
+        prompt: Text prompt
+        artifacts: Job from threedai.utils.job_store receiving the outputs
+        report: Optional progress callback report(stage, fraction, message)
+        preview: Optional callback preview(kind, path) receiving results
+            before the generation finishes: "coarse" with a PNG of the
+            first-stage shape (Trellis sparse structure, untextured
+            Hunyuan mesh), then "mesh" with the textured GLB
+        timings: Optional dict receiving the seconds spent in the "sample"
+            and "export_glb" stages
+
+    Returns:
+        tuple: (preview frame iterator, path of the GLB file, mesh arrays
+            from mesh_arrays() for the other export formats). Frames are
+            rendered lazily as the iterator is consumed.
+    """
+    from threedai.utils.visualization import iter_preview_frames
+
+    report = report or _noop_report
+    # Backends only stop between stages when someone is watching
+    stages = {} if preview is None else {"on_preview": _coarse_preview(artifacts, preview)}
+    preview = preview or _noop_preview
+    # Generate 3D model based on selected model
+    if model_choice == "trellis":
+        # Run the pipeline
+        report("sample", message="Sampling")
+        with _timed("sample", timings, backend=model_choice):
+            outputs = model(image, prompt, seed=params["seed"], **_sampler_kwargs(model_choice, params), **stages)
+
+        # Preview frames are rendered while they are encoded
+        frames = model.iter_video_frames(outputs, resolution=VIDEO_OPTIONS["resolution"],
+                                         num_frames=VIDEO_OPTIONS["num_frames"])
+
+        # Generate GLB model
+        report("export", message="Exporting GLB")
+        with _timed("export_glb", timings, backend=model_choice) as export_span:
+            mesh = model.to_mesh(outputs, simplify=params["simplify"], texture_size=params["texture_size"])
+            glb_path = model.export(mesh, "glb", artifacts.artifact_path("glb", "output.glb"))
+            _compress_textures(glb_path, artifacts)
+            _compress_geometry(glb_path, artifacts)
+            export_span.set(bytes=os.path.getsize(glb_path))
+
+        # The Gaussians themselves, in the compact quantized container
+        model.export(outputs, "splat", artifacts.artifact_path("splat", "output.splat"))
+    else:
+        report("sample", message="Sampling")
+        with _timed("sample", timings, backend=model_choice):
+            mesh = model(image, prompt, **_sampler_kwargs(model_choice, params), **stages)
+        report("export", message="Exporting GLB")
+        with _timed("export_glb", timings, backend=model_choice) as export_span:
+            glb_path = model.export(mesh, "glb", artifacts.artifact_path("glb", "output.glb"))
+            _compress_textures(glb_path, artifacts)
+            _compress_geometry(glb_path, artifacts)
+            export_span.set(bytes=os.path.getsize(glb_path))
+
+        # Hunyuan has no renderer of its own; rasterize the exported mesh on the CPU
+        frames = iter_preview_frames(glb_path, num_frames=VIDEO_OPTIONS["num_frames"],
+                                     size=VIDEO_OPTIONS["resolution"])
+    preview("mesh", glb_path)
+    # The textured GLB comes from the backend; the other formats are written
+    # from these arrays without reading the GLB back
+    return frames, glb_path, mesh_arrays(mesh)
+
+
+def generate_variants(model, model_choice, params, image, prompt, seeds, artifacts, report=None, preview=None):
+    """
+    Sample several candidates for one image and export each with a preview
+
+    The backend encodes the image once and samples the seeds in batches
+    (see the backends' variants()); every candidate is then written as GLB
+    with a four-view preview image. Video and STL are left to a regular
+    generation of the chosen seed.
+
+    Args:
+        model, model_choice, params, image, prompt, artifacts: See run_backend
+        seeds: Seeds of the candidates
+        report: Optional progress callback report(stage, fraction, message)
+        preview: Optional callback preview(kind, value), called with
+            ("variant_<seed>", candidate dict) as each candidate is exported
+
+    Returns:
+        list: Per candidate a dict with its seed, GLB path and preview path
+    """
+    from threedai.utils.visualization import save_mesh_preview
+
+    report = report or _noop_report
+    preview = preview or _noop_preview
+    seeds = list(seeds)
+    report("sample", message=f"Sampling {len(seeds)} variants")
+    with span("sample_variants", backend=model_choice, variants=len(seeds)):
+        candidates = model.variants(image, prompt, seeds=seeds, **_sampler_kwargs(model_choice, params))
+
+    results = []
+    for i, (seed, candidate) in enumerate(zip(seeds, candidates)):
+        report("export", i / len(seeds), f"Exporting variant {i + 1} of {len(seeds)}")
+        with span("export_variant", backend=model_choice, seed=seed):
+            mesh = candidate
+            if model_choice == "trellis":
+                mesh = model.to_mesh(candidate, simplify=params["simplify"], texture_size=params["texture_size"])
+            glb_path = model.export(mesh, "glb", artifacts.artifact_path(f"variant_{seed}", f"variant_{seed}.glb"))
+            _compress_textures(glb_path)
+            _compress_geometry(glb_path)
+            arrays = mesh_arrays(mesh)
+            image_path = save_mesh_preview(arrays["vertices"], arrays["faces"],
+                                           artifacts.artifact_path(f"variant_{seed}_preview",
+                                                                   f"variant_{seed}.png"))
+        result = {"seed": seed, "glb": glb_path, "preview": image_path}
+        preview(f"variant_{seed}", result)
+        results.append(result)
+    return results
+
+
+def encode_video(frames, video_path, report=None):
+    """
+    Encode preview frames to a video file
+
+    Frames are consumed one at a time and encoded on a background thread
+    (see threedai.utils.video), so rendering and encoding overlap.
+
+    Args:
+        frames: Iterable of HxWx3 uint8 frames
+        video_path: Path of the video file
+        report: Optional progress callback report(stage, fraction, message)
+
+    Returns:
+        str: video_path
+    """
+    from threedai.utils.video import StreamingVideoWriter
+
+    report = report or _noop_report
+    total = VIDEO_OPTIONS["num_frames"]
+    report("render", message="Rendering preview")
+    # Frames are rendered lazily, so the span covers rendering and encoding
+    with span("render_video") as render_span:
+        with StreamingVideoWriter(video_path, fps=VIDEO_OPTIONS["fps"], size=VIDEO_OPTIONS["size"],
+                                  codec=VIDEO_OPTIONS["codec"]) as writer:
+            for i, frame in enumerate(frames):
+                writer.write(frame)
+                if i % 30 == 0:
+                    report("render", fraction=i / total, message="Rendering preview")
+        render_span.set(frames=writer.frame_count, bytes=os.path.getsize(video_path))
+    return video_path
+
+
+def export_formats(mesh, artifacts, target_faces=None, formats=None):
+    """
+    Write an in-memory mesh to the EXPORT_FORMATS in parallel
+
+    Args:
+        mesh: Arrays from mesh_arrays()
+        artifacts: Job from threedai.utils.job_store receiving the outputs
+        target_faces: Decimate the STL to at most this many faces
+        formats: Formats to write (defaults to EXPORT_FORMATS, plus STL)
+
+    Returns:
+        dict: Format -> path of the written file
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from threedai.utils.format_converter import _decimate, _prepare_for_print, export_mesh, mesh_to_stl
+
+    formats = [fmt for fmt in dict.fromkeys(("stl",) + tuple(formats or EXPORT_FORMATS)) if fmt != "glb"]
+    outputs = {fmt: artifacts.artifact_path(fmt, f"output.{fmt}") for fmt in formats}
+    full = dict(outputs)
+    if target_faces or STL_REPAIR:
+        # The STL download is repaired and decimated; the other formats keep
+        # the full mesh with its UV seams
+        full.pop("stl")
+
+    with span("export_meshes", faces=len(mesh["faces"]), formats=",".join(formats)) as export_span, \
+            ThreadPoolExecutor(max_workers=1) as pool:
+        others = pool.submit(export_mesh, mesh["vertices"], mesh["faces"], full,
+                             normals=mesh["normals"], uvs=mesh["uvs"])
+        if "stl" not in full:
+            vertices, faces = mesh["vertices"], mesh["faces"]
+            if STL_REPAIR:
+                vertices, faces, report = _prepare_for_print(vertices, faces, STL_MIN_FRAGMENT)
+                with open(artifacts.artifact_path("mesh_report", "mesh_report.json"), "w") as f:
+                    json.dump(report, f, indent=2)
+                export_span.set(watertight=report["watertight"], boundary_edges=report["boundary_edges"])
+            if target_faces:
+                vertices, faces = _decimate(vertices, faces, target_faces)
+            stl_written = mesh_to_stl(vertices, faces, outputs["stl"])
+        results = others.result()
+        if "stl" not in full:
+            results["stl"] = stl_written
+        failed = [fmt for fmt, ok in results.items() if not ok]
+        if failed:
+            raise RuntimeError(f"Could not export {', '.join(failed)}")
+        export_span.set(bytes=sum(os.path.getsize(path) for path in outputs.values()))
+    return outputs
+
+
+def finish_outputs(frames, glb_path, artifacts, report=None, target_faces=None, mesh=None):
+    """
+    Run the CPU-bound part of a generation: video encoding and mesh export
+
+    Args:
+        frames: Preview frames from run_backend() (or None)
+        glb_path: GLB file from run_backend()
+        artifacts: Job from threedai.utils.job_store receiving the outputs
+        report: Optional progress callback report(stage, fraction, message)
+        target_faces: Decimate the STL to at most this many faces
+        mesh: Mesh arrays from run_backend(). Without them only the STL is
+            written, converted from the GLB file.
+
+    Returns:
+        tuple: (video path or None, STL path)
+    """
+    from threedai.utils.format_converter import glb_to_stl
+
+    report = report or _noop_report
+    video_path = None
+    if frames is not None:
+        video_path = encode_video(frames, artifacts.artifact_path("video", "output_video.mp4"), report)
+
+    if mesh is not None:
+        report("convert", message="Exporting meshes")
+        return video_path, export_formats(mesh, artifacts, target_faces)["stl"]
+
+    # Convert GLB to STL
+    report("convert", message="Converting to STL")
+    stl_path = artifacts.artifact_path("stl", "output.stl")
+    with span("glb_to_stl", target_faces=target_faces) as convert_span:
+        if not glb_to_stl(glb_path, stl_path, target_faces=target_faces,
+                          repair=STL_REPAIR, min_fragment=STL_MIN_FRAGMENT):
+            raise RuntimeError(f"Could not convert {os.path.basename(glb_path)} to STL")
+        stl_bytes = os.path.getsize(stl_path)
+        # Binary STL: 84 byte header and 50 bytes per triangle
+        convert_span.set(bytes=stl_bytes, faces=(stl_bytes - 84) // 50)
+    return video_path, stl_path
+
+
+def generate(model, model_choice, params, image, prompt, artifacts, report=None, preview=None, timings=None):
+    """
+    Run a backend and write all of its outputs into the job directory
+
+    Intermediate results are passed to preview (see run_backend). timings
+    receives the seconds spent in the "sample", "export_glb" and "finish"
+    (video and mesh conversion) stages, as used by threedai.ml.presets.
+
+    Returns:
+        tuple: (video path or None, GLB path, STL path)
+    """
+    with span("generate", backend=model_choice):
+        frames, glb_path, mesh = run_backend(model, model_choice, params, image, prompt, artifacts, report,
+                                             preview, timings)
+        start = time.perf_counter()
+        video_path, stl_path = finish_outputs(frames, glb_path, artifacts, report,
+                                              target_faces=params.get("target_faces"), mesh=mesh)
+        if timings is not None:
+            timings["finish"] = time.perf_counter() - start
+    return video_path, glb_path, stl_path
@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Named quality presets per backend. "standard" matches the backends' own
+# defaults; draft and final trade quality for latency in either direction.
+PRESETS = {
+    "trellis": {
+        "draft": {"ss_steps": 8, "slat_steps": 8, "texture_size": 512, "simplify": 0.97},
+        "standard": {"ss_steps": 25, "slat_steps": 25, "texture_size": 1024, "simplify": 0.95},
+        "final": {"ss_steps": 50, "slat_steps": 50, "texture_size": 2048, "simplify": 0.9},
+    },
+    "hunyuan": {
+        "draft": {"steps": 20, "octree_resolution": 256, "generate_texture": False},
+        "standard": {"steps": 50, "octree_resolution": 384, "generate_texture": True},
+        "final": {"steps": 80, "octree_resolution": 512, "generate_texture": True},
+    },
+}
+
+# Values tried by the automatic mode, besides the presets themselves
+SEARCH_SPACE = {
+    "trellis": {
+        "ss_steps": (8, 12, 25, 50),
+        "slat_steps": (8, 12, 25, 50),
+        "texture_size": (512, 1024, 2048),
+        "simplify": (0.97, 0.95, 0.9),
+    },
+    "hunyuan": {
+        "steps": (20, 30, 50, 80),
+        "octree_resolution": (256, 384, 512),
+        "generate_texture": (False, True),
+    },
+}
+
+# Per backend and pipeline stage, the features whose linear combination
+# predicts the stage's duration. Stages are the timings recorded by
+# threedai.ml.pipeline.generate.
+FEATURES = {
+    "trellis": {
+        "sample": lambda p: [1.0, p["ss_steps"], p["slat_steps"]],
+        "export_glb": lambda p: [1.0, (p["texture_size"] / 1024) ** 2, (1 - p["simplify"]) / 0.05],
+        "finish": lambda p: [1.0, (1 - p["simplify"]) / 0.05],
+    },
+    "hunyuan": {
+        "sample": lambda p: [1.0, p["steps"], (p["octree_resolution"] / 384) ** 3, float(p["generate_texture"])],
+        "export_glb": lambda p: [1.0, (p["octree_resolution"] / 384) ** 2],
+        "finish": lambda p: [1.0, (p["octree_resolution"] / 384) ** 2],
+    },
+}
+
+# Rough coefficients (seconds) for a single modern GPU, used until enough
+# timings have been recorded on this machine. They follow FEATURES.
+PRIORS = {
+    "trellis": {
+        "sample": [2.0, 0.3, 0.4],
+        "export_glb": [5.0, 10.0, 2.0],
+        "finish": [10.0, 2.0],
+    },
+    "hunyuan": {
+        "sample": [2.0, 0.25, 8.0, 25.0],
+        "export_glb": [1.0, 0.5],
+        "finish": [8.0, 4.0],
+    },
+}
+
+# How strongly the fit is pulled towards the priors, in observations
+PRIOR_WEIGHT = 1.0
+
+# Recorded jobs kept per backend
+MAX_OBSERVATIONS = 200
+
+
+def preset_params(backend, preset, base=None):
+    """
+    Generation parameters for a named preset
+
+    Args:
+        backend: Backend name
+        preset: Name from PRESETS[backend]
+        base: Parameters to start from (e.g. GENERATION_PARAMS[backend])
+
+    Returns:
+        dict: base updated with the preset's values (base alone for
+            backends without presets)
+    """
+    if backend not in PRESETS:
+        return dict(base or {})
+    if preset not in PRESETS[backend]:
+        raise KeyError(f"Unknown {backend} preset: {preset}")
+    return {**(base or {}), **PRESETS[backend][preset]}
+
+
+def quality_score(backend, params):
+    """
+    Relative quality of a parameter set, used to rank candidates
+
+    Each parameter contributes its position in SEARCH_SPACE (0 for the
+    cheapest value, 1 for the most expensive), so every knob counts equally.
+    """
+    score = 0.0
+    for name, values in SEARCH_SPACE[backend].items():
+        ordered = sorted(values, key=lambda v: -v if name == "simplify" else v)
+        score += ordered.index(params[name]) / (len(ordered) - 1)
+    return score
+
+
+def _candidates(backend, base):
+    names = list(SEARCH_SPACE[backend])
+    grids = np.meshgrid(*[np.arange(len(SEARCH_SPACE[backend][n])) for n in names], indexing='ij')
+    for index in zip(*[g.reshape(-1) for g in grids]):
+        yield {**base, **{n: SEARCH_SPACE[backend][n][i] for n, i in zip(names, index)}}
+
+
+class CostModel:
+    """
+    Predicts the duration of a generation from its parameters
+
+    Every stage's duration is modelled as a linear combination of FEATURES.
+    The coefficients are fitted to the timings recorded with record() by
+    non-negative ridge regression towards PRIORS scaled to the machine's
+    overall speed, so predictions start from the priors and follow this
+    machine's measurements as they accumulate.
+    Observations are saved to a JSON file when a path is given.
+    """
+
+    def __init__(self, path=None, prior_weight=PRIOR_WEIGHT, max_observations=MAX_OBSERVATIONS):
+        """
+        Args:
+            path: JSON file keeping the observations across restarts
+            prior_weight: Weight of the priors, in observations
+            max_observations: Recorded jobs kept per backend
+        """
+        self.path = path
+        self.prior_weight = prior_weight
+        self.max_observations = max_observations
+        self._observations = {}
+        self._coefficients = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._observations = json.load(f)
+            except (OSError, ValueError) as e:
+                # Start over rather than fail every request after a bad write
+                print(f"Warning: ignoring unreadable cost model observations in {path}: {e}")
+
+    def record(self, backend, params, timings):
+        """
+        Add the measured stage durations of one job
+
+        Args:
+            backend: Backend name
+            params: Parameters the job ran with
+            timings: Stage name -> seconds (see threedai.ml.pipeline.generate)
+        """
+        if backend not in FEATURES:
+            return
+        stages = {stage: float(seconds) for stage, seconds in timings.items() if stage in FEATURES[backend]}
+        if not stages:
+            return
+        used = {name: params[name] for name in SEARCH_SPACE[backend]}
+        with self._lock:
+            observations = self._observations.setdefault(backend, [])
+            observations.append({"params": used, "timings": stages, "time": time.time()})
+            del observations[:-self.max_observations]
+            self._coefficients.pop(backend, None)
+            if self.path:
+                # Replaced atomically, so a crash mid-write keeps the old file
+                temporary = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary, "w") as f:
+                    json.dump(self._observations, f)
+                os.replace(temporary, self.path)
+
+    def observations(self, backend):
+        with self._lock:
+            return len(self._observations.get(backend, ()))
+
+    def coefficients(self, backend):
+        """Fitted coefficients per stage (the priors without observations)"""
+        with self._lock:
+            if backend not in self._coefficients:
+                self._coefficients[backend] = self._fit(backend, self._observations.get(backend, []))
+            return self._coefficients[backend]
+
+    def _fit(self, backend, observations):
+        fitted = {}
+        for stage, features in FEATURES[backend].items():
+            prior = np.asarray(PRIORS[backend][stage], dtype=np.float64)
+            rows = [(features(o["params"]), o["timings"][stage]) for o in observations if stage in o["timings"]]
+            if not rows:
+                fitted[stage] = prior
+                continue
+            x = np.asarray([r[0] for r in rows], dtype=np.float64)
+            y = np.asarray([r[1] for r in rows], dtype=np.float64)
+            # The priors are scaled to this machine's speed first, then every
+            # coefficient is pulled towards its scaled prior with the weight
+            # of prior_weight observations
+            guess = x @ prior
+            target = prior * (guess @ y / (guess @ guess) if guess @ guess > 0 else 1.0)
+            penalty = self.prior_weight * np.diag(np.mean(x ** 2, axis=0))
+            active = np.ones(len(prior), dtype=bool)
+            solution = np.zeros(len(prior))
+            while active.any():
+                # Coefficients that come out negative are fixed at zero
+                a = np.ix_(active, active)
+                solution[:] = 0
+                solution[active] = np.linalg.solve((x.T @ x + penalty)[a],
+                                                   (x.T @ y + penalty @ target)[active])
+                if (solution >= 0).all():
+                    break
+                active &= solution > 0
+            fitted[stage] = solution
+        return fitted
+
+    def predict(self, backend, params, stages=False):
+        """
+        Predicted duration of a generation in seconds
+
+        Args:
+            backend: Backend name
+            params: Generation parameters
+            stages: Return the per-stage predictions instead of the total
+
+        Returns:
+            float, or dict of stage -> seconds
+        """
+        coefficients = self.coefficients(backend)
+        predicted = {stage: float(np.dot(features(params), coefficients[stage]))
+                     for stage, features in FEATURES[backend].items()}
+        return predicted if stages else sum(predicted.values())
+
+    def choose(self, backend, budget, base=None):
+        """
+        Highest-quality parameters predicted to finish within a budget
+
+        Args:
+            backend: Backend name
+            budget: Seconds available for the generation
+            base: Parameters the choice is merged into
+
+        Returns:
+            tuple: (params, predicted seconds). Falls back to the fastest
+                candidate when nothing fits.
+        """
+        base = dict(base or {})
+        best, fastest = None, None
+        for params in _candidates(backend, base):
+            seconds = self.predict(backend, params)
+            quality = quality_score(backend, params)
+            if fastest is None or seconds < fastest[1]:
+                fastest = (params, seconds)
+            if seconds <= budget and (best is None or (quality, -seconds) > (best[2], -best[1])):
+                best = (params, seconds, quality)
+        return (best[0], best[1]) if best else fastest
+
+
+def calibrate(model, backend, image, cost_model, presets=("draft", "standard"), base=None, workdir=None):
+    """
+    Run presets once each and record their timings
+
+    Args:
+        model: Loaded backend
+        backend: Backend name
+        image: Input image
+        cost_model: CostModel receiving the timings
+        presets: Presets to run
+        base: Parameters the presets are applied to
+        workdir: Directory for the outputs (a temporary one by default)
+
+    Returns:
+        dict: Preset -> measured stage timings
+    """
+    import tempfile
+
+    from threedai.ml.pipeline import generate
+    from threedai.utils.job_store import JobStore
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="threedai-calibrate-", dir=workdir) as root:
+        store = JobStore(root)
+        for preset in presets:
+            params = preset_params(backend, preset, base)
+            timings = {}
+            generate(model, backend, params, image, None, store.create_job(), timings=timings)
+            cost_model.record(backend, params, timings)
+            results[preset] = timings
+    return results
+
+
+_cost_model = None
+_cost_model_lock = threading.Lock()
+
+
+def get_cost_model():
+    """
+    Return the process-wide cost model
+
+    Observations are kept in THREEDAI_COST_MODEL_FILE (default
+    outputs/cost_model.json).
+    """
+    global _cost_model
+    with _cost_model_lock:
+        if _cost_model is None:
+            path = os.environ.get("THREEDAI_COST_MODEL_FILE",
+                                  os.path.join(os.environ.get("OUTPUT_DIR", "outputs"), "cost_model.json"))
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _cost_model = CostModel(path)
+        return _cost_model
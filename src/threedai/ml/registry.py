@@ -0,0 +1,350 @@
+import gc
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ..utils.tracing import span
+
+
+def _load_trellis():
+    from .trellis import Trellis
+    return Trellis()
+
+
+def _load_hunyuan():
+    from .hunyuan import Hunyuan
+    return Hunyuan()
+
+
+# Backend name -> zero-argument callable returning a ready-to-use model
+DEFAULT_LOADERS = {
+    "trellis": _load_trellis,
+    "hunyuan": _load_hunyuan,
+}
+
+
+def estimate_model_memory(model, max_depth=3):
+    """
+    Estimate the number of bytes held by a loaded backend
+
+    Models can report their own size through a ``memory_footprint()`` method.
+    Otherwise the attributes of the model are walked (up to ``max_depth``
+    levels, including dicts/lists such as ``pipeline.models``) and the
+    parameters and buffers of every torch module found are summed.
+
+    Args:
+        model: The loaded backend object
+        max_depth: How deep to follow attributes looking for torch modules
+
+    Returns:
+        int: Estimated size in bytes (0 if nothing could be measured)
+    """
+    if hasattr(model, "memory_footprint"):
+        return int(model.memory_footprint())
+
+    # Don't pull torch in just to measure a stub
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return 0
+
+    seen = set()
+    total = 0
+
+    def visit(obj, depth):
+        nonlocal total
+        if id(obj) in seen or depth > max_depth:
+            return
+        seen.add(id(obj))
+        if isinstance(obj, torch.nn.Module):
+            for tensor in list(obj.parameters()) + list(obj.buffers()):
+                if id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    total += tensor.numel() * tensor.element_size()
+            return
+        if isinstance(obj, dict):
+            children = obj.values()
+        elif isinstance(obj, (list, tuple)):
+            children = obj
+        elif hasattr(obj, "__dict__"):
+            children = vars(obj).values()
+        else:
+            return
+        for child in children:
+            visit(child, depth + 1)
+
+    visit(model, 0)
+    return total
+
+
+def _free_accelerator_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelRegistry:
+    """
+    Process-wide pool of loaded backends
+
+    Each backend is loaded once on first use and kept resident. When a
+    memory budget is set, the least recently used backends are unloaded to
+    make room for new ones. Backends in use (see use()) are never unloaded:
+    a load that needs their memory waits until they are released, and a
+    budget that is still exceeded is enforced again on every release. A
+    backend in use is therefore never loaded a second time.
+    """
+
+    def __init__(self, memory_budget=None, loaders=None):
+        """
+        Args:
+            memory_budget: Maximum bytes of resident models (None for no limit)
+            loaders: Mapping of backend name to loader callable
+                (defaults to DEFAULT_LOADERS)
+        """
+        self.memory_budget = memory_budget
+        self._loaders = dict(DEFAULT_LOADERS if loaders is None else loaders)
+        self._sizes = {}
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        # Backend name -> idents of the threads using it (see acquire())
+        self._users = {}
+        self._waiting = set()
+        self._released = threading.Condition(self._lock)
+        # Backends unload() was called for while they were in use
+        self._unload_pending = set()
+
+    def register(self, name, loader, size=None):
+        """
+        Register (or replace) the loader for a backend
+
+        Args:
+            name: Backend name used with get()
+            loader: Zero-argument callable returning the loaded model
+            size: Known size in bytes, used for eviction before loading
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            if size is not None:
+                self._sizes[name] = size
+
+    def get(self, name):
+        """
+        Return the resident model for a backend, loading it if needed
+
+        The model may be unloaded to make room for another backend while
+        it is still being used; use() keeps it resident instead.
+
+        Args:
+            name: Backend name
+
+        Returns:
+            The loaded model
+        """
+        return self._get(name, hold=False)
+
+    def acquire(self, name):
+        """
+        Return the model for a backend and keep it resident until release()
+
+        Args:
+            name: Backend name
+
+        Returns:
+            The loaded model
+        """
+        return self._get(name, hold=True)
+
+    def release(self, name):
+        """
+        Give back a model returned by acquire()
+
+        Args:
+            name: Backend name
+        """
+        with self._lock:
+            users = self._users[name]
+            me = threading.get_ident()
+            users.remove(me if me in users else users[0])
+            if users:
+                return
+            del self._users[name]
+            if name in self._unload_pending:
+                self._unload_pending.discard(name)
+                entry = self._models.pop(name, None)
+                if entry is not None:
+                    self._unload(name, entry[0])
+            # Evictions deferred while the model was in use
+            self._evict(0)
+            self._released.notify_all()
+
+    @contextmanager
+    def use(self, name):
+        """
+        Context manager around acquire() and release()
+
+        Args:
+            name: Backend name
+
+        Yields:
+            The loaded model
+        """
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            del model
+            self.release(name)
+
+    def _hold(self, name, hold):
+        # Caller holds self._lock
+        self._models.move_to_end(name)
+        if hold:
+            self._users.setdefault(name, []).append(threading.get_ident())
+            self._unload_pending.discard(name)
+        return self._models[name][0]
+
+    def _get(self, name, hold):
+        with self._lock:
+            if name in self._models:
+                return self._hold(name, hold)
+            if name not in self._loaders:
+                raise KeyError(f"Unknown model backend: {name}")
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Only one thread loads a given backend; the others wait for it
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    return self._hold(name, hold)
+                # Make room up front when the size is known from a previous load
+                self._evict(self._sizes.get(name, 0), keep=name, wait=True)
+                loader = self._loaders[name]
+
+            print(f"Loading {name} model")
+            with span("load_model", backend=name) as load_span:
+                model = loader()
+                size = self._sizes.get(name) or estimate_model_memory(model)
+                load_span.set(model_bytes=size)
+
+            with self._lock:
+                self._sizes[name] = size
+                self._models[name] = (model, size)
+                model = self._hold(name, hold)
+                self._evict(0, keep=name)
+            return model
+
+    def preload(self, names):
+        """
+        Load several backends ahead of the first request
+
+        Args:
+            names: Iterable of backend names
+        """
+        for name in names:
+            self.get(name)
+
+    def unload(self, name):
+        """
+        Drop a resident backend and release its memory
+
+        A backend in use is dropped when it is released.
+
+        Args:
+            name: Backend name
+
+        Returns:
+            bool: True if the backend was resident
+        """
+        with self._lock:
+            if name in self._users:
+                self._unload_pending.add(name)
+                return True
+            entry = self._models.pop(name, None)
+        if entry is None:
+            return False
+        self._unload(name, entry[0])
+        return True
+
+    def unload_all(self):
+        """Drop every resident backend"""
+        for name in self.loaded():
+            self.unload(name)
+
+    def loaded(self):
+        """Names of the resident backends, least recently used first"""
+        with self._lock:
+            return list(self._models)
+
+    def memory_usage(self):
+        """Total estimated bytes of the resident backends"""
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def _evict(self, incoming, keep=None, wait=False):
+        # Caller holds self._lock. Backends in use are skipped; with wait set
+        # (before a load) this waits for them to be released, otherwise they
+        # are evicted once they are (see release()).
+        if self.memory_budget is None:
+            return
+        me = threading.get_ident()
+        announced = False
+        while self._models and self.memory_usage() + incoming > self.memory_budget:
+            candidates = [n for n in self._models if n != keep]
+            victim = next((n for n in candidates if n not in self._users), None)
+            if victim is not None:
+                model, _ = self._models.pop(victim)
+                self._unload(victim, model)
+                continue
+            if not candidates:
+                print(f"Warning: {keep} alone exceeds the model memory budget")
+                return
+            # Waiting is pointless for this thread's own backends, or if all
+            # their users are themselves waiting for a load
+            users = {user for n in candidates for user in self._users[n]}
+            if not wait or users <= self._waiting | {me}:
+                print(f"Warning: {', '.join(candidates)} in use, exceeding the model memory budget")
+                return
+            if not announced:
+                print(f"Waiting for {', '.join(candidates)} to be released before loading {keep}")
+                announced = True
+            self._waiting.add(me)
+            try:
+                self._released.wait()
+            finally:
+                self._waiting.discard(me)
+
+    def _unload(self, name, model):
+        print(f"Unloading {name} model")
+        if hasattr(model, "unload"):
+            model.unload()
+        del model
+        _free_accelerator_memory()
+
+
+def _budget_from_env():
+    value = os.environ.get("THREEDAI_MODEL_MEMORY_GB")
+    if not value:
+        return None
+    return int(float(value) * 1024 ** 3)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Return the process-wide model registry
+
+    The memory budget is read from the THREEDAI_MODEL_MEMORY_GB environment
+    variable the first time the registry is created.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(memory_budget=_budget_from_env())
+        return _registry
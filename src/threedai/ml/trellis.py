@@ -1,57 +1,227 @@
-# import imageio
-# from PIL import Image
-# from trellis.pipelines import TrellisImageTo3DPipeline
-# from trellis.utils import render_utils, postprocessing_utils
-
-
-# class Trellis:
-#     def __init__(self):
-#         # Load a pipeline from a model folder or a Hugging Face model hub.
-#         self.pipeline = TrellisImageTo3DPipeline.from_pretrained("JeffreyXiang/TRELLIS-image-large")
-
-#     def __call__(self, image_path, **kwds):
-#         self.pipeline.cuda()
-
-#         # Load an image
-#         image = Image.open(image_path)
-
-#         # Run the pipeline
-#         outputs = self.pipeline.run(
-#             image,
-#             seed=1,
-#             # Optional parameters
-#             # sparse_structure_sampler_params={
-#             #     "steps": 12,
-#             #     "cfg_strength": 7.5,
-#             # },
-#             # slat_sampler_params={
-#             #     "steps": 12,
-#             #     "cfg_strength": 3,
-#             # },
-#         )
-#         # outputs is a dictionary containing generated 3D assets in different formats:
-#         # - outputs['gaussian']: a list of 3D Gaussians
-#         # - outputs['radiance_field']: a list of radiance fields
-#         # - outputs['mesh']: a list of meshes
-
-#         # Render the outputs
-#         video = render_utils.render_video(outputs['gaussian'][0])['color']
-#         imageio.mimsave("sample_gs.mp4", video, fps=30)
-#         video = render_utils.render_video(outputs['radiance_field'][0])['color']
-#         imageio.mimsave("sample_rf.mp4", video, fps=30)
-#         video = render_utils.render_video(outputs['mesh'][0])['normal']
-#         imageio.mimsave("sample_mesh.mp4", video, fps=30)
-
-#         # GLB files can be extracted from the outputs
-#         glb = postprocessing_utils.to_glb(
-#             outputs['gaussian'][0],
-#             outputs['mesh'][0],
-#             # Optional parameters
-#             simplify=0.95,          # Ratio of triangles to remove in the simplification process
-#             texture_size=1024,      # Size of the texture used for the GLB
-#         )
-#         glb.export("sample.glb")
-
-#         # Save Gaussians as PLY files
-#         outputs['gaussian'][0].save_ply("sample.ply")
-#         return outputs
+import os
+
+import numpy as np
+from PIL import Image
+
+from ..utils.tracing import span
+
+
+class Trellis:
+    def __init__(self):
+        # trellis reads the attention backend when it is first imported
+        os.environ['ATTN_BACKEND'] = 'xformers'
+        from trellis.pipelines import TrellisImageTo3DPipeline
+
+        # Load a pipeline from a model folder or a Hugging Face model hub.
+        self.pipeline = TrellisImageTo3DPipeline.from_pretrained("JeffreyXiang/TRELLIS-image-large")
+        self.pipeline.cuda()
+
+    def __call__(self, image_path, prompt=None, seed=1, on_preview=None, **kwds):
+        # Load an image
+        if isinstance(image_path, Image.Image):
+            image = image_path
+        else:
+            image = Image.open(image_path)
+
+        # Run the pipeline
+        # Optional parameters:
+        # sparse_structure_sampler_params={"steps": 12, "cfg_strength": 7.5}
+        # slat_sampler_params={"steps": 12, "cfg_strength": 3}
+        #
+        # outputs is a dictionary containing generated 3D assets in different formats:
+        # - outputs['gaussian']: a list of 3D Gaussians
+        # - outputs['radiance_field']: a list of radiance fields
+        # - outputs['mesh']: a list of meshes
+        if on_preview is not None:
+            return self._run_staged(image, seed, on_preview, **kwds)
+        outputs = self.pipeline.run(
+            image,
+            seed=seed,
+            **kwds
+        )
+        return outputs
+
+    def _run_staged(self, image, seed, on_preview, sparse_structure_sampler_params=None,
+                    slat_sampler_params=None, formats=('gaussian', 'mesh'), preprocess_image=True):
+        """
+        pipeline.run() split at its stages, to show the sparse structure
+        before the structured latent is sampled
+
+        on_preview(vertices, faces) receives the occupied voxels as a mesh.
+        """
+        import torch
+
+        from ..utils.visualization import voxels_to_mesh
+
+        pipeline = self.pipeline
+        # pipeline.run() is decorated with no_grad; its stages are not
+        with torch.inference_mode():
+            if preprocess_image:
+                image = pipeline.preprocess_image(image)
+            cond = pipeline.get_cond([image])
+            torch.manual_seed(seed)
+            with span("sparse_structure"):
+                coords = pipeline.sample_sparse_structure(cond, 1, sparse_structure_sampler_params or {})
+
+            # Voxel indices are z-up; previews are y-up like the exported GLB
+            voxels = coords[:, 1:].cpu().numpy()
+            vertices, faces = voxels_to_mesh(voxels, resolution=64)
+            on_preview(vertices[:, [0, 2, 1]] * np.array([1, 1, -1], dtype=np.float32), faces)
+
+            with span("slat"):
+                slat = pipeline.sample_slat(cond, coords, slat_sampler_params or {})
+        return self._decode(slat, formats)
+
+    def _decode(self, slat, formats):
+        # Decoded outside inference mode (but without autograd): inference
+        # tensors can't be updated in place or saved for backward, which
+        # rendering and the texture baking in to_glb() may do
+        import torch
+
+        with torch.no_grad():
+            return self.pipeline.decode_slat(slat, list(formats))
+
+    def variants(self, image_path, prompt=None, seeds=(1,), batch_size=4, sparse_structure_sampler_params=None,
+                 slat_sampler_params=None, formats=('gaussian', 'mesh')):
+        """
+        Sample several candidates from one image
+
+        The image is preprocessed and encoded once, and the samplers run on
+        up to ``batch_size`` candidates at a time. Every candidate draws its
+        initial noise from its own generator seeded with its seed, the way a
+        single run with that seed draws it, so a candidate can be
+        regenerated on its own.
+
+        Returns:
+            list: One outputs dict (as returned by __call__) per seed
+        """
+        import torch
+
+        image = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
+        pipeline = self.pipeline
+        with span("condition"), torch.inference_mode():
+            cond = pipeline.get_cond([pipeline.preprocess_image(image)])
+
+        candidates = []
+        seeds = list(seeds)
+        for start in range(0, len(seeds), batch_size):
+            group = seeds[start:start + batch_size]
+            generators = [torch.Generator().manual_seed(seed) for seed in group]
+            with span("sample_batch", variants=len(group)):
+                coords = self._sample_sparse_structure(cond, generators, sparse_structure_sampler_params)
+                slat = self._sample_slat(cond, coords, generators, slat_sampler_params)
+                outputs = self._decode(slat, formats)
+            candidates += [{name: [values[i]] for name, values in outputs.items()} for i in range(len(group))]
+        return candidates
+
+    def _sample_sparse_structure(self, cond, generators, sampler_params=None):
+        # pipeline.sample_sparse_structure() with one noise generator per sample
+        import torch
+
+        pipeline = self.pipeline
+        flow_model = pipeline.models['sparse_structure_flow_model']
+        reso = flow_model.resolution
+        noise = torch.cat([torch.randn(1, flow_model.in_channels, reso, reso, reso, generator=generator)
+                           for generator in generators]).to(pipeline.device)
+        sampler_params = {**pipeline.sparse_structure_sampler_params, **(sampler_params or {})}
+        with torch.inference_mode():
+            z_s = pipeline.sparse_structure_sampler.sample(flow_model, noise, **cond, **sampler_params,
+                                                           verbose=True).samples
+            decoder = pipeline.models['sparse_structure_decoder']
+            return torch.argwhere(decoder(z_s) > 0)[:, [0, 2, 3, 4]].int()
+
+    def _sample_slat(self, cond, coords, generators, sampler_params=None):
+        # pipeline.sample_slat() with one noise generator per sample. The
+        # coordinates are sorted by sample, so each sample's voxels are a
+        # contiguous run of rows.
+        import torch
+        from trellis.modules import sparse as sp
+
+        pipeline = self.pipeline
+        flow_model = pipeline.models['slat_flow_model']
+        counts = torch.bincount(coords[:, 0].long(), minlength=len(generators)).tolist()
+        feats = torch.cat([torch.randn(count, flow_model.in_channels, generator=generator)
+                           for count, generator in zip(counts, generators)])
+        noise = sp.SparseTensor(feats=feats.to(pipeline.device), coords=coords)
+        sampler_params = {**pipeline.slat_sampler_params, **(sampler_params or {})}
+        with torch.inference_mode():
+            slat = pipeline.slat_sampler.sample(flow_model, noise, **cond, **sampler_params, verbose=True).samples
+            std = torch.tensor(pipeline.slat_normalization['std'])[None].to(slat.device)
+            mean = torch.tensor(pipeline.slat_normalization['mean'])[None].to(slat.device)
+            return slat * std + mean
+
+    def render_video(self, outputs):
+        from trellis.utils import render_utils
+
+        # Render a turntable of the gaussians
+        return render_utils.render_video(outputs['gaussian'][0])['color']
+
+    def iter_video_frames(self, outputs, resolution=512, num_frames=300, r=2, fov=40):
+        """
+        Render the same turntable as render_video() one frame at a time
+
+        Frames are yielded as they are rendered, so they can be encoded while
+        the next one renders instead of being collected in a list first.
+        """
+        import torch
+        from trellis.utils import render_utils
+
+        yaws = torch.linspace(0, 2 * 3.1415, num_frames)
+        pitch = 0.25 + 0.5 * torch.sin(torch.linspace(0, 2 * 3.1415, num_frames))
+        extrinsics, intrinsics = render_utils.yaw_pitch_r_fov_to_extrinsics_intrinsics(
+            yaws.tolist(), pitch.tolist(), r, fov)
+        options = {'resolution': resolution, 'bg_color': (0, 0, 0)}
+        for extrinsic, intrinsic in zip(extrinsics, intrinsics):
+            yield render_utils.render_frames(outputs['gaussian'][0], [extrinsic], [intrinsic],
+                                             options, verbose=False)['color'][0]
+
+    def to_mesh(self, outputs, simplify=0.95, texture_size=1024):
+        """Bake the outputs into a textured trimesh, as written to GLB files"""
+        from trellis.utils import postprocessing_utils
+
+        # GLB files can be extracted from the outputs
+        with span("to_glb", simplify=simplify, texture_size=texture_size):
+            return postprocessing_utils.to_glb(
+                outputs['gaussian'][0],
+                outputs['mesh'][0],
+                simplify=simplify,          # Ratio of triangles to remove in the simplification process
+                texture_size=texture_size,  # Size of the texture used for the GLB
+            )
+
+    def gaussian_arrays(self, outputs):
+        """
+        Activated Gaussian attributes as NumPy arrays, in the layout of
+        threedai.utils.splat.write_splat()
+        """
+        gaussian = outputs['gaussian'][0]
+
+        def numpy(tensor):
+            return tensor.detach().float().cpu().numpy()
+
+        return {
+            "positions": numpy(gaussian.get_xyz),
+            "scales": numpy(gaussian.get_scaling),
+            "rotations": numpy(gaussian.get_rotation),
+            "colors": numpy(gaussian._features_dc).reshape(-1, 3),
+            "opacities": numpy(gaussian.get_opacity).reshape(-1),
+        }
+
+    def export(self, outputs, type, output_path, simplify=0.95, texture_size=1024):
+        if type == "glb":
+            # Already baked meshes (from to_mesh) are exported as they are
+            glb = outputs if hasattr(outputs, "faces") else self.to_mesh(outputs, simplify, texture_size)
+            with span("glb.export", faces=len(glb.faces)):
+                glb.export(output_path)
+        elif type == "ply":
+            # Save Gaussians as PLY files
+            outputs['gaussian'][0].save_ply(output_path)
+        elif type == "splat":
+            # Quantized Gaussians, about a quarter of the PLY size
+            from ..utils.splat import write_splat
+
+            gaussians = self.gaussian_arrays(outputs)
+            with span("splat.export", splats=len(gaussians["positions"])):
+                write_splat(output_path, gaussians)
+        else:
+            raise ValueError(f"Unsupported export type: {type}")
+        return output_path
@@ -0,0 +1,173 @@
+import json
+import os
+import struct
+
+# Memory-map checkpoints instead of reading them into fresh memory, so
+# processes loading the same file share its pages through the page cache
+WEIGHTS_MMAP = os.environ.get("THREEDAI_WEIGHTS_MMAP", "1") != "0"
+
+# safetensors dtype names -> torch dtype attribute names
+SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+
+def read_safetensors(path, mmap=True):
+    """
+    Read a safetensors file into a state dict
+
+    The file is mapped copy-on-write with torch.UntypedStorage.from_file, and
+    every tensor is a view into the mapping: nothing is read until a page is
+    touched, and pages stay shared with other processes mapping the same
+    file until someone writes to them (the file itself is never modified).
+
+    Args:
+        path: Path of the .safetensors file
+        mmap: Map the file (False reads it into memory)
+
+    Returns:
+        dict: Tensor name -> CPU tensor
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+        if not mmap:
+            data = torch.frombuffer(bytearray(f.read()), dtype=torch.uint8)
+    header.pop("__metadata__", None)
+    start = 8 + header_length
+    if mmap:
+        storage = torch.UntypedStorage.from_file(str(path), shared=False, nbytes=os.path.getsize(path))
+        data = torch.empty(0, dtype=torch.uint8).set_(storage)[start:]
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        raw = data[begin:end]
+        if (start + begin) % dtype.itemsize:
+            # Misaligned tensors can't be viewed in place
+            raw = raw.clone()
+        tensors[name] = raw.view(dtype).reshape(info["shape"])
+    return tensors
+
+
+def write_safetensors(tensors, path, metadata=None):
+    """
+    Write a state dict as a safetensors file
+
+    Tensors are stored by decreasing element size behind a header padded to
+    8 bytes, so every tensor is aligned in the file and can be mapped by
+    read_safetensors without copying.
+
+    Args:
+        tensors: dict of name -> tensor
+        path: Path of the .safetensors file
+        metadata: Optional dict of strings stored in the header
+    """
+    import torch
+
+    names = {getattr(torch, name): code for code, name in SAFETENSORS_DTYPES.items()}
+    ordered = sorted(tensors.items(), key=lambda item: -item[1].element_size())
+    header = {"__metadata__": dict(metadata)} if metadata else {}
+    offset = 0
+    for name, tensor in ordered:
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": names[tensor.dtype], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + size]}
+        offset += size
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    encoded += b" " * (-(8 + len(encoded)) % 8)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        for _, tensor in ordered:
+            f.write(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().data)
+
+
+def load_checkpoint(path, mmap=WEIGHTS_MMAP):
+    """
+    Load a state dict from a .safetensors or torch.save checkpoint
+
+    torch.save checkpoints are loaded with torch.load(mmap=True), which maps
+    the tensor data like read_safetensors does. Legacy (non-zip) checkpoints
+    can't be mapped and are read into memory.
+
+    Args:
+        path: Checkpoint path
+        mmap: Memory-map the tensor data
+
+    Returns:
+        dict: State dict of CPU tensors
+    """
+    import torch
+
+    if str(path).endswith(".safetensors"):
+        return read_safetensors(path, mmap)
+    if mmap:
+        try:
+            return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except RuntimeError as e:
+            print(f"Could not memory-map {path}, reading it instead: {e}")
+    return torch.load(path, map_location="cpu", weights_only=True)
+
+
+def load_model(factory, path, device=None, mmap=WEIGHTS_MMAP):
+    """
+    Build a module and load its weights without copying them
+
+    The module is created on the meta device, so no memory is allocated or
+    initialized for weights that are about to be replaced, and the
+    checkpoint tensors are assigned as its parameters (load_state_dict with
+    assign=True). With mmap, a CPU model's parameters are the mapped file
+    pages themselves; other devices get a copy made from the mapping.
+
+    Args:
+        factory: Callable returning the module (e.g. the model class)
+        path: Checkpoint path (see load_checkpoint)
+        device: Device to move the model to (default: stay on the CPU)
+        mmap: Memory-map the checkpoint
+
+    Returns:
+        The module with the checkpoint's weights
+    """
+    import torch
+
+    state_dict = load_checkpoint(path, mmap)
+    with torch.device("meta"):
+        model = factory()
+    model.load_state_dict(state_dict, assign=True)
+    if any(tensor.is_meta for tensor in list(model.parameters()) + list(model.buffers())):
+        # Non-persistent buffers are not in the checkpoint; build the module for real
+        model = factory()
+        model.load_state_dict(state_dict)
+    if device is not None and torch.device(device).type != "cpu":
+        model = model.to(device)
+    return model
+
+
+def convert_to_safetensors(path, output_path=None):
+    """
+    Convert a torch.save checkpoint to safetensors
+
+    Args:
+        path: Checkpoint path
+        output_path: Output path (default: path with a .safetensors suffix)
+
+    Returns:
+        str: output_path
+    """
+    output_path = output_path or os.path.splitext(path)[0] + ".safetensors"
+    write_safetensors(load_checkpoint(path), output_path)
+    return output_path
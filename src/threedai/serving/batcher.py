@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class DynamicBatcher:
+    """
+    Groups individual requests into batches for a batched function
+
+    Items passed to submit() are collected by a worker thread. A batch is
+    dispatched as soon as it holds ``max_batch_size`` items, or ``max_wait``
+    seconds after its first item arrived, whichever comes first. Under load
+    batches fill up immediately; a lone request waits at most ``max_wait``.
+    """
+
+    def __init__(self, fn, max_batch_size=8, max_wait=0.01, name="threedai-batcher"):
+        """
+        Args:
+            fn: Function taking a list of items and returning a list of
+                results in the same order
+            max_batch_size: Largest batch passed to fn
+            max_wait: Seconds to wait for a batch to fill up
+            name: Name of the worker thread
+        """
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, item):
+        """
+        Queue an item
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result
+        """
+        if self._closed:
+            raise RuntimeError("Batcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Process the queued items and stop the worker"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    @property
+    def mean_batch_size(self):
+        return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # Finish this batch, then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch = [(item, future) for item, future in self._collect(entry)
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,250 @@
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+
+# Stages of a generation job, in order, and their share of the overall
+# progress. The preview is rendered while it is encoded, after the export.
+STAGES = ("load", "sample", "export", "render", "convert")
+STAGE_WEIGHTS = {
+    "load": 0.1,
+    "sample": 0.5,
+    "render": 0.15,
+    "export": 0.15,
+    "convert": 0.1,
+}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a backend's queue is at capacity"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled"""
+
+
+class GenerationJob:
+    """
+    Handle for a scheduled generation request
+
+    The job function receives the job as its first argument and calls
+    report() at each stage. report() is also the cancellation point: once
+    cancel() has been called, the next report() raises JobCancelled.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, backend):
+        self.id = next(self._ids)
+        self.backend = backend
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        # Intermediate results published while the job runs, by kind
+        self.previews = {}
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._updated = threading.Condition()
+        self._version = 0
+
+    def report(self, stage, fraction=0.0, message=None):
+        """
+        Report progress from inside the job
+
+        Args:
+            stage: One of STAGES
+            fraction: Completion of the stage in [0, 1]
+            message: Optional status text (defaults to the stage name)
+        """
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        done = sum(STAGE_WEIGHTS[s] for s in STAGES[:STAGES.index(stage)])
+        self._update(
+            stage=stage,
+            progress=done + STAGE_WEIGHTS[stage] * min(max(fraction, 0.0), 1.0),
+            message=message or stage.capitalize(),
+        )
+
+    def publish(self, kind, value):
+        """
+        Make an intermediate result available before the job finishes
+
+        Args:
+            kind: Name of the result (e.g. "coarse", "mesh")
+            value: The result, typically a file path
+        """
+        self._update(previews={**self.previews, kind: value})
+
+    def cancel(self):
+        """Request cancellation; running jobs stop at their next report()"""
+        self._cancelled.set()
+        if self.status == "queued":
+            self._update(status="cancelled", message="Cancelled")
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def wait_for_update(self, version, timeout=None):
+        """
+        Block until the job changes after ``version``
+
+        Args:
+            version: Version returned by a previous call (0 initially)
+            timeout: Maximum seconds to wait
+
+        Returns:
+            int: The current version
+        """
+        with self._updated:
+            self._updated.wait_for(lambda: self._version != version or self.done, timeout)
+            return self._version
+
+    def wait(self, timeout=None):
+        """
+        Block until the job finishes and return its result
+
+        Raises:
+            JobCancelled: If the job was cancelled
+            Exception: Whatever the job function raised
+        """
+        with self._updated:
+            if not self._updated.wait_for(lambda: self.done, timeout):
+                raise TimeoutError(f"Job {self.id} did not finish in {timeout}s")
+        if self.status == "cancelled":
+            raise JobCancelled()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _update(self, **fields):
+        with self._updated:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._version += 1
+            self._updated.notify_all()
+
+
+class Scheduler:
+    """
+    Queue of generation jobs with a concurrency limit per backend
+
+    At most ``max_concurrency`` jobs run at once for each backend; further
+    jobs wait in a FIFO queue. Once ``max_queue`` jobs are waiting for a
+    backend, new submissions are rejected with QueueFullError.
+    """
+
+    def __init__(self, max_concurrency=1, max_queue=8):
+        """
+        Args:
+            max_concurrency: Running jobs per backend, either an int or a
+                dict of backend name -> int
+            max_queue: Waiting jobs per backend before submissions are rejected
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._queues = defaultdict(deque)
+        self._running = defaultdict(int)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _limit(self, backend):
+        if isinstance(self.max_concurrency, dict):
+            return self.max_concurrency.get(backend, 1)
+        return self.max_concurrency
+
+    def submit(self, backend, fn, *args, **kwargs):
+        """
+        Queue a job
+
+        Args:
+            backend: Backend name, used for the concurrency limit
+            fn: Callable invoked as fn(job, *args, **kwargs)
+
+        Returns:
+            GenerationJob
+
+        Raises:
+            QueueFullError: If the backend's queue is full
+        """
+        job = GenerationJob(backend)
+        job._call = lambda: fn(job, *args, **kwargs)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler has been shut down")
+            queue = self._queues[backend]
+            # Cancelled jobs still in the queue don't count against it
+            waiting = sum(1 for queued in queue if not queued.cancelled)
+            if waiting >= self.max_queue:
+                raise QueueFullError(f"Too many queued {backend} requests, try again later")
+            queue.append(job)
+            self._dispatch(backend)
+        return job
+
+    def position(self, job):
+        """
+        Position of a job in its backend queue
+
+        Returns:
+            int: 1 for the next job to run, 0 if the job is not queued
+        """
+        with self._lock:
+            waiting = [queued for queued in self._queues[job.backend] if not queued.cancelled]
+            return waiting.index(job) + 1 if job in waiting else 0
+
+    def queue_length(self, backend):
+        """Number of jobs waiting for a backend"""
+        with self._lock:
+            return sum(1 for queued in self._queues[backend] if not queued.cancelled)
+
+    def running(self, backend):
+        """Number of jobs currently running for a backend"""
+        with self._lock:
+            return self._running[backend]
+
+    def shutdown(self):
+        """Reject new jobs and cancel the queued ones"""
+        with self._lock:
+            self._closed = True
+            for queue in self._queues.values():
+                for job in queue:
+                    job.cancel()
+                queue.clear()
+
+    def _dispatch(self, backend):
+        # Caller holds self._lock
+        queue = self._queues[backend]
+        while queue and self._running[backend] < self._limit(backend):
+            job = queue.popleft()
+            if job.cancelled:
+                continue
+            self._running[backend] += 1
+            thread = threading.Thread(target=self._run, args=(job,),
+                                      name=f"threedai-{backend}-{job.id}", daemon=True)
+            thread.start()
+
+    def _run(self, job):
+        job._update(status="running", started=time.time(), message="Starting")
+        try:
+            if job.cancelled:
+                raise JobCancelled()
+            result = job._call()
+        except JobCancelled:
+            job._update(status="cancelled", message="Cancelled", finished=time.time())
+        except Exception as e:
+            job._update(status="failed", error=e, message=f"Error: {e}", finished=time.time())
+        else:
+            job._update(status="done", result=result, progress=1.0, message="Done", finished=time.time())
+        finally:
+            with self._lock:
+                self._running[job.backend] -= 1
+                self._dispatch(job.backend)
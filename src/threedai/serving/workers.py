@@ -0,0 +1,676 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+import numpy as np
+
+from threedai.utils.tracing import get_tracer
+
+# Worker processes per backend. 0 runs generations inside the server process.
+WORKER_PROCESSES = int(os.environ.get("THREEDAI_WORKERS", "0"))
+
+# Seconds a task may run before its worker is killed and restarted (0: no limit)
+TASK_TIMEOUT = float(os.environ.get("THREEDAI_WORKER_TIMEOUT", "0"))
+
+# Loaders run inside the worker, given as "module:callable" so that spawned
+# processes can import them. Names missing here use the model registry.
+STUB_LOADER = "threedai.serving.workers:StubBackend"
+
+# Offsets of arrays packed into a shared memory segment
+_ALIGNMENT = 64
+
+_STOP = object()
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised for tasks whose worker process died while running them"""
+
+
+class _SharedArray:
+    """
+    Placeholder for an array stored in shared memory: in the result's own
+    segment, or in a separate one when segment is set
+    """
+
+    def __init__(self, offset, shape, dtype, segment=None):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+        self.segment = segment
+
+
+def _collect_arrays(value, arrays):
+    # Replace arrays in nested dicts/lists/tuples with placeholders
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        offset = sum(-(-array.nbytes // _ALIGNMENT) * _ALIGNMENT for array in arrays)
+        arrays.append(value)
+        return _SharedArray(offset, value.shape, value.dtype.str)
+    if isinstance(value, dict):
+        return {key: _collect_arrays(item, arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_collect_arrays(item, arrays) for item in value)
+    return value
+
+
+def _restore_arrays(value, buffer, copy=True):
+    # buffer(segment) returns the memory of a placeholder's segment
+    if isinstance(value, _SharedArray):
+        count = int(np.prod(value.shape))
+        array = np.frombuffer(buffer(value.segment), dtype=value.dtype, count=count, offset=value.offset) \
+            .reshape(value.shape)
+        return array.copy() if copy else array
+    if isinstance(value, dict):
+        return {key: _restore_arrays(item, buffer, copy) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_restore_arrays(item, buffer, copy) for item in value)
+    return value
+
+
+def share_frames(frames, capacity):
+    """
+    Write frames into their own shared memory segment as they are produced
+
+    Frames are copied straight into the segment, so a render iterator is
+    never collected into a list or stacked first. The returned placeholder
+    can be part of a result passed to pack_shared().
+
+    Args:
+        frames: Iterable of equally shaped arrays
+        capacity: Maximum number of frames
+
+    Returns:
+        Placeholder for the (count, *frame shape) array, or None without
+        frames
+    """
+    from multiprocessing import shared_memory
+
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return None
+    first = np.asarray(first)
+    segment = shared_memory.SharedMemory(create=True, size=max(capacity * first.nbytes, 1))
+    try:
+        target = np.ndarray((capacity,) + first.shape, dtype=first.dtype, buffer=segment.buf)
+        target[0] = first
+        count = 1
+        for frame in frames:
+            if count == capacity:
+                raise ValueError(f"More than {capacity} frames")
+            target[count] = frame
+            count += 1
+        del target
+    except BaseException:
+        segment.unlink()
+        raise
+    segment.close()
+    return _SharedArray(0, (count,) + first.shape, first.dtype.str, segment.name)
+
+
+def pack_shared(value):
+    """
+    Move the arrays of a result into one shared memory segment
+
+    Args:
+        value: Result, possibly holding numpy arrays in nested dicts,
+            lists or tuples, and arrays already placed in shared memory by
+            share_frames()
+
+    Returns:
+        tuple: (value with the arrays replaced by placeholders, name of the
+            segment or None if there were no arrays). The segments must be
+            released with unpack_shared() or attach_shared().
+    """
+    from multiprocessing import shared_memory
+
+    arrays = []
+    value = _collect_arrays(value, arrays)
+    if not arrays:
+        return value, None
+    size = sum(-(-array.nbytes // _ALIGNMENT) * _ALIGNMENT for array in arrays)
+    segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    offset = 0
+    for array in arrays:
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=offset)
+        target[...] = array
+        del target
+        offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    segment.close()
+    return value, segment.name
+
+
+def _open_segments(name):
+    # (buffer(segment) for _restore_arrays, release()) for a packed result
+    from multiprocessing import shared_memory
+
+    segments = {}
+
+    def buffer(segment):
+        segment = segment or name
+        if segment not in segments:
+            segments[segment] = shared_memory.SharedMemory(name=segment)
+        return segments[segment].buf
+
+    def release():
+        while segments:
+            _, segment = segments.popitem()
+            segment.unlink()
+            with _lingering_lock:
+                _lingering.append(segment)
+        _close_lingering()
+
+    return buffer, release
+
+
+# Released segments whose views were still referenced (e.g. by the traceback
+# of an exception); their mappings are closed on a later release
+_lingering = []
+_lingering_lock = threading.Lock()
+
+
+def _close_lingering():
+    with _lingering_lock:
+        for segment in list(_lingering):
+            try:
+                segment.close()
+            except BufferError:
+                continue
+            _lingering.remove(segment)
+
+
+def attach_shared(value, name):
+    """
+    Map the arrays of a packed result without copying them
+
+    Args:
+        value, name: Output of pack_shared()
+
+    Returns:
+        tuple: (the result with views onto shared memory in place of the
+            placeholders, release). release() frees the segments once the
+            views are gone; views still referenced then keep their mapping
+            until a later release() finds them unused.
+    """
+    buffer, release = _open_segments(name)
+    try:
+        return _restore_arrays(value, buffer, copy=False), release
+    except BaseException:
+        release()
+        raise
+
+
+def unpack_shared(value, name):
+    """
+    Copy the arrays of a packed result out of shared memory and free it
+
+    Args:
+        value, name: Output of pack_shared()
+
+    Returns:
+        The result with numpy arrays in place of the placeholders
+    """
+    buffer, release = _open_segments(name)
+    try:
+        return _restore_arrays(value, buffer)
+    finally:
+        release()
+
+
+def _load_callable(spec):
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class _StubMesh:
+    def __init__(self, vertices, faces):
+        self.vertices = vertices
+        self.faces = faces
+
+
+class StubBackend:
+    """
+    Backend stand-in for running the worker pool without a GPU
+
+    Behaves like the Hunyuan backend: calling it passes a coarse sphere to
+    on_preview, sleeps for a simulated sampling time and returns a finer
+    sphere, and export() writes it as GLB. The simulated time is ``delay``
+    (THREEDAI_STUB_DELAY) plus ``step_cost`` per sampling step,
+    ``volume_cost`` times (octree_resolution / 384)^3 and ``paint_cost``
+    when texturing, so that the cost model in threedai.ml.presets can be
+    exercised offline. The prompt controls failures, to exercise the pool's
+    error handling: "__fail__" raises an exception and "__crash__" kills the
+    worker process.
+    """
+
+    def __init__(self, faces=20_000, delay=float(os.environ.get("THREEDAI_STUB_DELAY", "0")),
+                 step_cost=0.0, volume_cost=0.0, paint_cost=0.0):
+        self.faces = faces
+        self.delay = delay
+        self.step_cost = step_cost
+        self.volume_cost = volume_cost
+        self.paint_cost = paint_cost
+
+    def _sample_seconds(self, generate_texture=True, num_inference_steps=50, octree_resolution=384, **kwds):
+        return (self.delay + self.step_cost * num_inference_steps
+                + self.volume_cost * (octree_resolution / 384) ** 3 + self.paint_cost * bool(generate_texture))
+
+    def __call__(self, image, prompt=None, on_preview=None, **kwds):
+        from threedai.utils.synthetic import synthetic_mesh
+
+        if prompt == "__crash__":
+            os._exit(3)
+        if prompt == "__fail__":
+            raise RuntimeError("Stub backend failure")
+        # A coarse first stage, then the slow detailed one
+        if on_preview is not None:
+            on_preview(*synthetic_mesh(max(self.faces // 50, 100)))
+        time.sleep(self._sample_seconds(**kwds))
+        return _StubMesh(*synthetic_mesh(self.faces))
+
+    def variants(self, image, prompt=None, seeds=(0,), **kwds):
+        from threedai.utils.synthetic import synthetic_mesh
+
+        # Shared work once, then a cheap per-seed step
+        time.sleep(self._sample_seconds(**kwds))
+        vertices, faces = synthetic_mesh(self.faces)
+        meshes = []
+        for seed in seeds:
+            rng = np.random.default_rng(seed)
+            scale = rng.uniform(0.6, 1.4, 3).astype(np.float32)
+            meshes.append(_StubMesh(vertices * scale, faces))
+        return meshes
+
+    def export(self, mesh, type, output_path):
+        from threedai.utils.format_converter import mesh_to_glb
+
+        if type != "glb":
+            raise ValueError(f"Unsupported export type: {type}")
+        if not mesh_to_glb(mesh.vertices, mesh.faces, output_path):
+            raise RuntimeError("Could not write GLB")
+        return output_path
+
+
+def _artifacts(job_dir):
+    from threedai.utils.job_store import Job
+
+    os.makedirs(job_dir, exist_ok=True)
+    return Job(os.path.basename(os.path.normpath(job_dir)), job_dir)
+
+
+def _run_backend_task(model, backend, params, image, prompt, job_dir, report, preview):
+    # The GPU-bound part of a generation. Preview frames are rendered here,
+    # straight into shared memory; the caller encodes them and exports the
+    # mesh arrays (see threedai.ml.pipeline.finish_outputs).
+    from threedai.ml.pipeline import VIDEO_OPTIONS, run_backend
+
+    artifacts = _artifacts(job_dir)
+    timings = {}
+    frames, glb_path, mesh = run_backend(model, backend, params, image, prompt, artifacts, report, preview,
+                                         timings)
+    start = time.perf_counter()
+    frames = share_frames(frames, VIDEO_OPTIONS["num_frames"])
+    timings["render"] = time.perf_counter() - start
+    return {"frames": frames, "glb": glb_path, "mesh": mesh, "artifacts": artifacts.artifacts,
+            "timings": timings}
+
+
+def _variants_task(model, backend, params, image, prompt, seeds, job_dir, report, preview):
+    from threedai.ml.pipeline import generate_variants
+
+    artifacts = _artifacts(job_dir)
+    candidates = generate_variants(model, backend, params, image, prompt, seeds, artifacts, report, preview)
+    return {"candidates": candidates, "artifacts": artifacts.artifacts}
+
+
+# Task name -> function(model, backend, report=..., preview=..., **kwargs) run
+# in the worker
+TASKS = {
+    "run_backend": _run_backend_task,
+    "variants": _variants_task,
+    "ping": lambda model, backend, report, preview: os.getpid(),
+}
+
+# Tasks whose result arrays are handed over as views onto shared memory
+# rather than copied. Their result dict gets a "release" callable that frees
+# the memory once the caller is done with the arrays.
+ZERO_COPY_TASKS = {"run_backend"}
+
+
+def _send_spans(conn, task_id):
+    # Hand the spans finished so far to the server process, whose tracer
+    # serves /metrics and writes the trace file
+    tracer = get_tracer()
+    if tracer.enabled:
+        records = tracer.take_records()
+        if records:
+            conn.send(("spans", task_id, records))
+
+
+def _worker_main(backend, loader, conn):
+    """Entry point of a worker process: load the backend, then serve tasks"""
+    from threedai.serving.scheduler import JobCancelled
+
+    try:
+        if loader is None:
+            from threedai.ml.registry import get_registry
+            model = get_registry().get(backend)
+        else:
+            model = _load_callable(loader)()
+    except BaseException as e:
+        _send_spans(conn, None)
+        conn.send(("error", None, _picklable(e), traceback.format_exc()))
+        return
+    _send_spans(conn, None)
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message[0] == "stop":
+            return
+        if message[0] != "task":
+            continue
+        _, task_id, task, kwargs = message
+        cancelled = False
+
+        def report(stage, fraction=0.0, message=None):
+            nonlocal cancelled
+            # Cancellation requests arrive between tasks' progress reports
+            while conn.poll():
+                if conn.recv()[0] == "cancel":
+                    cancelled = True
+            if cancelled:
+                raise JobCancelled()
+            _send_spans(conn, task_id)
+            conn.send(("progress", task_id, stage, fraction, message))
+
+        def preview(kind, value):
+            conn.send(("preview", task_id, kind, value))
+
+        try:
+            value, segment = pack_shared(TASKS[task](model, backend, report=report, preview=preview, **kwargs))
+        except BaseException as e:
+            _send_spans(conn, task_id)
+            conn.send(("error", task_id, _picklable(e), traceback.format_exc()))
+            continue
+        _send_spans(conn, task_id)
+        conn.send(("result", task_id, value, segment))
+
+
+def _picklable(error):
+    import pickle
+
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class _Worker:
+    """One worker process and the thread feeding it tasks"""
+
+    def __init__(self, pool, backend, index):
+        self.pool = pool
+        self.backend = backend
+        self.name = f"threedai-{backend}-worker-{index}"
+        self.process = None
+        self.conn = None
+        self.starts = 0
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+
+    def _start(self):
+        if self.starts:
+            self.pool._count_restart(self.backend)
+        self.starts += 1
+        parent, child = self.pool._context.Pipe()
+        self.process = self.pool._context.Process(
+            target=_worker_main, args=(self.backend, self.pool.loaders.get(self.backend), child),
+            name=self.name, daemon=True)
+        self.process.start()
+        child.close()
+        self.conn = parent
+        message = self._receive()
+        while message[0] == "spans":
+            # Spans of loading the backend
+            get_tracer().merge(message[2], pid=self.process.pid)
+            message = self._receive()
+        if message[0] != "ready":
+            self._stop_process()
+            raise message[2]
+
+    def _receive(self, deadline=None, timeout=None):
+        # Next message, or raise if the process died or the deadline (a
+        # time.monotonic() value) passed. timeout is only for the message.
+        while True:
+            if deadline is not None and time.monotonic() > deadline:
+                # A task past its deadline won't read a stop message
+                self._stop_process(timeout=0)
+                raise TimeoutError(f"{self.name} did not finish within {timeout}s")
+            if self.conn.poll(0.1):
+                break
+            if not self.process.is_alive():
+                # It may have sent something just before exiting
+                if self.conn.poll():
+                    break
+                self._crashed()
+        try:
+            return self.conn.recv()
+        except EOFError:
+            self._crashed()
+
+    def _crashed(self):
+        self.process.join(5)
+        code = self.process.exitcode
+        self._stop_process()
+        raise WorkerCrashedError(f"{self.name} exited with code {code}")
+
+    def _stop_process(self, timeout=5):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def ensure_started(self):
+        if self.process is None or not self.process.is_alive():
+            self._stop_process()
+            self._start()
+
+    def _run(self):
+        tasks = self.pool._queues[self.backend]
+        # Load the backend right away so the first task doesn't wait for it
+        try:
+            self.ensure_started()
+        except Exception as e:
+            print(f"Could not start {self.name}: {e}")
+        while True:
+            entry = tasks.get()
+            if entry is _STOP:
+                break
+            task_id, task, kwargs, report, preview, future = entry
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._call(task_id, task, kwargs, report, preview))
+            except BaseException as e:
+                future.set_exception(e)
+            # Don't keep the result alive while waiting for the next task;
+            # zero-copy results can only be released once nothing refers to them
+            del entry, future
+            if self.process is None:
+                # The worker died with the task; bring a fresh one up right away
+                try:
+                    self.ensure_started()
+                except Exception as e:
+                    print(f"Could not restart {self.name}: {e}")
+        self._stop_process()
+
+    def _call(self, task_id, task, kwargs, report, preview):
+        from threedai.serving.scheduler import JobCancelled
+
+        self.ensure_started()
+        self.conn.send(("task", task_id, task, kwargs))
+        # One deadline for the whole task, however often it reports progress
+        timeout = self.pool.task_timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            message = self._receive(deadline, timeout)
+            kind = message[0]
+            if kind == "progress":
+                try:
+                    report(*message[2:])
+                except JobCancelled:
+                    self.conn.send(("cancel", task_id))
+            elif kind == "preview":
+                preview(*message[2:])
+            elif kind == "spans":
+                get_tracer().merge(message[2], pid=self.process.pid)
+            elif kind == "result":
+                if task not in ZERO_COPY_TASKS:
+                    return unpack_shared(message[2], message[3])
+                value, release = attach_shared(message[2], message[3])
+                value["release"] = release
+                return value
+            elif kind == "error":
+                raise message[2]
+
+
+class WorkerPool:
+    """
+    Long-lived worker processes, each holding one backend resident
+
+    Tasks for a backend are queued and picked up by the first idle worker
+    of that backend. Progress reports are forwarded to the caller, arrays
+    in results come back through shared memory (as views for
+    ZERO_COPY_TASKS, copied out otherwise), and a worker that dies
+    (crash, OOM kill, timeout) fails its current task and is restarted for
+    the next one. Workers are spawned rather than forked so that CUDA can
+    be initialized in them.
+    """
+
+    def __init__(self, processes=1, loaders=None, task_timeout=None, start_method="spawn"):
+        """
+        Args:
+            processes: Worker processes per backend
+            loaders: Mapping of backend name to a "module:callable" loader
+                run in the worker. Other backends are loaded through the
+                model registry.
+            task_timeout: Seconds before a running task is abandoned and its
+                worker restarted (None for no limit)
+            start_method: multiprocessing start method
+        """
+        self.processes = processes
+        self.loaders = dict(loaders or {})
+        self.task_timeout = task_timeout
+        self.restarts = {}
+        self._context = multiprocessing.get_context(start_method)
+        self._queues = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._task_ids = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _count_restart(self, backend):
+        with self._lock:
+            self.restarts[backend] = self.restarts.get(backend, 0) + 1
+
+    def _workers_for(self, backend):
+        # Caller holds self._lock
+        if backend not in self._workers:
+            self._queues[backend] = queue.Queue()
+            self._workers[backend] = [_Worker(self, backend, i) for i in range(self.processes)]
+            for worker in self._workers[backend]:
+                worker.thread.start()
+        return self._workers[backend]
+
+    def preload(self, backends):
+        """
+        Start the workers of several backends and wait until they are loaded
+
+        Args:
+            backends: Iterable of backend names
+        """
+        futures = []
+        for backend in backends:
+            with self._lock:
+                workers = self._workers_for(backend)
+            futures += [self.submit(backend, "ping") for _ in workers]
+        for future in futures:
+            future.result()
+
+    def submit(self, backend, task, report=None, preview=None, **kwargs):
+        """
+        Queue a task for a backend's workers
+
+        Args:
+            backend: Backend name
+            task: Name from TASKS
+            report: Progress callback report(stage, fraction, message),
+                called from a pool thread. Raising JobCancelled from it
+                cancels the task in the worker.
+            preview: Callback preview(kind, value) for intermediate results
+                (see threedai.ml.pipeline.run_backend), called from a pool
+                thread
+            **kwargs: Task arguments (pickled to the worker)
+
+        Returns:
+            concurrent.futures.Future: Resolves to the task's result. For
+                ZERO_COPY_TASKS its arrays are views onto shared memory,
+                freed by calling its "release" entry after the last use.
+        """
+        if task not in TASKS:
+            raise KeyError(f"Unknown worker task: {task}")
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is closed")
+            self._workers_for(backend)
+            self._task_ids += 1
+            task_id = self._task_ids
+        self._queues[backend].put((task_id, task, kwargs, report or (lambda *args: None),
+                                   preview or (lambda *args: None), future))
+        return future
+
+    def worker_pids(self, backend):
+        """Process ids of a backend's running workers"""
+        with self._lock:
+            workers = list(self._workers.get(backend, ()))
+        return [worker.process.pid for worker in workers
+                if worker.process is not None and worker.process.is_alive()]
+
+    def close(self):
+        """Finish the queued tasks and stop every worker"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = dict(self._workers)
+        for backend, backend_workers in workers.items():
+            for _ in backend_workers:
+                self._queues[backend].put(_STOP)
+        for backend_workers in workers.values():
+            for worker in backend_workers:
+                worker.thread.join()
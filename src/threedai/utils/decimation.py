@@ -0,0 +1,201 @@
+import numpy as np
+
+# Upper bound on grid cells per axis (keeps linearized cell keys in int64)
+MAX_RESOLUTION = 1 << 20
+
+# Indices of the 10 unique entries of a symmetric 4x4 quadric
+_QUADRIC_ENTRIES = ((0, 0), (0, 1), (0, 2), (0, 3), (1, 1), (1, 2), (1, 3), (2, 2), (2, 3), (3, 3))
+
+
+def face_quadrics(vertices, faces):
+    """
+    Area-weighted plane quadrics of each face
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+
+    Returns:
+        tuple: (quadrics of shape (m, 10) holding the unique entries of each
+            4x4 quadric, face areas of shape (m,))
+    """
+    v0 = vertices[faces[:, 0]].astype(np.float64)
+    normals = np.cross(vertices[faces[:, 1]] - v0, vertices[faces[:, 2]] - v0)
+    double_area = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+    np.divide(normals, double_area[:, None], out=normals, where=double_area[:, None] != 0)
+    plane = np.empty((len(faces), 4))
+    plane[:, :3] = normals
+    plane[:, 3] = -np.einsum('ij,ij->i', normals, v0)
+
+    area = 0.5 * double_area
+    quadrics = np.empty((len(faces), 10))
+    for k, (i, j) in enumerate(_QUADRIC_ENTRIES):
+        np.multiply(plane[:, i] * plane[:, j], area, out=quadrics[:, k])
+    return quadrics, area
+
+
+def _cluster(vertices, origin, cell_size, resolution):
+    # Grid cell of every vertex, relabelled to 0..k-1
+    cells = np.floor((vertices - origin) / cell_size).astype(np.int64)
+    np.clip(cells, 0, resolution - 1, out=cells)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, labels = np.unique(keys, return_inverse=True)
+    return labels.reshape(-1)
+
+
+def _collapse_faces(labels, faces):
+    # Faces after clustering, without degenerate triangles
+    clustered = labels[faces]
+    keep = ((clustered[:, 0] != clustered[:, 1]) &
+            (clustered[:, 1] != clustered[:, 2]) &
+            (clustered[:, 0] != clustered[:, 2]))
+    return clustered[keep]
+
+
+def _count_faces(vertices, faces, origin, extent, resolution):
+    labels = _cluster(vertices, origin, extent / resolution, resolution)
+    return len(_collapse_faces(labels, faces))
+
+
+def _resolution_for_target(vertices, faces, origin, extent, target_faces):
+    # Largest grid resolution whose clustered mesh stays within the budget.
+    # The face count grows roughly with the square of the resolution, so the
+    # search runs on a log scale.
+    low, high = 1, 2
+    while high < MAX_RESOLUTION and _count_faces(vertices, faces, origin, extent, high) <= target_faces:
+        low, high = high, high * 2
+    if high >= MAX_RESOLUTION:
+        return MAX_RESOLUTION
+    while high - low > max(1, low // 64):
+        mid = int(np.sqrt(low * high))
+        mid = min(max(mid, low + 1), high - 1)
+        if _count_faces(vertices, faces, origin, extent, mid) <= target_faces:
+            low = mid
+        else:
+            high = mid
+    return _non_empty_resolution(vertices, faces, origin, extent, low)
+
+
+def _non_empty_resolution(vertices, faces, origin, extent, resolution):
+    # Coarse grids can collapse every face (resolution 1 merges all vertices
+    # into one cell); step up to the coarsest grid that keeps a triangle
+    while resolution < MAX_RESOLUTION and _count_faces(vertices, faces, origin, extent, resolution) == 0:
+        resolution = min(max(resolution + 1, int(resolution * 1.1)), MAX_RESOLUTION)
+    return resolution
+
+
+def decimate(vertices, faces, target_faces=None, max_error=None):
+    """
+    Simplify a triangle mesh with quadric-error vertex clustering
+
+    Vertices are grouped on a uniform grid and every cell is replaced by the
+    point minimizing the summed plane quadrics of its faces (Lindstrom's
+    out-of-core simplification). All steps are vectorized, so the cost is a
+    few sorts over the input and it scales to multi-million-face meshes.
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        target_faces: Maximum number of faces in the result. A budget too
+            small for any grid to meet gives the coarsest result that still
+            has faces, which can exceed it.
+        max_error: Approximate bound on how far the surface may move; sets
+            the grid cell size. Used when target_faces is not given. Like
+            target_faces, it never reduces a mesh to nothing.
+
+    Returns:
+        tuple: (vertices, faces, report) where report is a dict with the
+            input/output counts, the achieved reduction, the cell size and
+            the RMS and maximum quadric error of the result
+    """
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces, dtype=np.int64)
+    if target_faces is None and max_error is None:
+        raise ValueError("Either target_faces or max_error is required")
+
+    report = {
+        "input_vertices": len(vertices),
+        "input_faces": len(faces),
+    }
+    if len(faces) == 0 or (target_faces is not None and len(faces) <= target_faces):
+        report.update(output_vertices=len(vertices), output_faces=len(faces), reduction=0.0,
+                      cell_size=0.0, rms_error=0.0, max_cell_error=0.0)
+        return vertices, faces, report
+
+    origin = vertices.min(axis=0).astype(np.float64)
+    extent = float((vertices.max(axis=0) - origin).max()) or 1.0
+    # Nudge the grid so vertices on the max boundary fall inside the last cell
+    extent *= 1 + 1e-9
+
+    if target_faces is not None:
+        resolution = _resolution_for_target(vertices, faces, origin, extent, target_faces)
+    else:
+        # Any point of a cell is within its diagonal of every other point
+        resolution = int(np.ceil(extent * np.sqrt(3) / max_error))
+        resolution = min(max(resolution, 1), MAX_RESOLUTION)
+        resolution = _non_empty_resolution(vertices, faces, origin, extent, resolution)
+    cell_size = extent / resolution
+
+    labels = _cluster(vertices, origin, cell_size, resolution)
+    cell_count = int(labels.max()) + 1
+
+    # Accumulate face quadrics into the cells of their corners
+    quadrics, area = face_quadrics(vertices, faces)
+    corner_cells = labels[faces].reshape(-1)
+    cell_quadrics = np.empty((cell_count, 10))
+    for k in range(10):
+        cell_quadrics[:, k] = np.bincount(corner_cells, weights=np.repeat(quadrics[:, k], 3),
+                                          minlength=cell_count)
+    cell_area = np.bincount(corner_cells, weights=np.repeat(area, 3), minlength=cell_count)
+
+    # Mean of the vertices in each cell, used to regularize the solve
+    counts = np.bincount(labels, minlength=cell_count).astype(np.float64)
+    mean = np.empty((cell_count, 3))
+    for axis in range(3):
+        mean[:, axis] = np.bincount(labels, weights=vertices[:, axis], minlength=cell_count) / counts
+
+    # Solve A x = -b per cell. Flat or edge-like cells make A singular, so a
+    # small Tikhonov term pulls the unconstrained directions to the mean.
+    q = cell_quadrics
+    A = np.empty((cell_count, 3, 3))
+    A[:, 0, 0], A[:, 0, 1], A[:, 0, 2] = q[:, 0], q[:, 1], q[:, 2]
+    A[:, 1, 0], A[:, 1, 1], A[:, 1, 2] = q[:, 1], q[:, 4], q[:, 5]
+    A[:, 2, 0], A[:, 2, 1], A[:, 2, 2] = q[:, 2], q[:, 5], q[:, 7]
+    b = np.stack([q[:, 3], q[:, 6], q[:, 8]], axis=1)
+    reg = 1e-3 * np.trace(A, axis1=1, axis2=2) / 3 + 1e-12
+    A_reg = A + reg[:, None, None] * np.eye(3)
+    positions = np.linalg.solve(A_reg, (reg[:, None] * mean - b)[..., None])[..., 0]
+
+    # Keep every representative inside (a margin around) its own cell
+    cell_min = origin + np.floor((mean - origin) / cell_size) * cell_size
+    np.clip(positions, cell_min - 0.5 * cell_size, cell_min + 1.5 * cell_size, out=positions)
+
+    # Residual quadric error x^T A x + 2 b.x + c per cell
+    error = (np.einsum('ki,kij,kj->k', positions, A, positions) +
+             2 * np.einsum('ki,ki->k', b, positions) + q[:, 9])
+    np.maximum(error, 0, out=error)
+
+    new_faces = _collapse_faces(labels, faces)
+    # Drop faces that collapsed onto the same three cells
+    _, unique_index = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(unique_index)]
+
+    # Remove cells that no longer belong to any face
+    used = np.zeros(cell_count, dtype=bool)
+    used[new_faces.reshape(-1)] = True
+    remap = np.cumsum(used) - 1
+    new_faces = remap[new_faces]
+    new_vertices = positions[used].astype(vertices.dtype if vertices.dtype.kind == 'f' else np.float64)
+
+    total_area = cell_area[used].sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_rms = np.sqrt(np.where(cell_area > 0, error / cell_area, 0.0))
+    report.update(
+        output_vertices=len(new_vertices),
+        output_faces=len(new_faces),
+        reduction=1.0 - len(new_faces) / len(faces),
+        cell_size=cell_size,
+        rms_error=float(np.sqrt(error[used].sum() / total_area)) if total_area > 0 else 0.0,
+        max_cell_error=float(cell_rms[used].max()) if used.any() else 0.0,
+    )
+    return new_vertices, new_faces, report
@@ -3,14 +3,51 @@ import tempfile
 import os
 from pathlib import Path
 
-def mesh_to_stl(vertices, faces, output_path):
+# Record layout of a binary STL triangle (50 bytes)
+STL_DTYPE = np.dtype([
+    ('normals', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2', (1,)),
+])
+
+# Number of faces converted and written per chunk
+STL_CHUNK_SIZE = 1 << 16
+
+
+def _face_normals(triangles):
+    """
+    Compute unit normals for a batch of triangles
+
+    Degenerate faces (zero area) keep their zero cross product as the normal.
+
+    Args:
+        triangles: numpy array of shape (m, 3, 3)
+
+    Returns:
+        numpy array of shape (m, 3)
+    """
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    if not np.issubdtype(normals.dtype, np.floating):
+        normals = normals.astype(np.float64)
+    # Batched dot products go through the same kernel as np.linalg.norm on a
+    # single vector, which keeps the output bit-for-bit stable
+    norms = np.sqrt(np.matmul(normals[:, None, :], normals[:, :, None])[:, 0])
+    np.divide(normals, norms, out=normals, where=norms != 0)
+    return normals
+
+
+def mesh_to_stl(vertices, faces, output_path, chunk_size=STL_CHUNK_SIZE):
     """
     Convert a mesh (vertices and faces) to an STL file
+
+    Normals are computed in batches and faces are streamed to the file in
+    chunks of ``chunk_size``, so peak memory does not grow with the mesh.
     
     Args:
         vertices: numpy array of shape (n, 3) containing the vertices
         faces: numpy array of shape (m, 3) containing the faces (vertex indices)
         output_path: path to save the STL file
+        chunk_size: number of faces converted per chunk
         
     Returns:
         bool: True if conversion was successful, False otherwise
@@ -25,31 +62,19 @@ def mesh_to_stl(vertices, faces, output_path):
         return False
     
     try:
-        # Create the STL data structure
-        data = np.zeros(len(faces), dtype=[
-            ('normals', 'f4', (3,)),
-            ('vertices', 'f4', (3, 3)),
-            ('attr', 'u2', (1,)),
-        ])
-
-        # Fill the vertices
-        for i, face in enumerate(faces):
-            data['vertices'][i] = vertices[face]
-
-            # Calculate face normal
-            v1 = vertices[face[1]] - vertices[face[0]]
-            v2 = vertices[face[2]] - vertices[face[0]]
-            normal = np.cross(v1, v2)
-            norm = np.linalg.norm(normal)
-            if norm != 0:
-                normal = normal / norm
-            data['normals'][i] = normal
+        data = np.zeros(min(len(faces), chunk_size), dtype=STL_DTYPE)
 
         # Write binary STL
         with open(output_path, 'wb') as fp:
             fp.write(b'\x00' * 80)  # Header
             fp.write(np.array(len(faces), '<i4').tobytes())
-            fp.write(data.tobytes())
+
+            for start in range(0, len(faces), chunk_size):
+                triangles = vertices[faces[start:start + chunk_size]]
+                chunk = data[:len(triangles)]
+                chunk['vertices'] = triangles
+                chunk['normals'] = _face_normals(triangles)
+                fp.write(chunk.tobytes())
         
         return True
         
@@ -57,29 +82,115 @@ def mesh_to_stl(vertices, faces, output_path):
         print(f"Error converting mesh to STL: {str(e)}")
         return False
 
-def glb_to_stl(glb_path, stl_path):
+def read_stl(stl_path, mmap=False):
+    """
+    Read a binary STL file
+    
+    Args:
+        stl_path: Path to the STL file
+        mmap: Memory-map the file instead of reading it into memory
+        
+    Returns:
+        tuple: (triangles, normals) numpy arrays of shape (m, 3, 3) and (m, 3)
+    """
+    with open(stl_path, 'rb') as fp:
+        fp.seek(80)
+        count = int(np.frombuffer(fp.read(4), '<u4')[0])
+
+    if mmap:
+        data = np.memmap(stl_path, dtype=STL_DTYPE, mode='r', offset=84, shape=(count,))
+    else:
+        data = np.fromfile(stl_path, dtype=STL_DTYPE, count=count, offset=84)
+    if len(data) != count:
+        raise ValueError(f"Truncated STL file {stl_path}: expected {count} faces, found {len(data)}")
+    return data['vertices'], data['normals']
+
+def glb_to_stl(glb_path, stl_path, target_faces=None, repair=False, min_fragment=0.0):
     """Convert a GLB file to STL format.
+
+    The GLB is read with the native memory-mapped loader and the merged scene
+    is streamed to the STL writer. trimesh is only used as a fallback for
+    files the native loader can't handle (e.g. Draco-compressed geometry).
     
     Args:
         glb_path: Path to the input GLB file
         stl_path: Path to save the output STL file
+        target_faces: Decimate the mesh to at most this many faces
+            (None keeps the full mesh)
+        repair: Weld duplicated vertices and analyze the mesh first (see
+            threedai.utils.mesh_repair.prepare_for_print)
+        min_fragment: With repair, drop disconnected pieces holding less
+            than this fraction of the faces
         
     Returns:
         bool: True if conversion was successful, False otherwise
     """
+    from .glb import GLBFile
+
+    # Check if file exists
+    if not os.path.exists(glb_path):
+        print(f"Error: GLB file not found at {glb_path}")
+        return False
+
+    try:
+        with GLBFile(glb_path) as glb:
+            vertices, faces = glb.to_mesh()
+            if repair:
+                vertices, faces, _ = _prepare_for_print(vertices, faces, min_fragment)
+            if target_faces:
+                vertices, faces = _decimate(vertices, faces, target_faces)
+            success = mesh_to_stl(vertices, faces, stl_path)
+            # Release the views before the mapping is closed
+            del vertices, faces
+        return success
+    except (ValueError, KeyError) as e:
+        print(f"Native GLB loader failed ({e}), falling back to trimesh")
+        return _glb_to_stl_trimesh(glb_path, stl_path, target_faces)
+    except Exception as e:
+        print(f"Error converting GLB to STL: {str(e)}")
+        return False
+
+def _decimate(vertices, faces, target_faces):
+    from .decimation import decimate
+
+    vertices, faces, report = decimate(vertices, faces, target_faces=target_faces)
+    print(f"Decimated {report['input_faces']} -> {report['output_faces']} faces "
+          f"({report['reduction']:.1%} reduction, RMS error {report['rms_error']:.3g})")
+    return vertices, faces
+
+def _prepare_for_print(vertices, faces, min_fragment=0.0):
+    """
+    Weld, clean up and analyze a mesh before it is written as STL
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        min_fragment: Drop disconnected pieces holding less than this
+            fraction of the faces (0 keeps everything)
+
+    Returns:
+        tuple: (vertices, faces, report) (see mesh_repair.prepare_for_print)
+    """
+    from .mesh_repair import prepare_for_print
+
+    vertices, faces, report = prepare_for_print(vertices, faces, min_fraction=min_fragment)
+    print(f"Welded {report['welded_vertices']} vertices, removed {report['removed_components']} fragments: "
+          f"{report['boundary_edges']} boundary and {report['non_manifold_edges']} non-manifold edges, "
+          f"{report['components']} components, {'' if report['watertight'] else 'not '}watertight")
+    return vertices, faces, report
+
+def _glb_to_stl_trimesh(glb_path, stl_path, target_faces=None):
     try:
         import trimesh
-        import numpy as np
-        
-        # Check if file exists
-        if not os.path.exists(glb_path):
-            print(f"Error: GLB file not found at {glb_path}")
-            return False
             
         # Load the GLB file
         loaded = trimesh.load(glb_path)
         
         # Handle both Scene and Mesh objects
+        if isinstance(loaded, trimesh.Scene) and target_faces:
+            # Merge the scene so it can be decimated as one mesh
+            loaded = loaded.to_geometry()
+
         if isinstance(loaded, trimesh.Scene):
             # If it's a scene, export directly to STL
             # This will combine all meshes in the scene
@@ -87,8 +198,10 @@ def glb_to_stl(glb_path, stl_path):
             return True
         elif isinstance(loaded, trimesh.Trimesh):
             # If it's a single mesh, extract vertices and faces
-            vertices = np.array(loaded.vertices)
-            faces = np.array(loaded.faces)
+            vertices = np.asarray(loaded.vertices)
+            faces = np.asarray(loaded.faces)
+            if target_faces:
+                vertices, faces = _decimate(vertices, faces, target_faces)
             
             # Convert to STL using the mesh_to_stl function
             return mesh_to_stl(vertices, faces, stl_path)
@@ -101,4 +214,252 @@ def glb_to_stl(glb_path, stl_path):
         return False
     except Exception as e:
         print(f"Error converting GLB to STL: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+def _vertex_attributes(vertices, normals=None, uvs=None, colors=None):
+    # Validated float32/uint8 per-vertex arrays; None for missing attributes
+    vertices = np.asarray(vertices, dtype=np.float32)
+    if vertices.ndim != 2 or vertices.shape[1] != 3:
+        raise ValueError("vertices must be an array of shape (n, 3)")
+    attributes = {"vertices": vertices, "normals": None, "uvs": None, "colors": None}
+    for name, value, width in (("normals", normals, 3), ("uvs", uvs, 2)):
+        if value is not None:
+            value = np.asarray(value, dtype=np.float32)
+            if value.shape != (len(vertices), width):
+                raise ValueError(f"{name} must be an array of shape ({len(vertices)}, {width})")
+            attributes[name] = value
+    if colors is not None:
+        colors = np.asarray(colors)
+        if colors.dtype.kind == 'f':
+            colors = np.clip(colors * 255 + 0.5, 0, 255)
+        colors = colors.astype(np.uint8)
+        if colors.shape[0] != len(vertices) or colors.shape[1] not in (3, 4):
+            raise ValueError(f"colors must be an array of shape ({len(vertices)}, 3 or 4)")
+        if colors.shape[1] == 3:
+            colors = np.concatenate([colors, np.full((len(colors), 1), 255, np.uint8)], axis=1)
+        attributes["colors"] = colors
+    return attributes
+
+def mesh_to_ply(vertices, faces, output_path, normals=None, uvs=None, colors=None):
+    """
+    Write a mesh as binary little-endian PLY
+    
+    The vertex and face records are packed into structured arrays and
+    written with one call each.
+    
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3) of vertex indices
+        output_path: Path of the PLY file
+        normals: Optional per-vertex normals of shape (n, 3)
+        uvs: Optional per-vertex texture coordinates of shape (n, 2)
+        colors: Optional per-vertex RGB(A) colors, uint8 or floats in [0, 1]
+        
+    Returns:
+        bool: True if the file was written, False otherwise
+    """
+    try:
+        attributes = _vertex_attributes(vertices, normals, uvs, colors)
+        faces = np.asarray(faces)
+
+        fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+        properties = ["float x", "float y", "float z"]
+        if attributes["normals"] is not None:
+            fields += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+            properties += ["float nx", "float ny", "float nz"]
+        if attributes["uvs"] is not None:
+            fields += [('s', '<f4'), ('t', '<f4')]
+            properties += ["float s", "float t"]
+        if attributes["colors"] is not None:
+            fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('alpha', 'u1')]
+            properties += ["uchar red", "uchar green", "uchar blue", "uchar alpha"]
+
+        records = np.empty(len(attributes["vertices"]), dtype=fields)
+        for names, key in ((('x', 'y', 'z'), "vertices"), (('nx', 'ny', 'nz'), "normals"),
+                           (('s', 't'), "uvs"), (('red', 'green', 'blue', 'alpha'), "colors")):
+            if attributes[key] is not None:
+                for i, name in enumerate(names):
+                    records[name] = attributes[key][:, i]
+
+        face_records = np.empty(len(faces), dtype=[('count', 'u1'), ('indices', '<i4', (3,))])
+        face_records['count'] = 3
+        face_records['indices'] = faces
+
+        header = "\n".join(
+            ["ply", "format binary_little_endian 1.0", f"element vertex {len(records)}"]
+            + [f"property {p}" for p in properties]
+            + [f"element face {len(faces)}", "property list uchar int vertex_indices", "end_header"]
+        ) + "\n"
+        with open(output_path, 'wb') as fp:
+            fp.write(header.encode('ascii'))
+            fp.write(records.tobytes())
+            fp.write(face_records.tobytes())
+        return True
+    except Exception as e:
+        print(f"Error writing PLY: {str(e)}")
+        return False
+
+def mesh_to_obj(vertices, faces, output_path, normals=None, uvs=None, chunk_size=STL_CHUNK_SIZE):
+    """
+    Write a mesh as Wavefront OBJ
+    
+    Lines are formatted a chunk at a time with one string operation per
+    chunk instead of one per element.
+    
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3) of vertex indices
+        output_path: Path of the OBJ file
+        normals: Optional per-vertex normals of shape (n, 3)
+        uvs: Optional per-vertex texture coordinates of shape (n, 2)
+        chunk_size: Lines formatted per chunk
+        
+    Returns:
+        bool: True if the file was written, False otherwise
+    """
+    def write_rows(fp, line, rows):
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            fp.write((line * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+    try:
+        attributes = _vertex_attributes(vertices, normals, uvs)
+        faces = np.asarray(faces, dtype=np.int64) + 1
+
+        if attributes["uvs"] is not None and attributes["normals"] is not None:
+            face_line = "f %d/%d/%d %d/%d/%d %d/%d/%d\n"
+            face_rows = np.repeat(faces, 3, axis=1)
+        elif attributes["normals"] is not None:
+            face_line = "f %d//%d %d//%d %d//%d\n"
+            face_rows = np.repeat(faces, 2, axis=1)
+        elif attributes["uvs"] is not None:
+            face_line = "f %d/%d %d/%d %d/%d\n"
+            face_rows = np.repeat(faces, 2, axis=1)
+        else:
+            face_line = "f %d %d %d\n"
+            face_rows = faces
+
+        with open(output_path, 'w') as fp:
+            write_rows(fp, "v %.6g %.6g %.6g\n", attributes["vertices"])
+            if attributes["uvs"] is not None:
+                write_rows(fp, "vt %.6g %.6g\n", attributes["uvs"])
+            if attributes["normals"] is not None:
+                write_rows(fp, "vn %.6g %.6g %.6g\n", attributes["normals"])
+            write_rows(fp, face_line, face_rows)
+        return True
+    except Exception as e:
+        print(f"Error writing OBJ: {str(e)}")
+        return False
+
+def mesh_to_glb(vertices, faces, output_path, normals=None, uvs=None, colors=None):
+    """
+    Write a mesh as a single-primitive binary glTF (GLB) file
+    
+    All attributes are copied into one preallocated binary buffer at 4-byte
+    aligned offsets. Texture coordinates use the OBJ convention (origin at
+    the bottom left) and are flipped to glTF's top-left origin.
+    
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3) of vertex indices
+        output_path: Path of the GLB file
+        normals: Optional per-vertex normals of shape (n, 3)
+        uvs: Optional per-vertex texture coordinates of shape (n, 2)
+        colors: Optional per-vertex RGB(A) colors, uint8 or floats in [0, 1]
+        
+    Returns:
+        bool: True if the file was written, False otherwise
+    """
+    from .glb import MODE_TRIANGLES, write_glb
+
+    try:
+        attributes = _vertex_attributes(vertices, normals, uvs, colors)
+        positions = attributes["vertices"]
+        if attributes["uvs"] is not None:
+            attributes["uvs"] = attributes["uvs"] * np.array([1, -1], np.float32) + np.array([0, 1], np.float32)
+
+        # (glTF attribute, data, componentType, type, normalized, target)
+        entries = [("POSITION", positions, 5126, "VEC3", False, 34962)]
+        for name, key, component, kind, normalized in (("NORMAL", "normals", 5126, "VEC3", False),
+                                                       ("TEXCOORD_0", "uvs", 5126, "VEC2", False),
+                                                       ("COLOR_0", "colors", 5121, "VEC4", True)):
+            if attributes[key] is not None:
+                entries.append((name, attributes[key], component, kind, normalized, 34962))
+        entries.append(("indices", np.asarray(faces).astype('<u4').reshape(-1), 5125, "SCALAR", False, 34963))
+
+        offsets = []
+        size = 0
+        for entry in entries:
+            offsets.append(size)
+            size += -(-entry[1].nbytes // 4) * 4
+        binary = bytearray(size)
+        buffer_views, accessors, primitive = [], [], {"attributes": {}, "mode": MODE_TRIANGLES}
+        for index, ((name, data, component, kind, normalized, target), offset) in enumerate(zip(entries, offsets)):
+            np.frombuffer(binary, dtype=data.dtype, count=data.size, offset=offset)[:] = data.reshape(-1)
+            buffer_views.append({"buffer": 0, "byteOffset": offset, "byteLength": data.nbytes, "target": target})
+            accessor = {"bufferView": index, "componentType": component, "count": len(data), "type": kind}
+            if normalized:
+                accessor["normalized"] = True
+            if name == "POSITION":
+                accessor["min"] = positions.min(axis=0).tolist() if len(positions) else [0, 0, 0]
+                accessor["max"] = positions.max(axis=0).tolist() if len(positions) else [0, 0, 0]
+            accessors.append(accessor)
+            if name == "indices":
+                primitive["indices"] = index
+            else:
+                primitive["attributes"][name] = index
+
+        gltf = {
+            "asset": {"version": "2.0", "generator": "threedai"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [{"mesh": 0}],
+            "meshes": [{"primitives": [primitive]}],
+            "buffers": [{"byteLength": len(binary)}],
+            "bufferViews": buffer_views,
+            "accessors": accessors,
+        }
+        write_glb(output_path, gltf, binary)
+        return True
+    except Exception as e:
+        print(f"Error writing GLB: {str(e)}")
+        return False
+
+# Native exporters by file extension
+EXPORTERS = {
+    "stl": lambda vertices, faces, path, normals=None, uvs=None, colors=None: mesh_to_stl(
+        np.asarray(vertices), np.asarray(faces), path),
+    "ply": mesh_to_ply,
+    "obj": lambda vertices, faces, path, normals=None, uvs=None, colors=None: mesh_to_obj(
+        vertices, faces, path, normals=normals, uvs=uvs),
+    "glb": mesh_to_glb,
+}
+
+def export_mesh(vertices, faces, outputs, normals=None, uvs=None, colors=None, workers=None):
+    """
+    Write one in-memory mesh to several formats in parallel
+    
+    Args:
+        vertices, faces: Mesh arrays
+        outputs: Dict mapping a format in EXPORTERS ("stl", "ply", "obj",
+            "glb") to its output path
+        normals, uvs, colors: Optional per-vertex attributes, written by the
+            formats that support them
+        workers: Writer threads (defaults to one per format)
+        
+    Returns:
+        dict: Format -> True if it was written successfully
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    unknown = set(outputs) - set(EXPORTERS)
+    if unknown:
+        raise ValueError(f"Unsupported export formats: {', '.join(sorted(unknown))}")
+    if len(outputs) == 1:
+        (fmt, path), = outputs.items()
+        return {fmt: EXPORTERS[fmt](vertices, faces, path, normals=normals, uvs=uvs, colors=colors)}
+    with ThreadPoolExecutor(workers or len(outputs), thread_name_prefix="threedai-export") as pool:
+        futures = {fmt: pool.submit(EXPORTERS[fmt], vertices, faces, path,
+                                    normals=normals, uvs=uvs, colors=colors)
+                   for fmt, path in outputs.items()}
+        return {fmt: future.result() for fmt, future in futures.items()}
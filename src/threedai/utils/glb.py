@@ -0,0 +1,338 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+
+GLB_MAGIC = 0x46546C67  # b'glTF'
+CHUNK_JSON = 0x4E4F534A  # b'JSON'
+CHUNK_BIN = 0x004E4942  # b'BIN\0'
+
+MODE_TRIANGLES = 4
+
+# glTF accessor componentType -> numpy dtype
+COMPONENT_DTYPES = {
+    5120: np.dtype('<i1'),
+    5121: np.dtype('<u1'),
+    5122: np.dtype('<i2'),
+    5123: np.dtype('<u2'),
+    5125: np.dtype('<u4'),
+    5126: np.dtype('<f4'),
+}
+
+# glTF accessor type -> number of components
+TYPE_SIZES = {
+    'SCALAR': 1,
+    'VEC2': 2,
+    'VEC3': 3,
+    'VEC4': 4,
+    'MAT2': 4,
+    'MAT3': 9,
+    'MAT4': 16,
+}
+
+# Extensions that change how geometry is stored and can't be read natively
+UNSUPPORTED_EXTENSIONS = {
+    'KHR_draco_mesh_compression',
+    'EXT_meshopt_compression',
+}
+
+
+def node_matrix(node):
+    """
+    Local transform of a glTF node as a 4x4 matrix
+
+    Args:
+        node: Node dictionary from the glTF JSON
+
+    Returns:
+        numpy array of shape (4, 4)
+    """
+    if 'matrix' in node:
+        # glTF matrices are stored column-major
+        return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T
+
+    matrix = np.eye(4)
+    if 'scale' in node:
+        matrix[:3, :3] = np.diag(node['scale'])
+    if 'rotation' in node:
+        x, y, z, w = node['rotation']
+        rotation = np.array([
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ])
+        matrix[:3, :3] = rotation @ matrix[:3, :3]
+    if 'translation' in node:
+        matrix[:3, 3] = node['translation']
+    return matrix
+
+
+class GLBFile:
+    """
+    Memory-mapped reader for binary glTF 2.0 (GLB) files
+
+    Accessors are returned as read-only numpy views over the BIN chunk, so
+    nothing is copied until the data is transformed. Views stay valid while
+    the file is open; use it as a context manager and drop the arrays before
+    it closes.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, length = struct.unpack_from('<III', self._mmap, 0)
+            if magic != GLB_MAGIC:
+                raise ValueError(f"{self.path} is not a binary glTF file")
+            if version != 2:
+                raise ValueError(f"Unsupported glTF version {version}")
+
+            self.json = None
+            self._bin_offset = None
+            self._bin_length = 0
+            offset = 12
+            while offset < min(length, len(self._mmap)):
+                chunk_length, chunk_type = struct.unpack_from('<II', self._mmap, offset)
+                offset += 8
+                if chunk_type == CHUNK_JSON:
+                    self.json = json.loads(bytes(self._mmap[offset:offset + chunk_length]))
+                elif chunk_type == CHUNK_BIN and self._bin_offset is None:
+                    self._bin_offset = offset
+                    self._bin_length = chunk_length
+                offset += chunk_length
+
+            if self.json is None:
+                raise ValueError(f"{self.path} has no JSON chunk")
+
+            unsupported = UNSUPPORTED_EXTENSIONS.intersection(self.json.get('extensionsRequired', []))
+            if unsupported:
+                raise ValueError(f"Unsupported glTF extensions: {', '.join(sorted(unsupported))}")
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views are still alive; the mapping is released with them
+            pass
+        self._mmap = None
+
+    def buffer_view(self, index):
+        """
+        Raw bytes of a bufferView as a uint8 view
+
+        Args:
+            index: bufferView index
+
+        Returns:
+            numpy uint8 array viewing the BIN chunk
+        """
+        view = self.json['bufferViews'][index]
+        if view.get('buffer', 0) != 0 or self._bin_offset is None:
+            raise ValueError("Only the embedded GLB buffer is supported")
+        start = self._bin_offset + view.get('byteOffset', 0)
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=view['byteLength'], offset=start)
+
+    def accessor(self, index):
+        """
+        Data of an accessor as a numpy view over the BIN chunk
+
+        Args:
+            index: accessor index
+
+        Returns:
+            numpy array of shape (count,) for scalars, (count, components) otherwise
+        """
+        accessor = self.json['accessors'][index]
+        if 'sparse' in accessor:
+            raise ValueError("Sparse accessors are not supported")
+
+        dtype = COMPONENT_DTYPES[accessor['componentType']]
+        components = TYPE_SIZES[accessor['type']]
+        count = accessor['count']
+        if 'bufferView' not in accessor:
+            # Accessors without a bufferView are all zeros
+            return np.zeros((count, components) if components > 1 else count, dtype=dtype)
+
+        view = self.json['bufferViews'][accessor['bufferView']]
+        if view.get('buffer', 0) != 0 or self._bin_offset is None:
+            raise ValueError("Only the embedded GLB buffer is supported")
+
+        offset = self._bin_offset + view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+        element_size = dtype.itemsize * components
+        stride = view.get('byteStride', element_size)
+        if count and offset + stride * (count - 1) + element_size > self._bin_offset + self._bin_length:
+            raise ValueError(f"Accessor {index} reads past the end of the BIN chunk")
+
+        if components == 1:
+            return np.ndarray((count,), dtype=dtype, buffer=self._mmap, offset=offset, strides=(stride,))
+        return np.ndarray((count, components), dtype=dtype, buffer=self._mmap,
+                          offset=offset, strides=(stride, dtype.itemsize))
+
+    def float_accessor(self, index):
+        """
+        Accessor data as floats, dequantizing integer components
+
+        Float accessors are returned as views; normalized integer accessors
+        (e.g. KHR_mesh_quantization) are converted following the glTF rules.
+
+        Args:
+            index: accessor index
+
+        Returns:
+            numpy float32 array
+        """
+        data = self.accessor(index)
+        if data.dtype.kind == 'f':
+            return data
+        if not self.json['accessors'][index].get('normalized', False):
+            return data.astype(np.float32)
+        info = np.iinfo(data.dtype)
+        return np.maximum(data.astype(np.float32) / info.max, -1.0)
+
+    def mesh_instances(self):
+        """
+        Walk the default scene and yield every mesh with its world transform
+
+        Yields:
+            tuple: (mesh index, 4x4 world matrix)
+        """
+        nodes = self.json.get('nodes', [])
+        scenes = self.json.get('scenes')
+        if scenes:
+            roots = scenes[self.json.get('scene', 0)].get('nodes', [])
+        else:
+            # No scene: treat every node that isn't a child as a root
+            children = {c for node in nodes for c in node.get('children', [])}
+            roots = [i for i in range(len(nodes)) if i not in children]
+
+        stack = [(root, np.eye(4)) for root in reversed(roots)]
+        while stack:
+            index, parent = stack.pop()
+            node = nodes[index]
+            world = parent @ node_matrix(node)
+            if 'mesh' in node:
+                yield node['mesh'], world
+            for child in reversed(node.get('children', [])):
+                stack.append((child, world))
+
+        if not nodes:
+            # Meshes that aren't referenced by any node
+            for mesh_index in range(len(self.json.get('meshes', []))):
+                yield mesh_index, np.eye(4)
+
+    def primitives(self):
+        """
+        Yield the triangle primitives of the scene
+
+        Yields:
+            tuple: (positions view, faces view of shape (m, 3), 4x4 world matrix)
+        """
+        meshes = self.json.get('meshes', [])
+        for mesh_index, world in self.mesh_instances():
+            for primitive in meshes[mesh_index].get('primitives', []):
+                mode = primitive.get('mode', MODE_TRIANGLES)
+                if mode != MODE_TRIANGLES:
+                    if mode in (5, 6):
+                        raise ValueError("Triangle strips and fans are not supported")
+                    # Points and lines have no surface to export
+                    continue
+                positions = self.float_accessor(primitive['attributes']['POSITION'])
+                if 'indices' in primitive:
+                    faces = self.accessor(primitive['indices']).reshape(-1, 3)
+                else:
+                    faces = np.arange(len(positions), dtype=np.uint32).reshape(-1, 3)
+                yield positions, faces, world
+
+    def to_mesh(self):
+        """
+        Merge all triangle primitives of the scene into one mesh
+
+        A single untransformed primitive is returned as views over the file
+        without copying. Otherwise the output arrays are allocated once and
+        every primitive is transformed into its slice.
+
+        Returns:
+            tuple: (vertices of shape (n, 3), faces of shape (m, 3))
+        """
+        parts = list(self.primitives())
+        if not parts:
+            return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.uint32)
+
+        if len(parts) == 1 and np.array_equal(parts[0][2], np.eye(4)):
+            return parts[0][0], parts[0][1]
+
+        vertex_count = sum(len(positions) for positions, _, _ in parts)
+        face_count = sum(len(faces) for _, faces, _ in parts)
+        vertices = np.empty((vertex_count, 3), dtype=np.float32)
+        faces_out = np.empty((face_count, 3), dtype=np.int64 if vertex_count > 2 ** 32 - 1 else np.uint32)
+
+        vertex_offset = 0
+        face_offset = 0
+        for positions, faces, world in parts:
+            v_slice = vertices[vertex_offset:vertex_offset + len(positions)]
+            f_slice = faces_out[face_offset:face_offset + len(faces)]
+
+            np.matmul(positions, world[:3, :3].T.astype(np.float32), out=v_slice)
+            v_slice += world[:3, 3].astype(np.float32)
+
+            # Added in int64: uint8/uint16 indices plus the offset would wrap
+            np.add(faces, vertex_offset, out=f_slice, dtype=np.int64, casting='unsafe')
+            if np.linalg.det(world[:3, :3]) < 0:
+                # Mirroring transforms flip the winding order
+                f_slice[:] = f_slice[:, ::-1]
+
+            vertex_offset += len(positions)
+            face_offset += len(faces)
+
+        return vertices, faces_out
+
+
+def write_glb(path, gltf, binary):
+    """
+    Write a glTF JSON document and its binary buffer as a GLB file
+
+    Args:
+        path: Path of the GLB file
+        gltf: glTF JSON dictionary; buffers[0] must describe binary
+        binary: bytes-like BIN chunk (padded to 4 bytes here)
+    """
+    header = json.dumps(gltf, separators=(',', ':')).encode()
+    header += b' ' * (-len(header) % 4)
+    padding = b'\0' * (-len(binary) % 4)
+    with open(path, 'wb') as fp:
+        fp.write(struct.pack('<III', GLB_MAGIC, 2, 12 + 8 + len(header) + 8 + len(binary) + len(padding)))
+        fp.write(struct.pack('<II', len(header), CHUNK_JSON))
+        fp.write(header)
+        fp.write(struct.pack('<II', len(binary) + len(padding), CHUNK_BIN))
+        fp.write(binary)
+        fp.write(padding)
+
+
+def load_glb_mesh(glb_path):
+    """
+    Load the merged triangle mesh of a GLB file into memory
+
+    Args:
+        glb_path: Path to the GLB file
+
+    Returns:
+        tuple: (vertices of shape (n, 3), faces of shape (m, 3))
+    """
+    with GLBFile(glb_path) as glb:
+        vertices, faces = glb.to_mesh()
+        # Copy out of the mapping so the file can be closed
+        return np.array(vertices), np.array(faces)
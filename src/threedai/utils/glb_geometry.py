@@ -0,0 +1,551 @@
+import os
+import time
+
+import numpy as np
+
+from .glb import COMPONENT_DTYPES, MODE_TRIANGLES, TYPE_SIZES, GLBFile, write_glb
+from .spatial import morton_codes
+
+# Vertices a GPU post-transform cache is modelled to hold when measuring
+# the average cache miss ratio (ACMR)
+VERTEX_CACHE_SIZE = 32
+
+# Attribute encodings: glTF componentType and whether it is normalized
+#   POSITION: unsigned 16-bit integers, dequantized by a node transform
+#   NORMAL: signed 8-bit normalized, padded to 4 bytes per vertex
+#   TEXCOORD_n: unsigned 16-bit normalized when the UVs lie in [0, 1]
+POSITION_COMPONENT = 5123
+NORMAL_COMPONENT = 5120
+TEXCOORD_COMPONENT = 5123
+
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+
+
+def index_component(vertex_count):
+    """
+    Smallest glTF index componentType for a vertex count
+
+    The largest value of each type is reserved for primitive restart, so
+    uint8 holds up to 255 vertices and uint16 up to 65535.
+    """
+    if vertex_count <= 255:
+        return 5121
+    if vertex_count <= 65535:
+        return 5123
+    return 5125
+
+
+def cache_miss_ratio(faces, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Average vertex cache misses per triangle (ACMR) of an index buffer
+
+    A reference is a hit when the same vertex was referenced within the
+    last cache_size indices. This sliding-window model is close to a FIFO
+    cache and can be evaluated for all indices at once: 3.0 means no reuse,
+    and well-ordered meshes approach 0.5-0.7.
+
+    Args:
+        faces: numpy array of shape (m, 3)
+        cache_size: Indices the cache remembers
+
+    Returns:
+        float: Misses per triangle
+    """
+    indices = np.asarray(faces).reshape(-1)
+    if len(indices) == 0:
+        return 0.0
+    order = np.argsort(indices, kind="stable")
+    sorted_indices = indices[order]
+    repeat = np.zeros(len(indices), dtype=bool)
+    repeat[1:] = sorted_indices[1:] == sorted_indices[:-1]
+    # Distance from every reference to the previous reference of its vertex
+    distance = np.full(len(indices), np.iinfo(np.int64).max)
+    distance[order[1:][repeat[1:]]] = order[1:][repeat[1:]] - order[:-1][repeat[1:]]
+    return float(np.count_nonzero(distance > cache_size)) / (len(indices) // 3)
+
+
+def optimize_triangle_order(vertices, faces):
+    """
+    Sort triangles for the vertex cache
+
+    Triangles are sorted along a Morton curve through their centroids, so
+    consecutive triangles are spatial neighbours and share vertices while
+    they are still in the cache. Every triangle keeps its winding.
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+
+    Returns:
+        numpy array of shape (m, 3): The reordered faces
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(faces) == 0:
+        return faces
+    centroids = np.asarray(vertices, dtype=np.float64)[faces].mean(axis=1)
+    return faces[np.argsort(morton_codes(centroids), kind="stable")]
+
+
+def optimize_vertex_order(faces):
+    """
+    Renumber vertices in the order the index buffer first uses them
+
+    Vertex fetches then walk the vertex buffers sequentially. Vertices no
+    triangle uses are dropped.
+
+    Args:
+        faces: numpy array of shape (m, 3)
+
+    Returns:
+        tuple: (faces in the new numbering, old index of every new vertex)
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(faces) == 0:
+        return faces, np.zeros(0, dtype=np.int64)
+    indices = faces.reshape(-1)
+    used, first = np.unique(indices, return_index=True)
+    order = used[np.argsort(first, kind="stable")]
+    remap = np.empty(int(indices.max()) + 1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return remap[faces], order
+
+
+def _quantize_positions(positions, low, scale):
+    # 16-bit components padded to 8 bytes per vertex, as vertex attributes
+    # must be 4-byte aligned
+    quantized = np.zeros((len(positions), 4), dtype='<u2')
+    quantized[:, :3] = np.clip(np.rint((positions - low) / scale), 0, 65535)
+    return quantized
+
+
+def _quantize_normals(normals):
+    # 8-bit components padded to 4 bytes per vertex
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    unit = np.where(length > 0, normals / np.maximum(length, 1e-12), 0)
+    quantized = np.zeros((len(normals), 4), dtype='<i1')
+    quantized[:, :3] = np.rint(unit * 127)
+    return quantized
+
+
+class _Builder:
+    # New bufferViews and accessors appended to a glTF document, with their
+    # bytes collected for the rebuilt BIN chunk
+
+    def __init__(self, gltf):
+        self.gltf = gltf
+        self.chunks = {}
+
+    def add(self, data, kind, component, target, normalized=False, count=None, stride=None, bounds=True):
+        data = np.ascontiguousarray(data)
+        views = self.gltf.setdefault("bufferViews", [])
+        view = {"buffer": 0, "byteLength": data.nbytes, "target": target}
+        if stride:
+            view["byteStride"] = stride
+        self.chunks[len(views)] = data
+        views.append(view)
+        accessor = {"bufferView": len(views) - 1, "componentType": component,
+                    "count": len(data) if count is None else count, "type": kind}
+        if normalized:
+            accessor["normalized"] = True
+        if bounds and len(data):
+            values = data.reshape(len(data), -1)[:, :TYPE_SIZES[kind]]
+            accessor["min"] = values.min(axis=0).tolist()
+            accessor["max"] = values.max(axis=0).tolist()
+        accessors = self.gltf.setdefault("accessors", [])
+        accessors.append(accessor)
+        return len(accessors) - 1
+
+
+def _referenced_accessors(gltf):
+    used = set()
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            used.update(primitive.get("attributes", {}).values())
+            if "indices" in primitive:
+                used.add(primitive["indices"])
+            for target in primitive.get("targets", []):
+                used.update(target.values())
+    for skin in gltf.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            used.add(skin["inverseBindMatrices"])
+    for animation in gltf.get("animations", []):
+        for sampler in animation.get("samplers", []):
+            used.update((sampler["input"], sampler["output"]))
+    return used
+
+
+def _remove_unused(gltf):
+    # Drop accessors and bufferViews nothing refers to anymore, renumbering
+    # the references to the ones that stay. Returns the old indices of the
+    # remaining bufferViews.
+    accessors = gltf.get("accessors", [])
+    used = sorted(_referenced_accessors(gltf))
+    accessor_map = {old: new for new, old in enumerate(used)}
+    gltf["accessors"] = [accessors[i] for i in used]
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            primitive["attributes"] = {k: accessor_map[v] for k, v in primitive.get("attributes", {}).items()}
+            if "indices" in primitive:
+                primitive["indices"] = accessor_map[primitive["indices"]]
+            primitive_targets = primitive.get("targets", [])
+            for i, target in enumerate(primitive_targets):
+                primitive_targets[i] = {k: accessor_map[v] for k, v in target.items()}
+    for skin in gltf.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            skin["inverseBindMatrices"] = accessor_map[skin["inverseBindMatrices"]]
+    for animation in gltf.get("animations", []):
+        for sampler in animation.get("samplers", []):
+            sampler["input"], sampler["output"] = accessor_map[sampler["input"]], accessor_map[sampler["output"]]
+
+    views = set()
+    for accessor in gltf["accessors"]:
+        if "bufferView" in accessor:
+            views.add(accessor["bufferView"])
+        sparse = accessor.get("sparse")
+        if sparse:
+            views.update((sparse["indices"]["bufferView"], sparse["values"]["bufferView"]))
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            views.add(image["bufferView"])
+    views = sorted(views)
+    view_map = {old: new for new, old in enumerate(views)}
+    gltf["bufferViews"] = [gltf["bufferViews"][i] for i in views]
+    for accessor in gltf["accessors"]:
+        if "bufferView" in accessor:
+            accessor["bufferView"] = view_map[accessor["bufferView"]]
+        sparse = accessor.get("sparse")
+        if sparse:
+            for part in ("indices", "values"):
+                sparse[part]["bufferView"] = view_map[sparse[part]["bufferView"]]
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = view_map[image["bufferView"]]
+    return views
+
+
+def split_faces(faces, max_vertices=65535):
+    """
+    Split an index buffer into consecutive runs using few enough vertices
+
+    Runs are halved until each references at most max_vertices distinct
+    vertices, so every run can be drawn with 16-bit indices. On spatially
+    ordered triangles (see optimize_triangle_order) the runs are compact
+    patches and few vertices are duplicated along their borders.
+
+    Args:
+        faces: numpy array of shape (m, 3)
+        max_vertices: Largest vertex count per run
+
+    Returns:
+        list: Face arrays in their original order
+    """
+    parts = []
+    pending = [np.asarray(faces)]
+    while pending:
+        part = pending.pop()
+        if len(part) <= 1 or len(np.unique(part)) <= max_vertices:
+            parts.append(part)
+        else:
+            half = len(part) // 2
+            pending += [part[half:], part[:half]]
+    return parts
+
+
+def _prepare_primitive(glb, primitive, reorder, split):
+    # Read a triangle primitive's positions and faces and optimize their
+    # order. Returns the parts it is written as, and its report entry.
+    positions = np.asarray(glb.float_accessor(primitive["attributes"]["POSITION"]), dtype=np.float32)
+    if "indices" in primitive:
+        faces = np.asarray(glb.accessor(primitive["indices"]), dtype=np.int64).reshape(-1, 3)
+    else:
+        faces = np.arange(len(positions), dtype=np.int64).reshape(-1, 3)
+    acmr_before = acmr = cache_miss_ratio(faces)
+    if reorder:
+        # Already well-ordered meshes keep their triangle order
+        sorted_faces = optimize_triangle_order(positions, faces)
+        sorted_acmr = cache_miss_ratio(sorted_faces)
+        if sorted_acmr < acmr:
+            faces, acmr = sorted_faces, sorted_acmr
+
+    parts = []
+    for part in split_faces(faces) if split else [faces]:
+        if reorder or split:
+            part, order = optimize_vertex_order(part)
+        else:
+            order = np.arange(len(positions))
+        parts.append({"positions": positions[order], "faces": part, "order": order})
+    entry = {
+        "vertices": sum(len(part["order"]) for part in parts),
+        "faces": int(len(faces)),
+        "parts": len(parts),
+        "index_bytes": max(COMPONENT_DTYPES[index_component(len(part["order"]))].itemsize for part in parts),
+        "acmr_before": round(acmr_before, 3),
+        "acmr_after": round(acmr, 3),
+    }
+    return parts, entry
+
+
+def _write_primitive(glb, primitive, builder, prepared, low, scale):
+    # Replace the primitive's accessors with quantized, reordered ones.
+    # Returns the uncompressed data the written file is checked against.
+    order = prepared["order"]
+    reference = {"positions": prepared["positions"], "faces": prepared["faces"], "uvs": {}}
+    attributes = {"POSITION": builder.add(_quantize_positions(prepared["positions"], low, scale), "VEC3",
+                                          POSITION_COMPONENT, _ARRAY_BUFFER, stride=8)}
+    for name, index in primitive["attributes"].items():
+        accessor = glb.json["accessors"][index]
+        if name == "POSITION":
+            continue
+        if name == "NORMAL":
+            normals = np.asarray(glb.float_accessor(index), dtype=np.float32)[order]
+            attributes[name] = builder.add(_quantize_normals(normals), "VEC3", NORMAL_COMPONENT, _ARRAY_BUFFER,
+                                           normalized=True, stride=4, bounds=False)
+            reference["normals"] = normals
+            continue
+        if name.startswith("TEXCOORD_") and accessor["componentType"] == 5126:
+            uvs = np.asarray(glb.float_accessor(index), dtype=np.float32)[order]
+            # Out-of-range UVs would need KHR_texture_transform; they stay floats
+            if len(uvs) == 0 or (uvs.min() >= 0 and uvs.max() <= 1):
+                attributes[name] = builder.add(np.rint(uvs * 65535).astype('<u2'), "VEC2", TEXCOORD_COMPONENT,
+                                               _ARRAY_BUFFER, normalized=True, bounds=False)
+                reference["uvs"][name] = uvs
+                continue
+        # Other attributes (colors, tangents, skin weights) keep their
+        # encoding and only follow the new vertex order
+        data = np.asarray(glb.accessor(index))[order]
+        data = data.reshape(len(data), -1).view(np.uint8)
+        stride = -(-data.shape[1] // 4) * 4
+        if stride != data.shape[1]:
+            data = np.pad(data, ((0, 0), (0, stride - data.shape[1])))
+        attributes[name] = builder.add(data, accessor["type"], accessor["componentType"], _ARRAY_BUFFER,
+                                       normalized=accessor.get("normalized", False), stride=stride, bounds=False)
+    primitive["attributes"] = attributes
+
+    component = index_component(len(order))
+    primitive["indices"] = builder.add(prepared["faces"].reshape(-1).astype(COMPONENT_DTYPES[component]),
+                                       "SCALAR", component, _ELEMENT_ARRAY_BUFFER, bounds=False)
+    return reference
+
+
+def decode_geometry(glb_path):
+    """
+    Read back every triangle primitive of a GLB file as float arrays
+
+    Integer attributes (KHR_mesh_quantization) are dequantized and positions
+    and normals are transformed to world space, so the result can be
+    compared with the uncompressed mesh.
+
+    Args:
+        glb_path: GLB file
+
+    Returns:
+        list: Per primitive instance a dict with positions, faces, normals
+            and the TEXCOORD_n arrays that are present
+    """
+    primitives = []
+    with GLBFile(glb_path) as glb:
+        meshes = glb.json.get("meshes", [])
+        for mesh_index, world in glb.mesh_instances():
+            for primitive in meshes[mesh_index].get("primitives", []):
+                if primitive.get("mode", MODE_TRIANGLES) != MODE_TRIANGLES:
+                    continue
+                attributes = primitive["attributes"]
+                positions = np.asarray(glb.float_accessor(attributes["POSITION"]), dtype=np.float64)
+                decoded = {"positions": positions @ world[:3, :3].T + world[:3, 3]}
+                if "indices" in primitive:
+                    decoded["faces"] = np.array(glb.accessor(primitive["indices"]), dtype=np.int64).reshape(-1, 3)
+                else:
+                    decoded["faces"] = np.arange(len(positions), dtype=np.int64).reshape(-1, 3)
+                if "NORMAL" in attributes:
+                    normals = np.asarray(glb.float_accessor(attributes["NORMAL"]), dtype=np.float64)
+                    normals = normals @ np.linalg.inv(world[:3, :3])
+                    decoded["normals"] = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+                for name, index in attributes.items():
+                    if name.startswith("TEXCOORD_"):
+                        decoded[name] = np.array(glb.float_accessor(index), dtype=np.float64)
+                primitives.append(decoded)
+    return primitives
+
+
+def _dequantization(low, scale):
+    matrix = np.diag([scale, scale, scale, 1.0])
+    matrix[:3, 3] = low
+    return matrix
+
+
+def _verify(output_path, references, transforms):
+    # Largest deviations of the written file from the uncompressed data.
+    # references holds per quantized mesh the data of its primitives, and
+    # transforms the (low, scale) of its dequantization node.
+    with GLBFile(output_path) as glb:
+        meshes = glb.json.get("meshes", [])
+        expected = []
+        for mesh_index, world in glb.mesh_instances():
+            triangles = [p for p in meshes[mesh_index].get("primitives", [])
+                         if p.get("mode", MODE_TRIANGLES) == MODE_TRIANGLES]
+            if mesh_index not in references:
+                expected += [None] * len(triangles)
+                continue
+            # The world transform without the inserted dequantization node
+            original = world @ np.linalg.inv(_dequantization(*transforms[mesh_index]))
+            expected += [(original, reference) for reference in references[mesh_index]]
+
+    errors = {"position": 0.0, "position_relative": 0.0, "normal_degrees": 0.0, "uv": 0.0, "faces_match": True}
+    for decoded, pair in zip(decode_geometry(output_path), expected):
+        if pair is None:
+            continue
+        world, reference = pair
+        positions = reference["positions"] @ world[:3, :3].T + world[:3, 3]
+        error = float(np.abs(decoded["positions"] - positions).max(initial=0))
+        diagonal = float(np.linalg.norm(np.ptp(positions, axis=0))) if len(positions) else 0.0
+        errors["position"] = max(errors["position"], error)
+        errors["position_relative"] = max(errors["position_relative"], error / diagonal if diagonal else 0.0)
+        errors["faces_match"] &= bool(np.array_equal(decoded["faces"], reference["faces"]))
+        if "normals" in reference:
+            normals = reference["normals"] @ np.linalg.inv(world[:3, :3])
+            normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+            cosine = np.clip(np.sum(normals * decoded["normals"], axis=1), -1, 1)
+            valid = np.linalg.norm(reference["normals"], axis=1) > 0
+            errors["normal_degrees"] = max(errors["normal_degrees"],
+                                           float(np.degrees(np.arccos(cosine[valid])).max(initial=0)))
+        for name, uvs in reference["uvs"].items():
+            errors["uv"] = max(errors["uv"], float(np.abs(decoded[name] - uvs).max(initial=0)))
+    return errors
+
+
+def compress_geometry(glb_path, output_path=None, reorder=True, split=True, verify=True):
+    """
+    Quantize and reorder the mesh data of a GLB file (KHR_mesh_quantization)
+
+    Every triangle primitive is rewritten with:
+      - triangles reordered for the vertex cache when that lowers the
+        ACMR, and vertices for sequential fetches (see
+        optimize_triangle_order and optimize_vertex_order)
+      - positions as 16-bit integers over the mesh's bounding box, mapped
+        back by a node transform inserted above the mesh
+      - normals as 8-bit normalized integers
+      - texture coordinates in [0, 1] as 16-bit normalized integers
+      - the smallest index type for its vertex count (see index_component),
+        after splitting primitives with more vertices than 16-bit indices
+        can address (see split_faces)
+    The BIN chunk is rebuilt from the new buffers and the ones still in use
+    (textures, animations); unused accessors and views are dropped. Meshes
+    with morph targets or non-triangle primitives, skinned meshes, and
+    meshes no node refers to, are left as they are.
+
+    Args:
+        glb_path: GLB file to read
+        output_path: GLB file to write (default: replace glb_path)
+        reorder: Optimize triangle and vertex order
+        split: Split primitives so they can use 16-bit indices
+        verify: Decode the written file with decode_geometry and measure
+            its errors against the uncompressed data
+
+    Returns:
+        dict: Report with the file and geometry sizes before and after,
+            per primitive the vertex/face counts, number of parts, index
+            size and ACMR before and after, and with verify the largest position error
+            (absolute and relative to the bounding box diagonal), normal
+            angle error and UV error, and whether the faces round-tripped
+    """
+    import shutil
+
+    start = time.perf_counter()
+    output_path = output_path or glb_path
+    input_bytes = os.path.getsize(glb_path)
+
+    with GLBFile(glb_path) as glb:
+        gltf = glb.json
+        views = gltf.get("bufferViews", [])
+        accessors = gltf.get("accessors", [])
+        # Interleaved attributes share a view; count each view once
+        geometry_views = {accessors[i]["bufferView"] for i in _referenced_accessors(gltf)
+                          if "bufferView" in accessors[i]}
+        geometry_before = sum(views[i]["byteLength"] for i in geometry_views)
+
+        nodes = gltf.get("nodes", [])
+        instanced = {node["mesh"] for node in nodes if "mesh" in node}
+        # Skinned meshes are placed by their joints, not by their node, so
+        # a dequantization transform above them would be ignored
+        skinned = {node["mesh"] for node in nodes if "mesh" in node and "skin" in node}
+        builder = _Builder(gltf)
+        transforms, references, entries = {}, {}, []
+        for mesh_index, mesh in enumerate(gltf.get("meshes", [])):
+            primitives = mesh.get("primitives", [])
+            if mesh_index not in instanced or mesh_index in skinned or not primitives or any(
+                    p.get("mode", MODE_TRIANGLES) != MODE_TRIANGLES or p.get("targets") for p in primitives):
+                continue
+            prepared, parts, mesh_entries = [], [], []
+            for primitive in primitives:
+                primitive_parts, entry = _prepare_primitive(glb, primitive, reorder, split)
+                mesh_entries.append(entry)
+                for part in primitive_parts:
+                    # Split parts are copies of the primitive (same material)
+                    parts.append(dict(primitive))
+                    prepared.append(part)
+            # One dequantization transform per mesh, over all its primitives
+            points = np.concatenate([p["positions"] for p in prepared])
+            if len(points) == 0:
+                continue
+            low = points.min(axis=0).astype(np.float64)
+            scale = float((points.max(axis=0) - low).max()) / 65535 or 1.0
+            references[mesh_index] = [_write_primitive(glb, primitive, builder, data, low, scale)
+                                      for primitive, data in zip(parts, prepared)]
+            mesh["primitives"] = parts
+            entries += mesh_entries
+            transforms[mesh_index] = (low, scale)
+
+        if transforms:
+            # Every quantized mesh moves to a child node that dequantizes it
+            for node in list(nodes):
+                if node.get("mesh") in transforms:
+                    low, scale = transforms[node["mesh"]]
+                    nodes.append({"mesh": node.pop("mesh"), "translation": low.tolist(), "scale": [scale] * 3})
+                    node.setdefault("children", []).append(len(nodes) - 1)
+
+            # Views over the input, taken before the bufferViews are renumbered
+            sources = {i: glb.buffer_view(i) for i in range(len(gltf["bufferViews"]))
+                       if i not in builder.chunks and gltf["bufferViews"][i].get("buffer", 0) == 0}
+            kept = _remove_unused(gltf)
+            chunks = [builder.chunks[i] if i in builder.chunks else sources[i] for i in kept]
+            lengths = [chunk.nbytes for chunk in chunks]
+            offsets = np.concatenate([[0], np.cumsum([-(-length // 4) * 4 for length in lengths])]).astype(int)
+            binary = bytearray(int(offsets[-1]))
+            target = memoryview(binary)
+            for view, chunk, offset, length in zip(gltf["bufferViews"], chunks, offsets, lengths):
+                target[offset:offset + length] = chunk.reshape(-1).view(np.uint8)
+                view["byteOffset"] = int(offset)
+                view["byteLength"] = length
+            target.release()
+            del chunks, sources
+            gltf["buffers"][0]["byteLength"] = len(binary)
+            for key in ("extensionsUsed", "extensionsRequired"):
+                gltf[key] = sorted(set(gltf.get(key, [])) | {"KHR_mesh_quantization"})
+
+    if transforms:
+        temporary = f"{output_path}.tmp"
+        write_glb(temporary, gltf, binary)
+        os.replace(temporary, output_path)
+    elif output_path != glb_path:
+        shutil.copyfile(glb_path, output_path)
+
+    geometry_after = sum(array.nbytes for array in builder.chunks.values()) if transforms else geometry_before
+    report = {
+        "input_bytes": input_bytes,
+        "output_bytes": os.path.getsize(output_path),
+        "geometry_bytes_before": int(geometry_before),
+        "geometry_bytes_after": int(geometry_after),
+        "primitives": entries,
+    }
+    if verify and transforms:
+        errors = _verify(output_path, references, transforms)
+        report.update(
+            max_position_error=errors["position"],
+            max_position_error_relative=errors["position_relative"],
+            max_normal_error_degrees=round(errors["normal_degrees"], 3),
+            max_uv_error=errors["uv"],
+            faces_match=errors["faces_match"],
+        )
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
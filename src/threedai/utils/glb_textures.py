@@ -0,0 +1,286 @@
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from .glb import GLBFile, write_glb
+
+# Encoders for compress_textures(): PIL format name, MIME type and the
+# glTF extension needed to reference the image from a texture
+TEXTURE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", None),
+    "webp": ("WEBP", "image/webp", "EXT_texture_webp"),
+    "png": ("PNG", "image/png", None),
+}
+
+# Texture roles by material slot; they decide how a texture is filtered
+COLOR_SLOTS = ("baseColorTexture", "emissiveTexture")
+NORMAL_SLOTS = ("normalTexture",)
+
+# Images in other formats (e.g. KTX2) are left alone
+DECODABLE_TYPES = ("image/png", "image/jpeg", "image/webp")
+
+
+def _texture_roles(gltf):
+    # Image index -> "color", "normal" or "data" (linear), from the materials
+    # referencing it. Color wins over data, normal over both.
+    sources = []
+    for texture in gltf.get("textures", []):
+        extensions = texture.get("extensions", {})
+        source = texture.get("source", extensions.get("EXT_texture_webp", {}).get("source"))
+        sources.append(source)
+
+    roles = {}
+    rank = {"data": 0, "color": 1, "normal": 2}
+
+    def visit(info, role):
+        if not isinstance(info, dict) or "index" not in info:
+            return
+        source = sources[info["index"]]
+        if source is not None and rank[role] >= rank[roles.get(source, "data")]:
+            roles[source] = role
+
+    for material in gltf.get("materials", []):
+        slots = dict(material.get("pbrMetallicRoughness", {}), **material)
+        for slot, info in slots.items():
+            if slot.endswith("Texture"):
+                visit(info, "color" if slot in COLOR_SLOTS else "normal" if slot in NORMAL_SLOTS else "data")
+    return roles
+
+
+def _srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(values):
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1 / 2.4) - 0.055)
+
+
+def resize_texture(pixels, size, role="color"):
+    """
+    Downscale a texture with filtering that suits its contents
+
+    Channels are resized separately in float with a Lanczos filter whose
+    support grows with the reduction, so every source texel contributes.
+    Color textures are filtered in linear light, with straight alpha
+    premultiplied to avoid dark fringes at transparent edges. Normal maps
+    are renormalized after filtering. Other textures (metallic-roughness,
+    occlusion) are filtered as stored.
+
+    Args:
+        pixels: uint8 numpy array of shape (h, w) or (h, w, channels)
+        size: Output (width, height)
+        role: "color", "normal" or "data"
+
+    Returns:
+        uint8 numpy array of shape (height, width, channels)
+    """
+    values = pixels.astype(np.float32) / 255
+    if values.ndim == 2:
+        values = values[:, :, None]
+    channels = values.shape[2]
+    alpha = channels in (2, 4)
+    color = channels - 1 if alpha else channels
+
+    if role == "color":
+        values[..., :color] = _srgb_to_linear(values[..., :color])
+        if alpha:
+            values[..., :color] *= values[..., color:]
+
+    resized = np.empty((size[1], size[0], channels), dtype=np.float32)
+    for channel in range(channels):
+        image = Image.fromarray(np.ascontiguousarray(values[..., channel]), mode="F")
+        resized[..., channel] = np.asarray(image.resize(size, Image.Resampling.LANCZOS))
+    np.clip(resized, 0, 1, out=resized)
+
+    if role == "color":
+        if alpha:
+            coverage = resized[..., color:]
+            np.divide(resized[..., :color], coverage, out=resized[..., :color], where=coverage > 1e-6)
+            np.clip(resized, 0, 1, out=resized)
+        resized[..., :color] = _linear_to_srgb(resized[..., :color])
+    elif role == "normal" and channels >= 3:
+        normals = resized[..., :3] * 2 - 1
+        length = np.linalg.norm(normals, axis=-1, keepdims=True)
+        resized[..., :3] = np.where(length > 1e-6, normals / np.maximum(length, 1e-6), normals) * 0.5 + 0.5
+    return np.rint(resized * 255).astype(np.uint8)
+
+
+def _psnr(reference, image):
+    error = np.mean((reference.astype(np.float32) - image.astype(np.float32)) ** 2)
+    return float("inf") if error == 0 else float(10 * np.log10(255 ** 2 / error))
+
+
+def _encode(pixels, image_format, quality, role):
+    # Returns (encoded bytes, PIL format name actually used)
+    if pixels.shape[2] in (2, 4) and pixels[..., -1].min() == 255:
+        # Opaque alpha carries nothing
+        pixels = pixels[..., :-1]
+    name = TEXTURE_FORMATS[image_format][0]
+    if name == "JPEG" and pixels.shape[2] in (2, 4):
+        # JPEG has no alpha channel
+        name = "PNG"
+    image = Image.fromarray(pixels[..., 0] if pixels.shape[2] == 1 else pixels)
+    output = io.BytesIO()
+    # Only color textures are chroma subsampled: in normal and data maps
+    # (metallic/roughness, occlusion) every channel is a separate quantity
+    if name == "JPEG":
+        image.save(output, "JPEG", quality=quality, optimize=True, subsampling=2 if role == "color" else 0)
+    elif name == "WEBP":
+        # Lossy WebP is always 4:2:0
+        image.save(output, "WEBP", quality=quality, method=4, lossless=role != "color")
+    else:
+        image.save(output, "PNG", optimize=True)
+    return output.getvalue(), name
+
+
+def _compress_image(data, role, image_format, quality, max_size):
+    image = Image.open(io.BytesIO(data))
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        if image.mode.startswith("I"):
+            # 16-bit images would lose precision
+            return None
+        image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+    original = np.asarray(image)
+    height, width = original.shape[:2]
+    scale = min(1.0, max_size / max(width, height)) if max_size else 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    pixels = original if original.ndim == 3 else original[:, :, None]
+    if size != (width, height):
+        pixels = resize_texture(pixels, size, role)
+    encoded, name = _encode(pixels, image_format, quality, role)
+
+    # Quality of the whole stage, compared at the original resolution
+    decoded = Image.open(io.BytesIO(encoded))
+    if size != (width, height):
+        decoded = decoded.resize((width, height), Image.Resampling.BICUBIC)
+    decoded = np.asarray(decoded)
+    reference = original if original.ndim == 3 else original[:, :, None]
+    decoded = decoded if decoded.ndim == 3 else decoded[:, :, None]
+    channels = min(reference.shape[2], decoded.shape[2], 3)
+    return {
+        "data": encoded,
+        "format": name,
+        "role": role,
+        "original_size": [width, height],
+        "size": list(size),
+        "psnr": round(_psnr(reference[..., :channels], decoded[..., :channels]), 2),
+    }
+
+
+def compress_textures(glb_path, output_path=None, image_format="jpeg", quality=90, max_size=0, workers=None):
+    """
+    Downscale and re-encode the textures embedded in a GLB file
+
+    Every embedded PNG/JPEG/WebP image is decoded, resized to at most
+    max_size on its longer side (see resize_texture), re-encoded, and the
+    BIN chunk is rebuilt with the new images in place of the old ones; the
+    other buffer views are copied unchanged. WebP images are referenced
+    through the EXT_texture_webp extension. Textures with transparency stay
+    PNG when JPEG is requested. An image that keeps its size is left as it
+    is when it is already in the requested format (so repeated runs don't
+    add generation loss) or when re-encoding would make it larger.
+
+    Args:
+        glb_path: GLB file to read
+        output_path: GLB file to write (default: replace glb_path)
+        image_format: Key of TEXTURE_FORMATS
+        quality: Encoder quality (1-100) for JPEG and WebP
+        max_size: Longest texture side in pixels (0 keeps the size)
+        workers: Threads encoding images in parallel (default: CPU count)
+
+    Returns:
+        dict: Report with the file sizes, the texture bytes before and
+            after, and per image its role, old and new size, format and
+            byte count, and the PSNR against the original
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if image_format not in TEXTURE_FORMATS:
+        raise ValueError(f"Unknown texture format: {image_format}")
+    start = time.perf_counter()
+    output_path = output_path or glb_path
+    input_bytes = os.path.getsize(glb_path)
+
+    with GLBFile(glb_path) as glb:
+        gltf = glb.json
+        roles = _texture_roles(gltf)
+        images = [(index, image) for index, image in enumerate(gltf.get("images", []))
+                  if "bufferView" in image and image.get("mimeType") in DECODABLE_TYPES]
+        originals = {index: glb.buffer_view(image["bufferView"]).tobytes() for index, image in images}
+
+        with ThreadPoolExecutor(max_workers=workers or min(len(images), os.cpu_count() or 1) or 1) as pool:
+            results = dict(zip(originals, pool.map(
+                lambda index: _compress_image(originals[index], roles.get(index, "color"),
+                                              image_format, quality, max_size), originals)))
+
+        replaced = {}
+        report_images = []
+        for index, image in images:
+            result = results[index]
+            original = originals[index]
+            unchanged = result is not None and result["size"] == result["original_size"]
+            if result is None or unchanged and (len(result["data"]) >= len(original)
+                                                or image["mimeType"] == TEXTURE_FORMATS[image_format][1]):
+                report_images.append({"image": index, "kept": True, "bytes": len(original)})
+                continue
+            replaced[image["bufferView"]] = result["data"]
+            _, mime_type, _ = next(entry for entry in TEXTURE_FORMATS.values() if entry[0] == result["format"])
+            image["mimeType"] = mime_type
+            report_images.append({
+                "image": index,
+                "role": result["role"],
+                "original_size": result["original_size"],
+                "size": result["size"],
+                "mime_type": mime_type,
+                "original_bytes": len(original),
+                "bytes": len(result["data"]),
+                "psnr": result["psnr"],
+            })
+
+        # Rebuild the BIN chunk, 4-byte aligned so every accessor stays aligned
+        views = gltf.get("bufferViews", [])
+        embedded = [i for i, view in enumerate(views) if view.get("buffer", 0) == 0]
+        lengths = [len(replaced[i]) if i in replaced else views[i]["byteLength"] for i in embedded]
+        offsets = np.concatenate([[0], np.cumsum([-(-length // 4) * 4 for length in lengths])]).astype(int)
+        binary = bytearray(int(offsets[-1]))
+        target = memoryview(binary)
+        for i, offset, length in zip(embedded, offsets, lengths):
+            data = replaced[i] if i in replaced else glb.buffer_view(i)
+            target[offset:offset + length] = data
+            del data
+            views[i]["byteOffset"] = int(offset)
+            views[i]["byteLength"] = length
+        target.release()
+        if gltf.get("buffers"):
+            gltf["buffers"][0]["byteLength"] = len(binary)
+
+    if any(image.get("mimeType") == "image/webp" for image in gltf.get("images", [])):
+        # Core glTF only allows PNG and JPEG as a texture source
+        webp = {index for index, image in enumerate(gltf["images"]) if image.get("mimeType") == "image/webp"}
+        for texture in gltf.get("textures", []):
+            if texture.get("source") in webp:
+                texture.setdefault("extensions", {})["EXT_texture_webp"] = {"source": texture.pop("source")}
+        for key in ("extensionsUsed", "extensionsRequired"):
+            gltf[key] = sorted(set(gltf.get(key, [])) | {"EXT_texture_webp"})
+
+    if replaced or output_path != glb_path:
+        temporary = f"{output_path}.tmp"
+        write_glb(temporary, gltf, binary)
+        os.replace(temporary, output_path)
+
+    texture_before = sum(len(data) for data in originals.values())
+    texture_after = sum(entry["bytes"] for entry in report_images)
+    return {
+        "format": image_format,
+        "quality": quality,
+        "max_size": max_size,
+        "input_bytes": input_bytes,
+        "output_bytes": os.path.getsize(output_path),
+        "texture_bytes_before": texture_before,
+        "texture_bytes_after": texture_after,
+        "seconds": round(time.perf_counter() - start, 3),
+        "images": report_images,
+    }
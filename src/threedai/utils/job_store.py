@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# Artifact index kept in each job directory so jobs survive restarts
+INDEX_NAME = "artifacts.json"
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Job:
+    """Output directory and artifact index of a single request"""
+
+    def __init__(self, job_id, path, created=None):
+        self.id = job_id
+        self.path = Path(path)
+        self.created = created or time.time()
+        self.last_access = self.created
+        self.artifacts = {}
+        # Active jobs are still being written and are never swept
+        self.active = True
+
+    def artifact_path(self, name, filename):
+        """
+        Register an artifact and return the path it should be written to
+
+        Args:
+            name: Artifact name used for lookups (e.g. "video")
+            filename: File name inside the job directory
+
+        Returns:
+            str: Path of the artifact
+        """
+        self.artifacts[name] = filename
+        with open(self.path / INDEX_NAME, 'w') as f:
+            json.dump(self.artifacts, f)
+        return str(self.path / filename)
+
+
+class JobStore:
+    """
+    Per-request output directories with time- and quota-based cleanup
+
+    Every job gets its own directory under ``root``. Jobs are removed once
+    they haven't been accessed for ``ttl`` seconds, and the least recently
+    used jobs are removed while the store is larger than ``max_bytes``. A
+    background sweeper runs the cleanup every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, root, ttl=24 * 3600, max_bytes=None, sweep_interval=60):
+        """
+        Args:
+            root: Directory holding the job directories
+            ttl: Seconds since last access after which a job expires
+            max_bytes: Disk quota for all jobs (None for no limit)
+            sweep_interval: Seconds between background sweeps
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._jobs = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = None
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        # Directories left by a previous run are tracked so they get swept
+        for entry in os.scandir(self.root):
+            if entry.is_dir():
+                mtime = entry.stat().st_mtime
+                job = Job(entry.name, entry.path, created=mtime)
+                job.active = False
+                try:
+                    with open(os.path.join(entry.path, INDEX_NAME)) as f:
+                        job.artifacts = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                self._jobs[entry.name] = job
+
+    def create_job(self, job_id=None):
+        """
+        Create a new job directory
+
+        Args:
+            job_id: Identifier to use (a random one is generated if None)
+
+        Returns:
+            Job: The new job, marked active until finish_job() is called
+        """
+        job_id = job_id or uuid.uuid4().hex
+        path = self.root / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        job = Job(job_id, path)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def finish_job(self, job_id):
+        """Mark a job as complete so it becomes eligible for cleanup"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.active = False
+                job.last_access = time.time()
+                self._sizes.pop(job_id, None)
+
+    def get_job(self, job_id):
+        """
+        Look up a job and record the access
+
+        Returns:
+            Job or None if the job doesn't exist (or was swept)
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.last_access = time.time()
+            return job
+
+    def get_path(self, job_id, name):
+        """
+        Path of a job artifact
+
+        Args:
+            job_id: Job identifier
+            name: Artifact name given to Job.artifact_path()
+
+        Returns:
+            str or None if the job or artifact doesn't exist
+        """
+        job = self.get_job(job_id)
+        if job is None or name not in job.artifacts:
+            return None
+        return str(job.path / job.artifacts[name])
+
+    def delete_job(self, job_id):
+        """Remove a job and its directory"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            self._sizes.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job.path, ignore_errors=True)
+
+    def sweep(self):
+        """
+        Remove expired jobs, then the least recently used ones over quota
+
+        Returns:
+            int: Number of jobs removed
+        """
+        now = time.time()
+        with self._lock:
+            idle = [job for job in self._jobs.values() if not job.active]
+        expired = [job.id for job in idle if now - job.last_access > self.ttl]
+        for job_id in expired:
+            self.delete_job(job_id)
+        removed = len(expired)
+
+        if self.max_bytes is not None:
+            with self._lock:
+                jobs = list(self._jobs.values())
+            # Finished jobs don't change, so their size is measured once
+            for job in jobs:
+                if job.active or job.id not in self._sizes:
+                    size = _dir_size(job.path)
+                    with self._lock:
+                        if job.id in self._jobs:
+                            self._sizes[job.id] = size
+            total = sum(self._sizes.get(job.id, 0) for job in jobs)
+            for job in sorted((j for j in jobs if not j.active), key=lambda j: j.last_access):
+                if total <= self.max_bytes:
+                    break
+                total -= self._sizes.get(job.id, 0)
+                self.delete_job(job.id)
+                removed += 1
+        return removed
+
+    def usage(self):
+        """Bytes on disk used by all jobs"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sum(_dir_size(job.path) for job in jobs)
+
+    def start_sweeper(self):
+        """Start the background cleanup thread (idempotent)"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="threedai-job-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background cleanup thread"""
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"Removed {removed} old jobs from {self.root}")
+            except Exception as e:
+                print(f"Error sweeping jobs: {e}")
@@ -0,0 +1,256 @@
+import numpy as np
+
+# Default welding distance, relative to the bounding box diagonal
+WELD_TOLERANCE = 1e-6
+
+# Bits per axis of a packed grid cell key
+_CELL_BITS = 21
+
+# Fibonacci hashing multiplier (2^64 / golden ratio)
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def hash_labels(keys):
+    """
+    Group equal integer keys with a vectorized open-addressing hash table
+
+    Every key is hashed into a table of at least twice its length and probes
+    linearly until it finds its own key or an empty slot. All keys probe in
+    lockstep, so each round is a handful of array operations and the number
+    of rounds is the longest probe sequence (a few at this load factor).
+    Unlike np.unique this does not sort, so it runs in O(n).
+
+    Args:
+        keys: int64 numpy array of shape (n,)
+
+    Returns:
+        numpy array of shape (n,): For every key, the index of the first
+            key in its group that claimed a slot (equal keys share the label)
+    """
+    keys = np.ascontiguousarray(keys, dtype=np.int64)
+    count = len(keys)
+    bits = max(int(2 * count).bit_length(), 4)
+    mask = (1 << bits) - 1
+    table = np.full(1 << bits, -1, dtype=np.int64)
+    slots = (keys.view(np.uint64) * _HASH_MULTIPLIER >> np.uint64(64 - bits)).astype(np.int64)
+
+    labels = np.empty(count, dtype=np.int64)
+    pending = np.arange(count)
+    while len(pending):
+        pending_slots = slots[pending]
+        empty = table[pending_slots] == -1
+        # Competing writers to the same slot: one of them wins
+        table[pending_slots[empty]] = pending[empty]
+        owners = table[pending_slots]
+        found = keys[owners] == keys[pending]
+        labels[pending[found]] = owners[found]
+        pending = pending[~found]
+        slots[pending] = (slots[pending] + 1) & mask
+    return labels
+
+
+def _compact(labels):
+    # Relabel representative indices to 0..k-1, in order of first appearance
+    representatives = np.flatnonzero(labels == np.arange(len(labels)))
+    remap = np.empty(len(labels), dtype=np.int64)
+    remap[representatives] = np.arange(len(representatives))
+    return remap[labels], representatives
+
+
+def _cell_keys(vertices, origin, cell_size):
+    cells = np.floor((vertices - origin) / cell_size).astype(np.int64)
+    np.clip(cells, 0, (1 << _CELL_BITS) - 1, out=cells)
+    return (cells[:, 0] << (2 * _CELL_BITS)) | (cells[:, 1] << _CELL_BITS) | cells[:, 2]
+
+
+def _weld_pass(vertices, origin, cell_size):
+    # Merge the vertices sharing a grid cell into their mean position
+    index, _ = _compact(hash_labels(_cell_keys(vertices, origin, cell_size)))
+    count = int(index.max()) + 1 if len(index) else 0
+    weights = np.bincount(index, minlength=count).astype(np.float64)
+    merged = np.empty((count, 3), dtype=np.float64)
+    for axis in range(3):
+        merged[:, axis] = np.bincount(index, weights=vertices[:, axis], minlength=count) / weights
+    return merged, index
+
+
+def weld_vertices(vertices, faces, epsilon=None):
+    """
+    Merge vertices closer than epsilon and drop the faces this collapses
+
+    Vertices are hashed into a grid of cells of size epsilon, and every cell
+    is replaced by the mean of its vertices. A second pass on a grid shifted
+    by half a cell merges near-duplicates that the first grid split across a
+    cell boundary. Both passes use hash_labels(), so the cost is linear in
+    the number of vertices.
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        epsilon: Welding distance. Defaults to WELD_TOLERANCE times the
+            bounding box diagonal.
+
+    Returns:
+        tuple: (vertices, faces, index) where index maps every input vertex
+            to its welded vertex
+    """
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(vertices) == 0:
+        return vertices, faces, np.zeros(0, dtype=np.int64)
+
+    origin = vertices.min(axis=0).astype(np.float64)
+    diagonal = float(np.linalg.norm(vertices.max(axis=0) - origin))
+    epsilon = epsilon or WELD_TOLERANCE * (diagonal or 1.0)
+    # Keep the packed cell keys within _CELL_BITS per axis
+    epsilon = max(epsilon, diagonal / ((1 << _CELL_BITS) - 2))
+
+    merged, index = _weld_pass(vertices, origin - epsilon, epsilon)
+    merged, second = _weld_pass(merged, origin - 1.5 * epsilon, epsilon)
+    index = second[index]
+
+    faces = index[faces]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+    return merged.astype(vertices.dtype, copy=False), faces[keep], index
+
+
+def _edge_keys(faces, vertex_count, directed=False):
+    # One int64 key per face edge, (a, b) with a < b unless directed
+    a = faces.reshape(-1)
+    b = faces[:, [1, 2, 0]].reshape(-1)
+    if not directed:
+        a, b = np.minimum(a, b), np.maximum(a, b)
+    return a * vertex_count + b
+
+
+def connected_components(faces, vertex_count):
+    """
+    Label the vertex-connected components of a mesh
+
+    Vectorized union-find: every round hooks the root of each face's
+    vertices onto the smallest root among them, then compresses the labels
+    by pointer jumping until every vertex points at its root.
+
+    Args:
+        faces: numpy array of shape (m, 3)
+        vertex_count: Number of vertices
+
+    Returns:
+        tuple: (component of every face, number of components with faces)
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    labels = np.arange(vertex_count)
+    while True:
+        roots = labels[faces]
+        smallest = roots.min(axis=1)
+        changed = roots != smallest[:, None]
+        if not changed.any():
+            break
+        np.minimum.at(labels, roots[changed], np.broadcast_to(smallest[:, None], roots.shape)[changed])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    face_labels, _ = _compact(hash_labels(labels[faces[:, 0]]))
+    return face_labels, int(face_labels.max()) + 1 if len(face_labels) else 0
+
+
+def analyze_mesh(vertices, faces):
+    """
+    Topology checks relevant for 3D printing
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+
+    Returns:
+        dict: Vertex and face counts, the number of boundary edges (used by
+            one face, i.e. holes), non-manifold edges (used by more than
+            two faces), connected components, whether the mesh is
+            watertight (every edge used by exactly two faces) and whether
+            its winding is consistent (no directed edge used twice)
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    vertex_count = len(vertices)
+    edge_labels = hash_labels(_edge_keys(faces, vertex_count))
+    uses = np.bincount(edge_labels, minlength=len(edge_labels))
+    uses = uses[uses > 0]
+    directed = hash_labels(_edge_keys(faces, vertex_count, directed=True))
+    _, components = connected_components(faces, vertex_count)
+
+    boundary = int(np.count_nonzero(uses == 1))
+    non_manifold = int(np.count_nonzero(uses > 2))
+    return {
+        "vertices": vertex_count,
+        "faces": len(faces),
+        "edges": len(uses),
+        "boundary_edges": boundary,
+        "non_manifold_edges": non_manifold,
+        "components": components,
+        "watertight": len(faces) > 0 and boundary == 0 and non_manifold == 0,
+        "consistent_winding": bool(np.all(directed == np.arange(len(directed)))),
+    }
+
+
+def remove_small_components(vertices, faces, min_faces=0, min_fraction=0.0):
+    """
+    Drop disconnected fragments and the vertices they leave unused
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        min_faces: Components with fewer faces are removed
+        min_fraction: Components with fewer than this fraction of all
+            faces are removed
+
+    Returns:
+        tuple: (vertices, faces, number of removed components)
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    labels, count = connected_components(faces, len(vertices))
+    sizes = np.bincount(labels, minlength=count)
+    threshold = max(min_faces, min_fraction * len(faces))
+    small = sizes < threshold
+    if not small.any():
+        return vertices, faces, 0
+    faces = faces[~small[labels]]
+
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces.reshape(-1)] = True
+    remap = np.cumsum(used) - 1
+    return vertices[used], remap[faces], int(np.count_nonzero(small))
+
+
+def prepare_for_print(vertices, faces, epsilon=None, min_fraction=0.0, min_faces=0):
+    """
+    Weld, optionally remove fragments, and analyze a mesh before STL export
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        epsilon: Welding distance (see weld_vertices)
+        min_fraction, min_faces: Fragment removal thresholds (see
+            remove_small_components); both 0 keeps every component
+
+    Returns:
+        tuple: (vertices, faces, report) where report holds the
+            analyze_mesh() results plus the input counts and the number of
+            welded vertices, collapsed faces and removed fragments
+    """
+    input_vertices, input_faces = len(vertices), len(faces)
+    vertices, faces, _ = weld_vertices(vertices, faces, epsilon)
+    welded_vertices, welded_faces = len(vertices), len(faces)
+    removed = 0
+    if min_fraction or min_faces:
+        vertices, faces, removed = remove_small_components(vertices, faces, min_faces, min_fraction)
+
+    report = analyze_mesh(vertices, faces)
+    report.update(
+        input_vertices=input_vertices,
+        input_faces=input_faces,
+        welded_vertices=input_vertices - welded_vertices,
+        collapsed_faces=input_faces - welded_faces,
+        removed_components=removed,
+    )
+    return vertices, faces, report
@@ -0,0 +1,320 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Fragments generated per batch of triangles; bounds the rasterizer's memory
+FRAGMENT_BATCH = 1 << 22
+
+# Meshes are decimated to about this many faces before turntable rendering
+PREVIEW_FACES = int(os.environ.get("THREEDAI_PREVIEW_FACES", "100000"))
+
+# Number of rendered images kept by the render cache
+CACHE_SIZE = int(os.environ.get("THREEDAI_RENDER_CACHE_SIZE", "64"))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def mesh_hash(vertices, faces):
+    """
+    Content hash of a mesh, used to key the render cache
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (vertices, faces):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+def normalize_mesh(vertices, radius=0.5):
+    """
+    Center a mesh at the origin and scale it into a sphere
+
+    The default radius keeps the whole mesh in view of the default orbit
+    camera (distance 2, 40 degree field of view) from every direction.
+
+    Returns:
+        numpy float32 array of shape (n, 3)
+    """
+    vertices = np.asarray(vertices, dtype=np.float32)
+    if len(vertices) == 0:
+        return vertices
+    center = (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+    centered = vertices - center
+    extent = np.sqrt((centered ** 2).sum(axis=1).max()) or 1.0
+    return centered * (radius / extent)
+
+
+def orbit_camera(yaw, pitch, radius=2.0):
+    """
+    Camera looking at the origin from a point on a sphere (Y up)
+
+    Args:
+        yaw: Rotation around the vertical axis in radians
+        pitch: Elevation in radians
+        radius: Distance from the origin
+
+    Returns:
+        tuple: (eye position, 3x3 rotation whose rows are the camera's
+            right, up and forward axes)
+    """
+    eye = radius * np.array([np.cos(pitch) * np.sin(yaw), np.sin(pitch), np.cos(pitch) * np.cos(yaw)])
+    forward = -eye / np.linalg.norm(eye)
+    right = np.cross(forward, [0.0, 1.0, 0.0])
+    if np.linalg.norm(right) < 1e-8:
+        right = np.array([1.0, 0.0, 0.0])
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+    return eye, np.stack([right, up, forward])
+
+
+def rasterize(vertices, faces, width, height, yaw=0.0, pitch=0.3, fov=40.0, radius=2.0):
+    """
+    Z-buffer rasterize a mesh with flat Lambert shading
+
+    Triangles are expanded to the pixel centers inside their screen bounding
+    boxes in large vectorized batches. Barycentric coverage and
+    perspective-correct depth are computed per fragment, and the nearest
+    fragment per pixel wins.
+
+    Args:
+        vertices: numpy array of shape (n, 3), already normalized
+        faces: numpy array of shape (m, 3)
+        width, height: Image size in pixels
+        yaw, pitch, radius: Camera orbit (see orbit_camera)
+        fov: Vertical field of view in degrees
+
+    Returns:
+        tuple: (shade of shape (height, width) in [0, 1], coverage mask)
+    """
+    eye, rotation = orbit_camera(yaw, pitch, radius)
+    cam = (np.asarray(vertices, dtype=np.float32) - eye.astype(np.float32)) @ rotation.T.astype(np.float32)
+    depth = cam[:, 2]
+    focal = (height / 2) / np.tan(np.radians(fov) / 2)
+    safe_depth = np.maximum(depth, 1e-6)
+    sx = width / 2 + focal * cam[:, 0] / safe_depth
+    sy = height / 2 - focal * cam[:, 1] / safe_depth
+
+    faces = np.asarray(faces)
+    # Drop triangles behind the camera
+    faces = faces[(depth[faces] > 1e-3).all(axis=1)]
+
+    # Two-sided headlight shading from the face normals
+    v0, v1, v2 = cam[faces[:, 0]], cam[faces[:, 1]], cam[faces[:, 2]]
+    normals = np.cross(v1 - v0, v2 - v0)
+    lengths = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+    light = np.array([0.3, 0.4, -1.0], dtype=np.float32)
+    light /= np.linalg.norm(light)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shade = 0.2 + 0.8 * np.abs(normals @ light) / lengths
+    shade = np.nan_to_num(shade, nan=0.2).astype(np.float32)
+
+    x = sx[faces].astype(np.float64)
+    y = sy[faces].astype(np.float64)
+    inv_z = (1.0 / safe_depth)[faces].astype(np.float64)
+
+    # Pixel centers (i + 0.5) covered by each triangle's bounding box
+    x_min = np.maximum(np.ceil(x.min(axis=1) - 0.5), 0)
+    x_max = np.minimum(np.floor(x.max(axis=1) - 0.5), width - 1)
+    y_min = np.maximum(np.ceil(y.min(axis=1) - 0.5), 0)
+    y_max = np.minimum(np.floor(y.max(axis=1) - 0.5), height - 1)
+    box_w = (x_max - x_min + 1).astype(np.int64)
+    box_h = (y_max - y_min + 1).astype(np.int64)
+
+    area2 = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+    visible = (box_w > 0) & (box_h > 0) & (np.abs(area2) > 1e-9)
+    index = np.nonzero(visible)[0]
+
+    # Barycentric coordinates and 1/z of each triangle as planes a*u + b*v + c
+    # over the pixel offsets (u, v) inside its box. 1/z is linear in screen
+    # space, which makes the depth test perspective correct.
+    x = x[index] - (x_min[index, None] + 0.5)
+    y = y[index] - (y_min[index, None] + 0.5)
+    area2 = area2[index]
+    planes = np.empty((len(index), 4, 3))
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        planes[:, i, 0] = -(y[:, k] - y[:, j]) / area2
+        planes[:, i, 1] = (x[:, k] - x[:, j]) / area2
+        planes[:, i, 2] = ((y[:, k] - y[:, j]) * x[:, j] - (x[:, k] - x[:, j]) * y[:, j]) / area2
+    planes[:, 3] = np.einsum('ti,tij->tj', inv_z[index], planes[:, :3])
+    # One contiguous array per coefficient makes the per-fragment gathers cheap
+    planes = np.ascontiguousarray(planes.reshape(len(index), 12).T, dtype=np.float32)
+
+    origin = (y_min[index] * width + x_min[index]).astype(np.int64)
+    box_w = box_w[index]
+    counts = box_w * box_h[index]
+    tri_shade = shade[index]
+
+    zbuffer = np.zeros(width * height, dtype=np.float32)
+    shade_buffer = np.zeros(width * height, dtype=np.float32)
+
+    # Rasterize in batches of about FRAGMENT_BATCH candidate pixels
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(index):
+        stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + FRAGMENT_BATCH, side='right')),
+                   start + 1)
+        n = counts[start:stop]
+        start_offset = ends[start] - counts[start]
+        t = np.repeat(np.arange(start, stop), n)
+        # Position of every candidate pixel inside its triangle's box
+        local = np.arange(n.sum()) - (np.repeat(ends[start:stop] - n, n) - start_offset)
+        start = stop
+        row, col = np.divmod(local, box_w[t])
+        u = col.astype(np.float32)
+        v = row.astype(np.float32)
+
+        inside = np.ones(len(t), dtype=bool)
+        for i in range(3):
+            w = planes[3 * i][t]
+            w *= u
+            w += planes[3 * i + 1][t] * v
+            w += planes[3 * i + 2][t]
+            inside &= w >= 0
+        t, u, v = t[inside], u[inside], v[inside]
+        pixel = origin[t] + row[inside] * width + col[inside]
+        frag_inv_z = planes[9][t] * u + planes[10][t] * v + planes[11][t]
+
+        np.maximum.at(zbuffer, pixel, frag_inv_z)
+        nearest = frag_inv_z >= zbuffer[pixel]
+        shade_buffer[pixel[nearest]] = tri_shade[t[nearest]]
+
+    mask = zbuffer > 0
+    return shade_buffer.reshape(height, width), mask.reshape(height, width)
+
+
+def render_mesh(vertices, faces, size=512, yaw=0.0, pitch=0.3, fov=40.0, color=(180, 185, 200),
+                background=(255, 255, 255), supersample=2, normalize=True, use_cache=True, mesh_key=None):
+    """
+    Render a shaded image of a mesh on the CPU
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        size: Output size in pixels, an int or (width, height)
+        yaw, pitch: Camera orbit in radians
+        fov: Vertical field of view in degrees
+        color: Base RGB color of the surface
+        background: RGB background color
+        supersample: Render at this multiple of the size and downsample
+        normalize: Center and scale the mesh into view first (see normalize_mesh)
+        use_cache: Reuse a previous render of the same mesh and view
+        mesh_key: Precomputed mesh_hash() of the arrays, to avoid rehashing
+            when rendering many views of one mesh
+
+    Returns:
+        numpy uint8 array of shape (height, width, 3)
+    """
+    width, height = (size, size) if np.isscalar(size) else size
+    key = None
+    if use_cache:
+        key = (mesh_key or mesh_hash(vertices, faces), width, height, round(float(yaw), 6), round(float(pitch), 6),
+               fov, tuple(color), tuple(background), supersample, normalize)
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    if normalize:
+        vertices = normalize_mesh(vertices)
+    shade, mask = rasterize(vertices, faces, width * supersample, height * supersample,
+                            yaw=yaw, pitch=pitch, fov=fov)
+
+    image = np.where(mask[..., None], shade[..., None] * np.asarray(color, dtype=np.float32),
+                     np.asarray(background, dtype=np.float32))
+    if supersample > 1:
+        image = image.reshape(height, supersample, width, supersample, 3).mean(axis=(1, 3))
+    image = np.clip(image + 0.5, 0, 255).astype(np.uint8)
+    image.setflags(write=False)
+
+    if key is not None:
+        with _cache_lock:
+            _cache[key] = image
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return image
+
+
+def render_views(vertices, faces, size=256, yaws=(np.pi / 4, 3 * np.pi / 4, 5 * np.pi / 4, 7 * np.pi / 4),
+                 pitch=0.4, columns=2, **kwargs):
+    """
+    Render several views of a mesh into one preview grid
+
+    Args:
+        vertices, faces: Mesh arrays
+        size: Size of each view in pixels
+        yaws: Camera yaw of each view in radians
+        pitch: Camera elevation in radians
+        columns: Views per row
+        **kwargs: Passed to render_mesh
+
+    Returns:
+        numpy uint8 array holding the grid
+    """
+    vertices = normalize_mesh(vertices)
+    key = mesh_hash(vertices, faces)
+    views = [render_mesh(vertices, faces, size=size, yaw=yaw, pitch=pitch, normalize=False,
+                         mesh_key=key, **kwargs)
+             for yaw in yaws]
+    rows = -(-len(views) // columns)
+    blank = np.full_like(views[0], 255)
+    views += [blank] * (rows * columns - len(views))
+    return np.concatenate([np.concatenate(views[r * columns:(r + 1) * columns], axis=1)
+                           for r in range(rows)], axis=0)
+
+
+def iter_turntable(vertices, faces, num_frames=300, size=512, workers=None, **kwargs):
+    """
+    Yield the frames of a turntable animation around a mesh
+
+    The camera follows the same orbit as the Trellis turntable: a full turn
+    of yaw with the pitch oscillating between -0.25 and 0.75 radians. Frames
+    render on a small thread pool (NumPy releases the GIL in the heavy
+    operations) and are yielded in order. They bypass the render cache,
+    which would otherwise be flushed by a single turntable.
+
+    Args:
+        vertices, faces: Mesh arrays
+        num_frames: Number of frames
+        size: Frame size in pixels
+        workers: Render threads (defaults to the CPU count, at most 4)
+        **kwargs: Passed to render_mesh
+
+    Yields:
+        numpy uint8 arrays of shape (size, size, 3)
+    """
+    vertices = normalize_mesh(vertices)
+    kwargs = {"background": (0, 0, 0), "supersample": 1, "use_cache": False, **kwargs}
+    angles = np.linspace(0, 2 * np.pi, num_frames)
+    views = zip(angles, 0.25 + 0.5 * np.sin(angles))
+    workers = workers or min(os.cpu_count() or 1, 4)
+
+    def render(view):
+        return render_mesh(vertices, faces, size=size, yaw=view[0], pitch=view[1], normalize=False, **kwargs)
+
+    if workers == 1:
+        for view in views:
+            yield render(view)
+        return
+    with ThreadPoolExecutor(workers, thread_name_prefix="threedai-rasterizer") as pool:
+        # Keep a few frames in flight ahead of the consumer
+        pending = deque()
+        for view in views:
+            pending.append(pool.submit(render, view))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+
+
+def hash_image(image):
+    """
+    Hash the content of an input image
+
+    Args:
+        image: PIL Image, path to an image file, or raw bytes
+
+    Returns:
+        str: hex sha256 digest
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        digest.update(image)
+    elif isinstance(image, (str, Path)):
+        with open(image, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    elif hasattr(image, 'tobytes'):
+        # PIL Image: the decoded pixels identify it regardless of source format
+        digest.update(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+    else:
+        raise TypeError(f"Cannot hash image of type {type(image)}")
+    return digest.hexdigest()
+
+
+def cache_key(image, backend, params=None):
+    """
+    Build the cache key for a generation request
+
+    Args:
+        image: Input image (see hash_image)
+        backend: Backend name
+        params: Dict of everything else that affects the output
+            (seed, sampler and postprocessing parameters)
+
+    Returns:
+        str: hex sha256 digest
+    """
+    payload = json.dumps({
+        "image": hash_image(image),
+        "backend": backend,
+        "params": params or {},
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed, content-addressed cache of generation results
+
+    Each entry is a directory holding the output files of one request plus a
+    manifest. Entries are assembled in a temporary directory and renamed into
+    place, so readers never see a partially written entry. When the total
+    size exceeds ``max_bytes`` the least recently used entries are removed.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        """
+        Args:
+            root: Directory holding the cache
+            max_bytes: Size cap in bytes (None for no limit)
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tmp_dir = self.root / ".tmp"
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._scan()
+
+    def _entry_dir(self, key):
+        return self.root / key[:2] / key
+
+    def _scan(self):
+        # Rebuild the LRU index from disk, oldest access first
+        found = []
+        for manifest in self.root.glob(f"*/*/{MANIFEST_NAME}"):
+            entry = manifest.parent
+            try:
+                with open(manifest) as f:
+                    size = json.load(f)["size"]
+                found.append((manifest.stat().st_mtime, entry.name, size))
+            except (OSError, ValueError, KeyError):
+                continue
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+
+    def get(self, key):
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key from cache_key()
+
+        Returns:
+            dict: Output name -> file path, or None on a miss
+        """
+        entry = self._entry_dir(key)
+        manifest = entry / MANIFEST_NAME
+        try:
+            with open(manifest) as f:
+                files = json.load(f)["files"]
+            # Record the access for LRU ordering across processes
+            os.utime(manifest)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+                self._entries.pop(key, None)
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = sum((entry / name).stat().st_size for name in files.values())
+        return {output: str(entry / name) for output, name in files.items()}
+
+    def put(self, key, files):
+        """
+        Store the outputs of a request
+
+        Args:
+            key: Cache key from cache_key()
+            files: Dict of output name -> path of the file to store
+                (None values are skipped)
+
+        Returns:
+            dict: Output name -> path of the cached copy
+        """
+        staging = self._tmp_dir / uuid.uuid4().hex
+        staging.mkdir()
+        try:
+            stored = {}
+            size = 0
+            for output, path in files.items():
+                if not path:
+                    continue
+                name = f"{output}{Path(path).suffix}"
+                shutil.copyfile(path, staging / name)
+                stored[output] = name
+                size += (staging / name).stat().st_size
+
+            with open(staging / MANIFEST_NAME, 'w') as f:
+                json.dump({"files": stored, "size": size}, f)
+
+            entry = self._entry_dir(key)
+            entry.parent.mkdir(exist_ok=True)
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # Another request stored the same result first
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict()
+        return {output: str(entry / name) for output, name in stored.items()}
+
+    def _evict(self):
+        # Caller holds self._lock
+        if self.max_bytes is None:
+            return
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            entry = self._entry_dir(key)
+            # Move the entry out of the lookup path before deleting it
+            trash = self._tmp_dir / f"evict-{uuid.uuid4().hex}"
+            try:
+                os.rename(entry, trash)
+                shutil.rmtree(trash, ignore_errors=True)
+            except OSError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Cache counters
+
+        Returns:
+            dict: hits, misses, evictions, entries and total bytes
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+            }
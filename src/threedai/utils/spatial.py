@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def morton_codes(positions, bits=10):
+    """
+    Morton (Z-order) codes of points within their bounding box
+
+    The coordinates are quantized to ``bits`` bits per axis and their bits
+    are interleaved, so sorting by code keeps nearby points close together.
+
+    Args:
+        positions: numpy array of shape (n, 3)
+        bits: Bits per axis (at most 21)
+
+    Returns:
+        uint64 numpy array of shape (n,)
+    """
+    low = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - low, 1e-12)
+    cells = ((positions - low) / extent * ((1 << bits) - 1)).astype(np.uint64)
+    codes = np.zeros(len(positions), dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
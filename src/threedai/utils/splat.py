@@ -0,0 +1,291 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from .spatial import morton_codes
+
+SPLAT_MAGIC = b'TDSP'
+SPLAT_VERSION = 1
+
+# Splats per chunk. Positions are quantized against the bounds of their
+# chunk, which after spatial sorting are much tighter than the global ones.
+SPLAT_CHUNK_SIZE = 4096
+
+# Zeroth-order spherical harmonic constant, converts SH DC terms to RGB
+SH_C0 = 0.28209479177387814
+
+# One quantized splat (17 bytes)
+SPLAT_DTYPE = np.dtype([
+    ('position', '<u2', (3,)),
+    ('scale', 'u1', (3,)),
+    ('rotation', 'u1', (4,)),
+    ('color', 'u1', (3,)),
+    ('opacity', 'u1'),
+])
+
+# Per-chunk position bounds
+CHUNK_DTYPE = np.dtype([('min', '<f4', (3,)), ('max', '<f4', (3,))])
+
+_HEADER = struct.Struct('<4sIQII')  # magic, version, count, chunk size, metadata length
+
+
+def _quantize(values, low, high, levels):
+    scale = np.where(high > low, (levels - 1) / np.maximum(high - low, 1e-30), 0)
+    return np.clip(np.rint((values - low) * scale), 0, levels - 1)
+
+
+def _dequantize(values, low, high, levels):
+    return low + values.astype(np.float32) * ((high - low) / (levels - 1))
+
+
+def write_splat(path, gaussians, sort=True, chunk_size=SPLAT_CHUNK_SIZE):
+    """
+    Write Gaussian splats to a compact quantized container
+
+    Positions are stored as 16-bit offsets within the bounds of their chunk,
+    log-scales and SH DC colors as 8 bits within their global ranges,
+    rotations as 8-bit normalized quaternions and opacity as 8 bits. That is
+    17 bytes per splat instead of 68 for a float PLY.
+
+    Args:
+        path: Output file
+        gaussians: Dict of arrays: positions (n, 3), scales (n, 3, positive),
+            rotations (n, 4, wxyz quaternions), colors (n, 3, SH DC terms)
+            and opacities (n,) in [0, 1]
+        sort: Reorder splats along a Morton curve so nearby splats are
+            stored together (tighter chunks, local reads)
+        chunk_size: Splats per chunk
+
+    Returns:
+        numpy array: The order in which the input splats were written
+    """
+    positions = np.asarray(gaussians["positions"], dtype=np.float32)
+    count = len(positions)
+    order = np.argsort(morton_codes(positions), kind='stable') if sort and count else np.arange(count)
+
+    records = np.empty(count, dtype=SPLAT_DTYPE)
+    positions = positions[order]
+
+    # Position bounds per chunk
+    chunk_count = -(-count // chunk_size)
+    padded = np.full((chunk_count * chunk_size, 3), np.nan, dtype=np.float32)
+    padded[:count] = positions
+    padded = padded.reshape(chunk_count, chunk_size, 3)
+    chunks = np.empty(chunk_count, dtype=CHUNK_DTYPE)
+    chunks['min'] = np.nanmin(padded, axis=1)
+    chunks['max'] = np.nanmax(padded, axis=1)
+    chunk_of = np.arange(count) // chunk_size
+    records['position'] = _quantize(positions, chunks['min'][chunk_of], chunks['max'][chunk_of], 1 << 16)
+
+    log_scales = np.log(np.maximum(np.asarray(gaussians["scales"], dtype=np.float32)[order], 1e-12))
+    colors = np.asarray(gaussians["colors"], dtype=np.float32).reshape(count, 3)[order]
+    ranges = {
+        "log_scale": [float(log_scales.min()) if count else 0.0, float(log_scales.max()) if count else 0.0],
+        "color": [float(colors.min()) if count else 0.0, float(colors.max()) if count else 0.0],
+    }
+    records['scale'] = _quantize(log_scales, *ranges["log_scale"], 256)
+    records['color'] = _quantize(colors, *ranges["color"], 256)
+
+    rotations = np.asarray(gaussians["rotations"], dtype=np.float32)[order]
+    rotations = rotations / np.maximum(np.linalg.norm(rotations, axis=1, keepdims=True), 1e-12)
+    # q and -q are the same rotation; keep w >= 0
+    rotations *= np.where(rotations[:, :1] < 0, -1, 1)
+    records['rotation'] = _quantize(rotations, -1.0, 1.0, 256)
+    records['opacity'] = _quantize(np.asarray(gaussians["opacities"], dtype=np.float32).reshape(-1)[order],
+                                   0.0, 1.0, 256)
+
+    metadata = json.dumps({"ranges": ranges, "sorted": bool(sort)}).encode()
+    with open(path, 'wb') as fp:
+        fp.write(_HEADER.pack(SPLAT_MAGIC, SPLAT_VERSION, count, chunk_size, len(metadata)))
+        fp.write(metadata)
+        fp.write(chunks.tobytes())
+        fp.write(records.tobytes())
+    return order
+
+
+class SplatFile:
+    """
+    Memory-mapped reader for files written by write_splat()
+
+    Nothing is decoded up front; read() dequantizes any range of splats and
+    iter_chunks() streams the file in chunk-sized pieces.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            magic, version, self.count, self.chunk_size, meta_length = _HEADER.unpack(fp.read(_HEADER.size))
+            if magic != SPLAT_MAGIC:
+                raise ValueError(f"Not a splat file: {path}")
+            if version != SPLAT_VERSION:
+                raise ValueError(f"Unsupported splat file version {version}")
+            self.metadata = json.loads(fp.read(meta_length))
+        offset = _HEADER.size + meta_length
+        chunk_count = -(-self.count // self.chunk_size)
+        self.chunks = np.memmap(path, dtype=CHUNK_DTYPE, mode='r', offset=offset, shape=(chunk_count,))
+        offset += CHUNK_DTYPE.itemsize * chunk_count
+        self.records = np.memmap(path, dtype=SPLAT_DTYPE, mode='r', offset=offset, shape=(self.count,))
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for name in ("records", "chunks"):
+            array = getattr(self, name, None)
+            if array is not None and getattr(array, "_mmap", None) is not None:
+                array._mmap.close()
+            setattr(self, name, None)
+
+    def read(self, start=0, stop=None):
+        """
+        Decode splats [start, stop)
+
+        Returns:
+            dict: positions, scales, rotations, colors (SH DC) and opacities
+                as float32 arrays, in the layout accepted by write_splat()
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        records = self.records[start:stop]
+        chunk_of = np.arange(start, stop) // self.chunk_size
+        ranges = self.metadata["ranges"]
+        rotations = _dequantize(records['rotation'], -1.0, 1.0, 256)
+        rotations /= np.maximum(np.linalg.norm(rotations, axis=1, keepdims=True), 1e-12)
+        return {
+            "positions": _dequantize(records['position'], self.chunks['min'][chunk_of],
+                                     self.chunks['max'][chunk_of], 1 << 16),
+            "scales": np.exp(_dequantize(records['scale'], *ranges["log_scale"], 256)),
+            "rotations": rotations,
+            "colors": _dequantize(records['color'], *ranges["color"], 256),
+            "opacities": _dequantize(records['opacity'], 0.0, 1.0, 256),
+        }
+
+    def iter_chunks(self, size=None):
+        """Yield decoded dicts of at most ``size`` splats (default: one chunk)"""
+        size = size or self.chunk_size
+        for start in range(0, self.count, size):
+            yield self.read(start, start + size)
+
+    def rgb(self, start=0, stop=None):
+        """Display colors in [0, 1] derived from the SH DC terms"""
+        return np.clip(0.5 + SH_C0 * self.read(start, stop)["colors"], 0, 1)
+
+
+def read_splat(path):
+    """Decode a whole splat file into memory (see SplatFile.read)"""
+    with SplatFile(path) as splats:
+        return splats.read()
+
+
+def read_gaussian_ply(path):
+    """
+    Read a 3D Gaussian splatting PLY (as written by Trellis' save_ply)
+
+    Scales and opacities are stored pre-activation in these files; they are
+    returned activated (exp and sigmoid), in the layout of write_splat().
+    Higher-order SH coefficients are ignored.
+    """
+    with open(path, 'rb') as fp:
+        header = []
+        while True:
+            line = fp.readline().decode('ascii').strip()
+            header.append(line)
+            if line == "end_header":
+                break
+        offset = fp.tell()
+    if "format binary_little_endian 1.0" not in header:
+        raise ValueError(f"Only binary little-endian PLY files are supported: {path}")
+
+    types = {"float": '<f4', "double": '<f8', "uchar": 'u1', "int": '<i4', "uint": '<u4'}
+    fields = []
+    count = 0
+    in_vertex = False
+    for line in header:
+        parts = line.split()
+        if parts[:2] == ["element", "vertex"]:
+            count, in_vertex = int(parts[2]), True
+        elif parts[:1] == ["element"]:
+            in_vertex = False
+        elif in_vertex and parts[:1] == ["property"]:
+            fields.append((parts[2], types[parts[1]]))
+    data = np.fromfile(path, dtype=np.dtype(fields), count=count, offset=offset)
+
+    def stack(names):
+        return np.stack([data[name] for name in names], axis=1).astype(np.float32)
+
+    return {
+        "positions": stack(["x", "y", "z"]),
+        "scales": np.exp(stack(["scale_0", "scale_1", "scale_2"])),
+        "rotations": stack(["rot_0", "rot_1", "rot_2", "rot_3"]),
+        "colors": stack(["f_dc_0", "f_dc_1", "f_dc_2"]),
+        "opacities": 1 / (1 + np.exp(-data["opacity"].astype(np.float32))),
+    }
+
+
+def quantization_report(original, decoded, order=None):
+    """
+    Error of a quantized splat file against the full-precision splats
+
+    Args:
+        original: Dict of arrays passed to write_splat()
+        decoded: Dict from read_splat() of the written file
+        order: Order returned by write_splat() (None if unsorted)
+
+    Returns:
+        dict: Per attribute the maximum and RMS error. Positions are also
+            given relative to the scene extent, scales as relative error,
+            rotations as angles in degrees and colors in 8-bit RGB steps.
+    """
+    def pick(name):
+        values = np.asarray(original[name], dtype=np.float64)
+        values = values.reshape(len(values), -1)
+        return values if order is None else values[order]
+
+    def summary(errors):
+        errors = np.asarray(errors, dtype=np.float64)
+        return {"max": float(errors.max()) if errors.size else 0.0,
+                "rms": float(np.sqrt(np.mean(errors ** 2))) if errors.size else 0.0}
+
+    positions = pick("positions")
+    extent = float(np.ptp(positions, axis=0).max()) if len(positions) else 1.0
+    position_error = np.linalg.norm(decoded["positions"] - positions, axis=1)
+
+    rotations = pick("rotations")
+    rotations /= np.maximum(np.linalg.norm(rotations, axis=1, keepdims=True), 1e-12)
+    decoded_rotations = decoded["rotations"] / np.maximum(
+        np.linalg.norm(decoded["rotations"], axis=1, keepdims=True), 1e-12)
+    dots = np.clip(np.abs(np.einsum('ij,ij->i', rotations, decoded_rotations)), 0, 1)
+
+    return {
+        "count": len(positions),
+        "position": summary(position_error),
+        "position_relative": summary(position_error / (extent or 1.0)),
+        "scale_relative": summary(np.abs(decoded["scales"] / pick("scales") - 1)),
+        "rotation_degrees": summary(np.degrees(2 * np.arccos(dots))),
+        "color_rgb": summary(np.abs(decoded["colors"] - pick("colors")) * SH_C0 * 255),
+        "opacity": summary(np.abs(decoded["opacities"] - pick("opacities").reshape(-1))),
+    }
+
+
+def ply_to_splat(ply_path, splat_path, sort=True):
+    """
+    Convert a Gaussian splatting PLY to the quantized container
+
+    Returns:
+        dict: Sizes, compression ratio and the quantization_report()
+    """
+    gaussians = read_gaussian_ply(ply_path)
+    order = write_splat(splat_path, gaussians, sort=sort)
+    report = quantization_report(gaussians, read_splat(splat_path), order)
+    report.update(
+        ply_bytes=os.path.getsize(ply_path),
+        splat_bytes=os.path.getsize(splat_path),
+        compression=os.path.getsize(ply_path) / os.path.getsize(splat_path),
+    )
+    return report
@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def synthetic_mesh(faces):
+    """
+    Closed latitude/longitude sphere with about the given number of faces
+
+    Returns:
+        tuple: (float32 vertices of shape (n, 3), uint32 faces of shape (m, 3))
+    """
+    rows = max(int(np.sqrt(faces / 4)), 2)
+    cols = max(faces // (2 * rows), 3)
+    theta = np.linspace(0, np.pi, rows + 1)
+    phi = np.linspace(0, 2 * np.pi, cols, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.stack([np.sin(t) * np.cos(p), np.cos(t), np.sin(t) * np.sin(p)], axis=-1)
+    # Small deterministic bumps so the normals aren't trivially regular
+    vertices *= (1 + 0.05 * np.sin(5 * t) * np.cos(7 * p))[..., None]
+
+    r, c = np.meshgrid(np.arange(rows), np.arange(cols), indexing='ij')
+    a = r * cols + c
+    b = r * cols + (c + 1) % cols
+    quads = np.stack([a, a + cols, b + cols, b], axis=-1).reshape(-1, 4)
+    faces = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+    return vertices.reshape(-1, 3).astype(np.float32), faces.astype(np.uint32)
@@ -0,0 +1,340 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Tracing is off unless one of these is set. When it is off, span() returns a
+# shared no-op object and costs one attribute check.
+TRACE_FILE = os.environ.get("THREEDAI_TRACE_FILE")
+METRICS_PORT = int(os.environ.get("THREEDAI_METRICS_PORT", "0"))
+ENABLED = bool(TRACE_FILE or METRICS_PORT or os.environ.get("THREEDAI_TRACE"))
+
+# Finished spans kept in memory for the Chrome trace export
+MAX_SPANS = int(os.environ.get("THREEDAI_TRACE_MAX_SPANS", "100000"))
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Span attributes that are added up into Prometheus counters
+COUNTED_ATTRIBUTES = ("bytes", "faces", "frames")
+
+
+def _current_rss():
+    # Resident set size in bytes (Linux), or the peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _cuda():
+    # torch is only consulted if something else already imported it
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    A timed stage, used as a context manager
+
+    Attributes such as input sizes can be attached with set() while the span
+    is open. On exit the span records its duration, the process RSS and, if
+    CUDA is in use, the peak GPU memory allocated during the span.
+    """
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.thread = threading.get_ident()
+        self.start = None
+        self.duration = None
+        self.error = None
+        self.gpu_peak = 0
+        # Process that recorded the span, if not this one (see Tracer.merge)
+        self.pid = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        cuda = _cuda()
+        if cuda is not None:
+            self.tracer._open_gpu_span(self, cuda)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.attributes["rss_bytes"] = _current_rss()
+        cuda = _cuda()
+        if cuda is not None:
+            self.attributes["gpu_peak_bytes"] = self.tracer._close_gpu_span(self, cuda)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans and aggregates them into Prometheus metrics
+
+    Metrics per span name: a duration histogram, a count of failed spans and
+    totals of the bytes/faces/frames attributes.
+    """
+
+    def __init__(self, enabled=ENABLED, max_spans=MAX_SPANS):
+        self.enabled = enabled
+        self._origin = time.perf_counter()
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._errors = {}
+        self._totals = {}
+        # Spans measuring the (process-wide) CUDA peak memory counter
+        self._gpu_spans = set()
+        self._gpu_lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        """
+        Open a span
+
+        Args:
+            name: Stage name (e.g. "sample", "glb_to_stl")
+            **attributes: Sizes or other details recorded with the span
+
+        Returns:
+            Span, or a no-op stand-in when tracing is disabled
+        """
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attributes)
+
+    def _open_gpu_span(self, span, cuda):
+        # Every span restarts the peak counter at its start. The peak reached
+        # since the previous restart is passed on to the spans still open
+        # first, so nested and concurrent spans keep their own peaks.
+        with self._gpu_lock:
+            peak = cuda.max_memory_allocated()
+            for other in self._gpu_spans:
+                other.gpu_peak = max(other.gpu_peak, peak)
+            cuda.reset_peak_memory_stats()
+            self._gpu_spans.add(span)
+
+    def _close_gpu_span(self, span, cuda):
+        with self._gpu_lock:
+            self._gpu_spans.discard(span)
+            span.gpu_peak = max(span.gpu_peak, cuda.max_memory_allocated())
+            return span.gpu_peak
+
+    def _finish(self, span):
+        with self._lock:
+            self._spans.append(span)
+            counts = self._histograms.setdefault(span.name, [0] * (len(HISTOGRAM_BUCKETS) + 1) + [0.0])
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if span.duration <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += span.duration
+            if span.error:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    key = (attribute, span.name)
+                    self._totals[key] = self._totals.get(key, 0) + value
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def take_records(self):
+        """
+        Remove the finished spans and return them as picklable records
+
+        Worker processes use this to hand their spans to the server's tracer
+        (see merge). Start times are converted to wall-clock time, since
+        perf_counter() values are not comparable across processes.
+        """
+        with self._lock:
+            spans = list(self._spans)
+            self._spans.clear()
+        offset = time.time() - time.perf_counter()
+        return [(span.name, span.start + offset, span.duration, span.attributes, span.thread, span.error)
+                for span in spans]
+
+    def merge(self, records, pid=None):
+        """
+        Add spans recorded by another process
+
+        Args:
+            records: Records returned by that process' take_records()
+            pid: Process id shown for the spans in the Chrome trace
+        """
+        if not self.enabled:
+            return
+        offset = time.perf_counter() - time.time()
+        for name, start, duration, attributes, thread, error in records:
+            span = Span(self, name, attributes)
+            span.start = start + offset
+            span.duration = duration
+            span.thread = thread
+            span.error = error
+            span.pid = pid
+            self._finish(span)
+
+    def chrome_trace(self):
+        """
+        Finished spans in the Chrome trace event format
+
+        Load the JSON in chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        events = []
+        for span in self.spans():
+            args = dict(span.attributes)
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": span.pid or pid,
+                "tid": span.thread,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        """Write the finished spans to a Chrome trace JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP threedai_stage_seconds Duration of pipeline stages",
+            "# TYPE threedai_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {name: list(counts) for name, counts in self._histograms.items()}
+            errors = dict(self._errors)
+            totals = dict(self._totals)
+        for name, counts in sorted(histograms.items()):
+            for bound, count in zip(HISTOGRAM_BUCKETS, counts):
+                lines.append(f'threedai_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'threedai_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {counts[-2]}')
+            lines.append(f'threedai_stage_seconds_count{{stage="{name}"}} {counts[-2]}')
+            lines.append(f'threedai_stage_seconds_sum{{stage="{name}"}} {counts[-1]}')
+
+        lines += ["# HELP threedai_stage_errors_total Stages that raised an exception",
+                  "# TYPE threedai_stage_errors_total counter"]
+        for name, count in sorted(errors.items()):
+            lines.append(f'threedai_stage_errors_total{{stage="{name}"}} {count}')
+
+        for attribute in COUNTED_ATTRIBUTES:
+            lines += [f"# HELP threedai_{attribute}_total Total {attribute} processed per stage",
+                      f"# TYPE threedai_{attribute}_total counter"]
+            for (counted, name), value in sorted(totals.items()):
+                if counted == attribute:
+                    lines.append(f'threedai_{attribute}_total{{stage="{name}"}} {value}')
+
+        lines += ["# HELP threedai_process_resident_bytes Resident memory of the process",
+                  "# TYPE threedai_process_resident_bytes gauge",
+                  f"threedai_process_resident_bytes {_current_rss()}"]
+        return "\n".join(lines) + "\n"
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """Return the process-wide tracer"""
+    return _tracer
+
+
+def span(name, **attributes):
+    """Open a span on the process-wide tracer (see Tracer.span)"""
+    return _tracer.span(name, **attributes)
+
+
+def start_metrics_server(port=None, host="0.0.0.0", tracer=None):
+    """
+    Serve the tracer's metrics at /metrics on a separate HTTP port
+
+    Args:
+        port: Port to listen on (defaults to THREEDAI_METRICS_PORT)
+        host: Interface to bind
+        tracer: Tracer to expose (defaults to the process-wide one)
+
+    Returns:
+        ThreadingHTTPServer running on a daemon thread
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    tracer = tracer or _tracer
+    tracer.enabled = True
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port or METRICS_PORT), Handler)
+    threading.Thread(target=server.serve_forever, name="threedai-metrics", daemon=True).start()
+    return server
+
+
+def setup_from_env():
+    """
+    Start the exporters requested through the environment
+
+    THREEDAI_METRICS_PORT starts the metrics server and THREEDAI_TRACE_FILE
+    writes a Chrome trace when the process exits.
+    """
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"Serving metrics on port {METRICS_PORT}")
+    if TRACE_FILE:
+        import atexit
+
+        atexit.register(_tracer.export_chrome_trace, TRACE_FILE)
@@ -0,0 +1,154 @@
+import queue
+import threading
+
+import numpy as np
+
+_STOP = object()
+
+
+def _resize(frame, size):
+    from PIL import Image
+
+    if (frame.shape[1], frame.shape[0]) == tuple(size):
+        return frame
+    return np.asarray(Image.fromarray(np.ascontiguousarray(frame)).resize(tuple(size), Image.BILINEAR))
+
+
+class StreamingVideoWriter:
+    """
+    Video writer that encodes on a background thread
+
+    Frames passed to write() go through a bounded queue to an encoder
+    thread, so rendering the next frame overlaps with encoding the previous
+    ones and at most ``queue_size`` frames are held in memory. write()
+    blocks while the queue is full.
+
+    Frames must not be modified after they are written; producers that
+    reuse a buffer should pass a copy.
+    """
+
+    def __init__(self, path, fps=30, size=None, codec="libx264", quality=None, queue_size=8):
+        """
+        Args:
+            path: Output video path
+            fps: Frames per second
+            size: Output (width, height); frames are resized if they differ.
+                None keeps the size of the frames.
+            codec: ffmpeg codec name
+            quality: imageio/ffmpeg quality (0-10, None for the codec default)
+            queue_size: Frames buffered between the producer and the encoder
+        """
+        self.path = str(path)
+        self.fps = fps
+        self.size = size
+        self.codec = codec
+        self.quality = quality
+        self.frame_count = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._encode, name="threedai-video-encoder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, frame):
+        """
+        Queue an HxWx3 uint8 RGB frame for encoding
+
+        Raises:
+            RuntimeError: If the encoder thread has failed
+        """
+        if self._error is not None:
+            raise RuntimeError(f"Video encoding failed: {self._error}") from self._error
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        while True:
+            try:
+                self._queue.put(frame, timeout=0.5)
+                break
+            except queue.Full:
+                # Don't block forever if the encoder died while the queue was full
+                if not self._thread.is_alive():
+                    raise RuntimeError(f"Video encoding failed: {self._error}")
+        self.frame_count += 1
+
+    def close(self):
+        """Flush the queued frames and finish the file"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Video encoding failed: {self._error}") from self._error
+
+    def _open(self, first_frame):
+        height, width = first_frame.shape[:2]
+        size = tuple(self.size) if self.size else (width, height)
+        try:
+            import imageio
+
+            writer = imageio.get_writer(self.path, fps=self.fps, codec=self.codec,
+                                        quality=self.quality, macro_block_size=2)
+            return size, writer.append_data, writer.close
+        except (ImportError, ValueError, RuntimeError) as e:
+            import cv2
+
+            # Without imageio or its ffmpeg plugin (imageio raises ValueError
+            # or RuntimeError when no backend can write the file) fall back
+            # to OpenCV's MPEG-4 writer
+            print(f"imageio cannot write {self.path} ({e}), using OpenCV's MPEG-4 writer")
+            writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'mp4v'), float(self.fps), size)
+            return size, lambda frame: writer.write(frame[:, :, ::-1]), writer.release
+
+    def _encode(self):
+        append = close = None
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is _STOP:
+                    break
+                frame = np.asarray(frame, dtype=np.uint8)
+                if append is None:
+                    size, append, close = self._open(frame)
+                append(_resize(frame, size))
+        except Exception as e:
+            self._error = e
+            # Drain so a blocked producer can finish
+            while True:
+                try:
+                    if self._queue.get_nowait() is _STOP:
+                        break
+                except queue.Empty:
+                    break
+        finally:
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    self._error = self._error or e
+
+
+def encode_frames(frames, path, fps=30, size=None, codec="libx264", quality=None, queue_size=8):
+    """
+    Encode frames from an iterable (e.g. a render generator) to a video
+
+    Args:
+        frames: Iterable of HxWx3 uint8 RGB frames
+        path: Output video path
+        fps, size, codec, quality, queue_size: See StreamingVideoWriter
+
+    Returns:
+        int: Number of frames written
+    """
+    with StreamingVideoWriter(path, fps=fps, size=size, codec=codec,
+                              quality=quality, queue_size=queue_size) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.frame_count
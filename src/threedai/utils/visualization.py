@@ -1,8 +1,140 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import cv2
 from PIL import Image
 import io
+from pathlib import Path
+
+# cv2 and matplotlib are imported inside the functions that need them, so
+# importing this module stays cheap
+
+# Files previewed with the built-in rasterizer instead of OCC
+MESH_EXTENSIONS = {".stl", ".glb", ".obj", ".ply"}
+
+def load_mesh(model_path):
+    """
+    Load the triangles of a mesh file as vertex and face arrays
+    
+    STL and GLB files are read natively; other formats (and GLB files the
+    native reader doesn't support) go through trimesh.
+    
+    Args:
+        model_path: Path to the mesh file
+        
+    Returns:
+        tuple: (vertices of shape (n, 3), faces of shape (m, 3))
+    """
+    suffix = Path(model_path).suffix.lower()
+    if suffix == ".stl":
+        from .format_converter import read_stl
+
+        triangles, _ = read_stl(model_path)
+        vertices = triangles.reshape(-1, 3)
+        return vertices, np.arange(len(vertices)).reshape(-1, 3)
+    if suffix == ".glb":
+        from .glb import load_glb_mesh
+
+        try:
+            return load_glb_mesh(model_path)
+        except (ValueError, KeyError):
+            pass
+
+    import trimesh
+
+    mesh = trimesh.load(str(model_path), force='mesh')
+    return np.asarray(mesh.vertices), np.asarray(mesh.faces)
+
+def iter_preview_frames(model_path, num_frames=300, size=512, max_faces=None):
+    """
+    Render a turntable of a mesh file on the CPU, one frame at a time
+    
+    Args:
+        model_path: Path to the mesh file (see load_mesh)
+        num_frames: Number of frames
+        size: Frame size in pixels
+        max_faces: Decimate larger meshes to this many faces first
+            (defaults to rasterizer.PREVIEW_FACES)
+        
+    Yields:
+        numpy uint8 arrays of shape (size, size, 3)
+    """
+    from . import rasterizer
+
+    vertices, faces = load_mesh(model_path)
+    max_faces = max_faces or rasterizer.PREVIEW_FACES
+    if len(faces) > max_faces:
+        from .decimation import decimate
+
+        vertices, faces, _ = decimate(vertices, faces, target_faces=max_faces)
+    yield from rasterizer.iter_turntable(vertices, faces, num_frames=num_frames, size=size)
+
+def voxels_to_mesh(coords, resolution=64):
+    """
+    Surface of a set of occupied voxels, for previews
+
+    Only faces between an occupied and an empty voxel are emitted, each as
+    two triangles. Voxels are unit cubes mapped into [-0.5, 0.5]^3.
+
+    Args:
+        coords: Integer array of shape (n, 3) of voxel indices
+        resolution: Grid size along each axis
+
+    Returns:
+        tuple: (float32 vertices of shape (k, 3), int64 faces of shape (m, 3))
+    """
+    coords = np.asarray(coords, dtype=np.int64)
+    grid = np.zeros((resolution + 2,) * 3, dtype=bool)
+    grid[tuple((coords + 1).T)] = True
+    occupied = np.argwhere(grid)
+
+    # Corner offsets of the face on the positive side of each axis, in order
+    quads = {
+        0: [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)],
+        1: [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)],
+        2: [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)],
+    }
+    corners = []
+    for axis, quad in quads.items():
+        for direction in (1, -1):
+            step = np.zeros(3, dtype=np.int64)
+            step[axis] = direction
+            neighbors = occupied + step
+            exposed = occupied[~grid[tuple(neighbors.T)]]
+            offsets = np.array(quad)
+            if direction < 0:
+                # The opposite face, wound the other way
+                offsets = offsets[::-1].copy()
+                offsets[:, axis] = 0
+            corners.append(exposed[:, None, :] + offsets[None])
+    corners = np.concatenate(corners).reshape(-1, 3)
+    vertices = ((corners - 1) / resolution - 0.5).astype(np.float32)
+    quad_index = np.arange(len(corners)).reshape(-1, 4)
+    faces = np.concatenate([quad_index[:, [0, 1, 2]], quad_index[:, [0, 2, 3]]])
+    return vertices, faces
+
+
+def save_mesh_preview(vertices, faces, output_path, size=400, max_faces=None):
+    """
+    Render four views of a mesh into a PNG image on the CPU
+
+    Args:
+        vertices: numpy array of shape (n, 3)
+        faces: numpy array of shape (m, 3)
+        output_path: Path of the PNG file
+        size: Width and height of the image (a 2x2 grid of views)
+        max_faces: Decimate larger meshes to this many faces first
+            (defaults to rasterizer.PREVIEW_FACES)
+
+    Returns:
+        str: output_path
+    """
+    from . import rasterizer
+
+    max_faces = max_faces or rasterizer.PREVIEW_FACES
+    if len(faces) > max_faces:
+        from .decimation import decimate
+
+        vertices, faces, _ = decimate(vertices, faces, target_faces=max_faces)
+    Image.fromarray(rasterizer.render_views(vertices, faces, size=size // 2, use_cache=False)).save(output_path)
+    return output_path
 
 def create_thumbnail(video_path, output_path=None):
     """
@@ -15,6 +147,8 @@ def create_thumbnail(video_path, output_path=None):
     Returns:
         PIL Image if output_path is None, otherwise None
     """
+    import cv2
+
     cap = cv2.VideoCapture(str(video_path))
     
     # Take the middle frame
@@ -41,13 +175,25 @@ def create_3d_preview(model_path, output_path=None):
     """
     Create a preview image of a 3D model
     
+    Meshes (STL, GLB, OBJ, PLY) are rendered headlessly from four sides with
+    the NumPy rasterizer; STEP files need PythonOCC.
+    
     Args:
-        model_path: Path to the 3D model file (STEP format)
+        model_path: Path to the 3D model file (STEP or mesh format)
         output_path: Path to save the preview image (if None, returns the image)
         
     Returns:
         PIL Image if output_path is None, otherwise None
     """
+    if Path(model_path).suffix.lower() in MESH_EXTENSIONS:
+        from .rasterizer import render_views
+
+        image = Image.fromarray(render_views(*load_mesh(model_path), size=400))
+        if output_path:
+            image.save(output_path)
+            return None
+        return image
+
     try:
         from OCC.Display.SimpleGui import init_display
         from OCC.Core.STEPControl import STEPControl_Reader
@@ -85,6 +231,8 @@ def create_3d_preview(model_path, output_path=None):
         return image
         
     except ImportError:
+        import matplotlib.pyplot as plt
+
         # If OCC is not available, create a dummy image
         fig = plt.figure(figsize=(8, 6))
         ax = fig.add_subplot(111)